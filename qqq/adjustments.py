@@ -0,0 +1,211 @@
+# Цены с поправкой на сплиты и дивиденды, посчитанные один раз и сохранённые в price_store рядом с исходными.
+# Запись <TICKER>/1d хранит бары как есть (close - цена поставщика), события (dividends - выплата на акцию
+# в день отсечки, splits - коэффициент сплита, 2.0 для 2:1) и производные ряды:
+#   - raw_close    - цена, по которой бумага реально торговалась в тот день (без поправки на последующие сплиты);
+#   - adj_close    - цена с обратной поправкой на сплиты и дивиденды (последнее значение равно последнему close);
+#   - total_return - индекс полной доходности: дивиденды реинвестируются по close дня отсечки (как в
+#                    develop/test_advince_dvd*.py), начинается с первого close.
+# Поправки считаются векторно: множитель события в день t действует на все дни раньше t, накопленный
+# множитель - обратное cumprod событий. yfinance отдаёт Close и Dividends уже с поправкой на сплиты
+# (splits_applied=True); для поставщиков с сырыми ценами - splits_applied=False.
+# Стратегии выбирают базу цены (--price_basis): close (как раньше - CSV кэш load_data), raw, adjusted, total_return.
+# Производные ряды пересчитываются при каждой записи новых баров по всей истории тикера, а не на каждом прогоне.
+#
+# python adjustments.py QLD TQQQ --start_date 2010-01-01 --end_date 2024-12-31
+# python adjustments.py TQQQ --csv TQQQ_2010-01-01_2024-12-31.csv --actions TQQQ_actions.csv
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from price_store import DEFAULT_ROOT, PriceStore, bars_from_frame
+
+INTERVAL = "1d"
+BASES = ("close", "raw", "adjusted", "total_return")
+BASIS_COLUMNS = {"close": "close", "raw": "raw_close", "adjusted": "adj_close", "total_return": "total_return"}
+ACTION_COLUMNS = ("dividends", "splits")
+SERIES_COLUMNS = ("raw_close", "adj_close", "total_return")
+
+
+def _after(events):
+    """Произведение множителей событий строго после каждого дня (1 для последнего дня)."""
+    return np.append(np.cumprod(events[::-1])[::-1][1:], 1.0)
+
+
+def adjustment_factors(close, dividends, splits):
+    """Накопленные множители обратной поправки на сплиты и на дивиденды (массивы длины close)."""
+    close = np.asarray(close, dtype=np.float64)
+    dividends = np.nan_to_num(np.asarray(dividends, dtype=np.float64), nan=0.0)
+    splits = np.asarray(splits, dtype=np.float64)
+    splits = np.where(np.isnan(splits) | (splits <= 0), 1.0, splits)
+    previous = np.append(np.nan, close[:-1])
+    # Дивиденд в день t уменьшает цены до t на долю dividend / close(t - 1)
+    dividend_events = np.where((dividends > 0) & (previous > 0), 1 - dividends / np.where(previous > 0, previous, 1.0), 1.0)
+    return _after(splits), _after(dividend_events)
+
+
+def adjusted_series(close, dividends, splits, splits_applied=True):
+    """Производные ряды {"raw_close", "adj_close", "total_return"} по барам тикера."""
+    close = np.asarray(close, dtype=np.float64)
+    dividends = np.nan_to_num(np.asarray(dividends, dtype=np.float64), nan=0.0)
+    split_factor, dividend_factor = adjustment_factors(close, dividends, splits)
+    if splits_applied:
+        split_adjusted, raw_close = close, close * split_factor
+    else:
+        # Сырые дивиденды переводятся в базу цен с поправкой на сплиты вместе с ценой
+        split_adjusted, raw_close = close / split_factor, close
+        dividends = dividends / split_factor
+    growth = np.ones(len(close))
+    if len(close) > 1:
+        growth[1:] = (split_adjusted[1:] + dividends[1:]) / split_adjusted[:-1]
+    total_return = split_adjusted[0] * np.cumprod(growth) if len(close) else growth
+    return {"raw_close": raw_close, "adj_close": split_adjusted * dividend_factor, "total_return": total_return}
+
+
+def actions_from_frame(frame):
+    """События из DataFrame yfinance/CSV: колонки Dividends и Stock Splits (или Splits) в любом регистре, 0 - нет события."""
+    if isinstance(frame.columns, pd.MultiIndex):
+        frame = frame.copy()
+        frame.columns = frame.columns.get_level_values(0)
+    columns = {column.lower(): column for column in frame.columns}
+    n_rows = len(frame)
+    dividends = frame[columns["dividends"]].to_numpy(dtype=np.float64) if "dividends" in columns else np.zeros(n_rows)
+    split_column = columns.get("stock splits", columns.get("splits"))
+    splits = frame[split_column].to_numpy(dtype=np.float64) if split_column else np.zeros(n_rows)
+    return {"dividends": np.nan_to_num(dividends, nan=0.0), "splits": np.nan_to_num(splits, nan=0.0)}
+
+
+def refresh(store, ticker, splits_applied=None):
+    """Пересчёт производных рядов по всей сохранённой истории тикера. Возвращает число строк."""
+    meta = store.meta(ticker, INTERVAL)
+    if splits_applied is None:
+        splits_applied = meta.get("splits_applied", True)
+    bars = {name: np.array(values) for name, values in store.load(ticker, INTERVAL).items()}
+    for name in ACTION_COLUMNS:
+        if name not in bars:
+            bars[name] = np.zeros(len(bars["time"]))
+    bars.update(adjusted_series(bars["close"], bars["dividends"], bars["splits"], splits_applied))
+    return store.write(ticker, INTERVAL, bars, replace=True, meta={"splits_applied": splits_applied})
+
+
+def ingest(store, ticker, frame, actions=None, splits_applied=True, coverage=None):
+    """Запись дневных баров и событий тикера (слияние с сохранёнными) и пересчёт производных рядов.
+
+    frame - бары (как для PriceStore.write); события берутся из actions (Date, Dividends, Stock Splits)
+    или из колонок самого frame. coverage - запрошенный диапазон дат [start, end], объединяется с прежним.
+    """
+    bars = bars_from_frame(frame)
+    source = frame if actions is None else actions
+    events = actions_from_frame(source)
+    if actions is not None:
+        # События по датам: дни событий без бара пропускаются
+        event_days = bars_from_frame(actions.assign(Close=0.0))["time"]
+        position = np.searchsorted(bars["time"], event_days)
+        found = (position < len(bars["time"])) & (bars["time"][np.minimum(position, len(bars["time"]) - 1)] == event_days)
+        for name in ACTION_COLUMNS:
+            values = np.zeros(len(bars["time"]))
+            values[position[found]] = events[name][found]
+            events[name] = values
+    bars.update(events)
+    meta = {"splits_applied": splits_applied}
+    if coverage is not None:
+        previous = store.meta(ticker, INTERVAL).get("coverage") if store.exists(ticker, INTERVAL) else None
+        start, end = (str(pd.Timestamp(day).date()) for day in coverage)
+        meta["coverage"] = [min(start, previous[0]), max(end, previous[1])] if previous else [start, end]
+    store.write(ticker, INTERVAL, bars, meta=meta)
+    return refresh(store, ticker, splits_applied)
+
+
+def download(store, ticker, start_date, end_date):
+    """Дневные бары и события yfinance (auto_adjust=False: Close с поправкой только на сплиты) в хранилище."""
+    import yfinance as yf
+
+    extended_end_date = pd.to_datetime(end_date) + pd.Timedelta(days=1)
+    data = yf.download(ticker, start=start_date, end=extended_end_date, actions=True, auto_adjust=False, progress=False)
+    if data is None or data.empty:
+        raise ValueError(f"No daily bars downloaded for {ticker}")
+    return ingest(store, ticker, data, coverage=(start_date, end_date))
+
+
+def covers(store, ticker, start_date, end_date):
+    if not store.exists(ticker, INTERVAL):
+        return False
+    meta = store.meta(ticker, INTERVAL)
+    coverage = meta.get("coverage")
+    if coverage is None or not all(name in meta.get("columns", ()) for name in SERIES_COLUMNS):
+        return False
+    return coverage[0] <= str(pd.Timestamp(start_date).date()) and str(pd.Timestamp(end_date).date()) <= coverage[1]
+
+
+def load_series(ticker, start_date, end_date, basis="adjusted", store=None):
+    """Цены тикера в формате load_data (Date, Close, Volume), Close - по выбранной базе.
+
+    Недостающий диапазон загружается (yfinance) и пересчитывается один раз; дальше ряды читаются из хранилища.
+    """
+    if basis not in BASES:
+        raise ValueError(f"Unknown price basis: {basis}")
+    store = store or PriceStore(DEFAULT_ROOT)
+    if not covers(store, ticker, start_date, end_date):
+        coverage = store.meta(ticker, INTERVAL).get("coverage") if store.exists(ticker, INTERVAL) else None
+        start = min(str(pd.Timestamp(start_date).date()), coverage[0]) if coverage else start_date
+        end = max(str(pd.Timestamp(end_date).date()), coverage[1]) if coverage else end_date
+        download(store, ticker, start, end)
+    bars = store.load(ticker, INTERVAL, start_date, end_date)
+    return pd.DataFrame({"Date": pd.to_datetime(np.asarray(bars["time"])),
+                         "Close": np.asarray(bars[BASIS_COLUMNS[basis]], dtype=np.float64),
+                         "Volume": np.asarray(bars["volume"], dtype=np.float64)})
+
+
+def add_arguments(parser):
+    parser.add_argument("--price_basis", type=str, default="close", choices=BASES,
+                        help="Price series: close (cached CSV as downloaded), raw (as traded), adjusted (splits and dividends), total_return")
+
+
+def summary(store, ticker):
+    bars = store.load(ticker, INTERVAL)
+    dividends = np.asarray(bars["dividends"])
+    splits = np.asarray(bars["splits"])
+    close = np.asarray(bars["close"])
+    return {
+        "rows": len(close),
+        "dividends": int((dividends > 0).sum()),
+        "splits": [(str(pd.Timestamp(day).date()), float(ratio)) for day, ratio in zip(bars["time"][splits > 0], splits[splits > 0])],
+        "price_return": close[-1] / close[0] - 1 if len(close) else 0.0,
+        "total_return": bars["total_return"][-1] / bars["total_return"][0] - 1 if len(close) else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute and store split- and dividend-adjusted daily series")
+    parser.add_argument("tickers", type=str, nargs="+", help="Tickers (e.g., QQQ QLD TQQQ)")
+    parser.add_argument("--start_date", type=str, help="Start date (YYYY-MM-DD) of the download (with --csv: of the range the file covers)")
+    parser.add_argument("--end_date", type=str, help="End date (YYYY-MM-DD) of the download (with --csv: of the range the file covers)")
+    parser.add_argument("--store", type=str, default=DEFAULT_ROOT, help="Price store directory")
+    parser.add_argument("--csv", type=str, help="Ingest daily prices from this CSV instead of downloading (one ticker)")
+    parser.add_argument("--actions", type=str, help="CSV with Date, Dividends and Stock Splits for --csv")
+    parser.add_argument("--raw_prices", action="store_true", help="--csv prices are not split-adjusted")
+    parser.add_argument("--refresh", action="store_true", help="Only recompute the adjusted series from the stored bars")
+    args = parser.parse_args()
+
+    store = PriceStore(args.store)
+    for ticker in args.tickers:
+        if args.refresh:
+            refresh(store, ticker)
+        elif args.csv:
+            frame = pd.read_csv(args.csv, parse_dates=['Date'])
+            actions = pd.read_csv(args.actions, parse_dates=['Date']) if args.actions else None
+            ingest(store, ticker, frame, actions, splits_applied=not args.raw_prices,
+                   coverage=(args.start_date or frame['Date'].min(), args.end_date or frame['Date'].max()))
+        else:
+            if not args.start_date or not args.end_date:
+                parser.error("--start_date and --end_date are required to download")
+            download(store, ticker, args.start_date, args.end_date)
+        info = summary(store, ticker)
+        splits = ", ".join(f"{day} x{ratio:g}" for day, ratio in info["splits"]) or "none"
+        print(f"{ticker}: {info['rows']} rows, dividends: {info['dividends']}, splits: {splits}, "
+              f"price return: {info['price_return'] * 100:.2f}%, total return: {info['total_return'] * 100:.2f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# Бенчмарки горячих путей бэктеста в стиле asv: функции time_<name>(fixture) и общий раннер.
+# Данные синтетические и детерминированные (1, 10, 30 лет; 1 и 50 тикеров), сеть не используется:
+# CSV кладутся во временный каталог под именами кэша investing.load_data.
+# Результаты дописываются в историю (JSON), запуск падает с кодом 1, если кейс стал медленнее
+# медианы прошлых запусков больше чем на --threshold.
+#
+# python benchmarks.py --years 1 10 --history benchmarks_history.json --threshold 0.20
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import numpy as np
+import pandas as pd
+
+import investing
+import trading_calendar
+from engine import simulate_tiered
+from panel import build_daily_frame, build_panel
+from sweep import dropdown_grid, run_sweep, write_results
+
+START_DATE = "2000-01-03"
+LEVERAGED = ("QLD", "TQQQ")
+
+
+def synthetic_tickers(n_tickers):
+    return ["QQQ"] + list(LEVERAGED) + [f"T{i:03d}" for i in range(max(n_tickers - 3, 0))]
+
+
+def write_fixtures(directory, years, n_tickers, seed=42):
+    """Детерминированные дневные цены на сессиях NYSE: индекс-случайное блуждание и 2x/3x производные от него."""
+    rng = np.random.default_rng(seed)
+    dates = trading_calendar.get_calendar().sessions_in_range(START_DATE, f"{trading_calendar.LAST_YEAR}-12-31")[:years * 252]
+    end_date = dates[-1].strftime('%Y-%m-%d')
+    base = rng.normal(0.0004, 0.013, len(dates))
+    for i, ticker in enumerate(synthetic_tickers(n_tickers)):
+        leverage = 2.0 if ticker == "QLD" else 3.0 if ticker == "TQQQ" else 1.0
+        returns = leverage * base if i < 3 else rng.normal(0.0003, 0.02, len(dates))
+        close = 100 * np.cumprod(1 + np.maximum(returns, -0.95))
+        path = os.path.join(directory, investing.cache_file_name(ticker, START_DATE, end_date))
+        pd.DataFrame({"Date": dates.strftime('%Y-%m-%d'), "Close": close}).to_csv(path, index=False)
+    return end_date
+
+
+def time_load_data(fixture):
+    for ticker in fixture["tickers"]:
+        investing.load_data(ticker, START_DATE, fixture["end_date"])
+
+
+def time_alignment(fixture):
+    build_daily_frame("QQQ", fixture["tickers"][1:], START_DATE, fixture["end_date"])
+
+
+def time_single_backtest(fixture):
+    investing.apply_test_strategy(fixture["data"], 1000, "QQQ", "QLD", "TQQQ", "QQQ", pd.Timestamp(fixture["end_date"]),
+                                  0.10, 0.20, START_DATE, 0.10)
+
+
+def time_batched_backtest(fixture):
+    run_sweep(fixture["panel"], 1000, [(0.10, 0.20, 0.10)])
+
+
+def time_batched_sweep(fixture):
+    run_sweep(fixture["panel"], 1000, fixture["grid"])
+
+
+def time_reporting(fixture):
+    scores, _ = fixture["sweep"]
+    write_results(os.path.join(fixture["directory"], "strategy_results.csv"), fixture["grid"], scores)
+
+
+def time_rendering(fixture):
+    import matplotlib.pyplot as plt
+
+    curves = fixture["curves"]
+    investing.plot_results(None, None, None, list(fixture["panel"]["dates"]), curves["portfolio_value"][:, 0].tolist(),
+                           curves["invested_amounts"][:, 0].tolist(), fixture["data"], "QQQ", "QLD", "TQQQ", True, False, 0.10, 0.20)
+    plt.close("all")
+
+
+# Кейс -> размеры, на которых он имеет смысл (Python-цикл apply_test_strategy и plot_results на 30 годах идут минуты)
+BENCHMARKS = {
+    "load_data": (time_load_data, {"years": (1, 10, 30), "tickers": (1, 50)}),
+    "alignment": (time_alignment, {"years": (1, 10, 30), "tickers": (3, 50)}),
+    "single_backtest": (time_single_backtest, {"years": (1, 10), "tickers": (3,)}),
+    "batched_backtest": (time_batched_backtest, {"years": (1, 10, 30), "tickers": (3,)}),
+    "batched_sweep": (time_batched_sweep, {"years": (1, 10, 30), "tickers": (3,)}),
+    "reporting": (time_reporting, {"years": (1,), "tickers": (3,)}),
+    "rendering": (time_rendering, {"years": (1,), "tickers": (3,)}),
+}
+
+
+def make_fixture(directory, years, n_tickers):
+    end_date = write_fixtures(directory, years, max(n_tickers, 3))
+    tickers = synthetic_tickers(n_tickers) if n_tickers > 1 else ["QQQ"]
+    panel = build_panel("QQQ", "QQQ", "QLD", "TQQQ", START_DATE, end_date)
+    grid = dropdown_grid(0.01, 0.50, 0.01)
+    return {
+        "directory": directory,
+        "end_date": end_date,
+        "tickers": tickers,
+        "data": investing.load_data("QQQ", START_DATE, end_date),
+        "panel": panel,
+        "grid": grid,
+        "sweep": run_sweep(panel, 1000, grid),
+        "curves": simulate_tiered(panel["index_close"], panel["closes"], 1000, 0.10, 0.20, 0.10),
+    }
+
+
+def run_case(fn, fixture, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(fixture)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def run_benchmarks(years_filter=None, names=None, repeat=3):
+    """Прогон кейсов во временном каталоге. Возвращает {"<case>[<years>y-<tickers>t]": секунды}."""
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            fixtures = {}
+            for name, (fn, params) in BENCHMARKS.items():
+                if names and name not in names:
+                    continue
+                for years in params["years"]:
+                    if years_filter and years not in years_filter:
+                        continue
+                    for n_tickers in params["tickers"]:
+                        key = (years, n_tickers)
+                        if key not in fixtures:
+                            fixtures[key] = make_fixture(directory, years, n_tickers)
+                        case = f"{name}[{years}y-{n_tickers}t]"
+                        results[case] = run_case(fn, fixtures[key], repeat)
+                        print(f"{case:<36} {results[case] * 1000:>10.2f} ms", flush=True)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def find_regressions(results, history, threshold, window=5):
+    """Кейсы, которые медленнее медианы последних window запусков больше чем на threshold."""
+    regressions = []
+    for case, seconds in results.items():
+        previous = [run["results"][case] for run in history[-window:] if case in run["results"]]
+        if previous:
+            baseline = statistics.median(previous)
+            if seconds > baseline * (1 + threshold):
+                regressions.append((case, baseline, seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the backtest hot paths")
+    parser.add_argument("--years", type=int, nargs="*", help="Only run fixtures of these lengths (1, 10, 30)")
+    parser.add_argument("--bench", type=str, nargs="*", choices=list(BENCHMARKS), help="Only run these benchmarks")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeats per case (minimum is reported)")
+    parser.add_argument("--history", type=str, default="benchmarks_history.json", help="JSON file with previous runs")
+    parser.add_argument("--threshold", type=float, default=0.20, help="Allowed slowdown against history (0.20 = 20%)")
+    parser.add_argument("--no_save", action="store_true", help="Do not append this run to the history")
+    args = parser.parse_args()
+
+    history_path = os.path.abspath(args.history)
+    results = run_benchmarks(args.years, args.bench, args.repeat)
+    history = load_history(history_path)
+    regressions = find_regressions(results, history, args.threshold)
+
+    if not args.no_save:
+        history.append({
+            "date": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "machine": platform.node(),
+            "results": results,
+        })
+        with open(history_path, 'w') as f:
+            json.dump(history, f, indent=1)
+
+    for case, baseline, seconds in regressions:
+        print(f"REGRESSION {case}: {baseline * 1000:.2f} ms -> {seconds * 1000:.2f} ms")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
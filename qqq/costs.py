@@ -0,0 +1,70 @@
+# Модель торговых издержек для engine.simulate_tiered.
+# - комиссия: per_share за бумагу, bps от суммы сделки и fixed за каждую сделку;
+# - спред: spread - полная ширина в долях цены, покупка идёт по close * (1 + spread / 2), продажа - по close * (1 - spread / 2);
+# - проскальзывание от объёма: impact * sqrt(объём заявки / дневной объём) в долях цены (если есть колонка Volume).
+# Все величины - скаляры или массивы (n_lanes,), поэтому модель применяется ко всем дорожкам сразу.
+# Модель хранится в панели (panel["costs"]), так что её видят sweep, walk_forward и optimizer без изменения сигнатур.
+
+import numpy as np
+
+ZERO_COSTS = {"per_share": 0.0, "bps": 0.0, "fixed": 0.0, "spread": 0.0, "impact": 0.0}
+
+
+def cost_model(per_share=0.0, bps=0.0, fixed=0.0, spread=0.0, impact=0.0):
+    return {"per_share": per_share, "bps": bps, "fixed": fixed, "spread": spread, "impact": impact}
+
+
+def is_free(costs):
+    return costs is None or all(not np.any(costs.get(key, 0.0)) for key in ZERO_COSTS)
+
+
+def slippage(costs, price, units, volume=None):
+    """Доля цены, на которую сделка хуже close: половина спреда плюс проскальзывание от объёма."""
+    fraction = np.asarray(costs["spread"], dtype=np.float64) / 2
+    if volume is not None and np.any(costs["impact"]):
+        participation = np.divide(units, volume, out=np.zeros(np.shape(units)), where=np.asarray(volume) > 0)
+        fraction = fraction + costs["impact"] * np.sqrt(participation)
+    return fraction
+
+
+def buy_units(costs, amount, price, volume=None):
+    """Сколько целых бумаг можно купить на amount с учётом издержек и сколько это стоит (units, total_cost).
+
+    Проскальзывание оценивается по объёму заявки без издержек (amount / price) - так формула остаётся явной.
+    """
+    price = np.asarray(price, dtype=np.float64)
+    estimate = np.floor(np.divide(amount, price, out=np.zeros(np.shape(amount)), where=price > 0))
+    execution = price * (1 + slippage(costs, price, estimate, volume))
+    unit_cost = execution * (1 + np.asarray(costs["bps"]) / 1e4) + costs["per_share"]
+    units = np.floor(np.divide(amount - costs["fixed"], unit_cost, out=np.zeros(np.shape(amount)), where=unit_cost > 0))
+    units = np.maximum(units, 0.0)
+    return units, units * unit_cost + np.where(units > 0, costs["fixed"], 0.0)
+
+
+def sell_proceeds(costs, units, price, volume=None):
+    """Чистая выручка от продажи units бумаг (массивы одной формы; несколько уровней - по первой оси)."""
+    price = np.asarray(price, dtype=np.float64)
+    execution = price * (1 - slippage(costs, price, units, volume))
+    gross = units * execution
+    return gross * (1 - np.asarray(costs["bps"]) / 1e4) - units * costs["per_share"] - np.where(units > 0, costs["fixed"], 0.0)
+
+
+def trade_cost(costs, units, price, volume=None):
+    """Издержки в долларах на сделки объёмом units (покупка или продажа, знак не важен) по цене price."""
+    units = np.abs(units)
+    price = np.asarray(price, dtype=np.float64)
+    rate = slippage(costs, price, units, volume) + np.asarray(costs["bps"]) / 1e4
+    return units * price * rate + units * costs["per_share"] + np.where(units > 0, costs["fixed"], 0.0)
+
+
+def add_arguments(parser):
+    parser.add_argument("--fee_per_share", type=float, default=0.0, help="Commission per share in dollars")
+    parser.add_argument("--fee_bps", type=float, default=0.0, help="Commission in basis points of the trade value")
+    parser.add_argument("--fee_fixed", type=float, default=0.0, help="Fixed commission per trade in dollars")
+    parser.add_argument("--spread", type=float, default=0.0, help="Bid-ask spread as a fraction of price (0.001 = 10 bps)")
+    parser.add_argument("--impact", type=float, default=0.0, help="Volume slippage coefficient: impact * sqrt(order / daily volume)")
+
+
+def from_args(args):
+    costs = cost_model(args.fee_per_share, args.fee_bps, args.fee_fixed, args.spread, args.impact)
+    return None if is_free(costs) else costs
@@ -3,9 +3,14 @@
 import yfinance as yf
 import pandas as pd
 from datetime import datetime, timedelta
+import argparse
 import os
 import json
 
+import quotes
+import state_store
+import trading_calendar
+
 # Функция для загрузки данных
 def load_data(ticker, start_date, end_date):
     data = yf.download(ticker, start=start_date, end=end_date)
@@ -13,27 +18,33 @@ def load_data(ticker, start_date, end_date):
         raise ValueError(f"No data available for {ticker}.")
     return data
 
-# Функция для получения текущей цены
-def get_current_price(ticker):
-    stock = yf.Ticker(ticker)
-    try:
-        # Пытаемся получить текущую цену
-        current_price = stock.history(period="1d", interval="1m")["Close"].iloc[-1]
-    except:
-        # Если рынок закрыт, берем цену закрытия последнего бара
-        current_price = stock.history(period="1d")["Close"].iloc[-1]
-    return current_price
-
-# Функция для загрузки/сохранения состояния
-def load_state(filename="strategy_state.json"):
-    if os.path.exists(filename):
-        with open(filename, 'r') as f:
-            return json.load(f)
-    return {"max_price": 0.0, "last_action": None}
-
-def save_state(state, filename="strategy_state.json"):
-    with open(filename, 'w') as f:
-        json.dump(state, f)
+# Функция для получения текущей цены (через кэш котировок, повторный запуск в течение минуты сеть не трогает)
+def get_current_price(ticker, ttl=60.0):
+    prices = quotes.get_prices([ticker], ttl=ttl)
+    if ticker not in prices:
+        raise ValueError(f"No current price available for {ticker}.")
+    return prices[ticker]
+
+# Хранилище состояния (SQLite); старые JSON-файлы состояния переносятся при первом запуске
+def open_state_store(db_file="strategy_state.db"):
+    conn = state_store.open_store(db_file)
+    state_store.import_json_state(conn, "strategy_state.json", "default")
+    state_store.import_json_state(conn, "batch_state.json")
+    return conn
+
+# Рекомендации по текущей цене индекса и максимуму
+def recommend(current_price, max_price, ticker_1, ticker_2, ticker_3, dropdown_1, dropdown_2, last_action):
+    recommendations = []
+    if current_price >= max_price * (1 - dropdown_1):
+        recommendations.append(f"Покупка {ticker_1} по цене ${current_price:.2f}")
+    elif current_price >= max_price * (1 - dropdown_2) and current_price < max_price * (1 - dropdown_1):
+        recommendations.append(f"Покупка {ticker_2} по цене ${current_price:.2f}")
+        if last_action != "sold":
+            recommendations.append(f"Продажа {ticker_1} если не проданы")
+    else:  # current_price < max_price * (1 - dropdown_2)
+        recommendations.append(f"Покупка {ticker_3} по цене ${current_price:.2f}")
+    action = "buy" if recommendations[0].startswith("Покупка") else "sold" if "Продажа" in recommendations else last_action
+    return recommendations, action
 
 # Основная логика стратегии
 def apply_strategy():
@@ -42,34 +53,24 @@ def apply_strategy():
     ticker_2 = "QLD"  # Тикер для 10-20% просадки
     ticker_3 = "TQQQ" # Тикер для >20% просадки
     index = "QQQ"     # Базовый тикер для просадки
-    start_date = "2020-01-01"  # Начальная дата для данных
-    end_date = datetime.now().strftime("%Y-%m-%d")
     dropdown_1 = 0.10  # 10% просадка
     dropdown_2 = 0.20  # 20% просадка
 
     # Загрузка данных
-    data = load_data(index, start_date, end_date)
     current_price = get_current_price(index)
 
     # Загрузка состояния
-    state = load_state()
+    conn = open_state_store()
+    state = state_store.get_state(conn, "default")
     max_price = max(state["max_price"], current_price)  # Обновляем максимум
-    state["max_price"] = max_price
 
     # Логика стратегии
-    recommendations = []
-    if current_price >= max_price * (1 - dropdown_1):
-        recommendations.append(f"Покупка {ticker_1} (QQQ) по цене ${current_price:.2f}")
-    elif current_price >= max_price * (1 - dropdown_2) and current_price < max_price * (1 - dropdown_1):
-        recommendations.append(f"Покупка {ticker_2} (QLD) по цене ${current_price:.2f}")
-        if state["last_action"] != "sold":
-            recommendations.append(f"Продажа {ticker_1} (QQQ) если не проданы")
-    else:  # current_price < max_price * (1 - dropdown_2)
-        recommendations.append(f"Покупка {ticker_3} (TQQQ) по цене ${current_price:.2f}")
+    recommendations, last_action = recommend(current_price, max_price, ticker_1, ticker_2, ticker_3, dropdown_1, dropdown_2, state["last_action"])
 
     # Сохранение состояния
-    state["last_action"] = "buy" if recommendations[0].startswith("Покупка") else "sold" if "Продажа" in recommendations else state["last_action"]
-    save_state(state)
+    state_store.update_states(conn, [{"strategy_id": "default", "max_price": max_price, "last_action": last_action,
+                                      "price": current_price, "recommendations": recommendations}])
+    conn.close()
 
     # Вывод рекомендаций
     print(f"Текущая дата: {datetime.now().strftime('%Y-%m-%d')}")
@@ -79,8 +80,106 @@ def apply_strategy():
     for rec in recommendations:
         print(f"- {rec}")
 
+# Цены закрытия (Date x ticker) из ответа yf.download для одного или нескольких тикеров
+def close_frame(data, tickers):
+    if data is None or data.empty:
+        return pd.DataFrame(columns=tickers)
+    if isinstance(data.columns, pd.MultiIndex):
+        close = data["Close"]
+    else:
+        close = data[["Close"]].rename(columns={"Close": tickers[0]})
+    return close.reindex(columns=tickers)
+
+# Текущие цены всех тикеров: промахи кэша котировок запрашиваются пачками, не больше workers запросов одновременно
+def fetch_current_prices(tickers, workers=8, ttl=60.0):
+    return quotes.get_prices(tickers, ttl=ttl, max_concurrency=workers)
+
+# Инкрементальный кэш исторического максимума: догружаются только дни после последней сохранённой даты
+def update_max_cache(tickers, start_date, cache_file="max_price_cache.json"):
+    cache = {}
+    if os.path.exists(cache_file):
+        with open(cache_file, 'r') as f:
+            cache = json.load(f)
+
+    today = datetime.now().strftime("%Y-%m-%d")
+    # Последняя полная сессия - предыдущая сессия биржи (с учётом праздников); тикеры с ней в кэше не перезапрашиваются
+    last_session = trading_calendar.get_calendar().previous_session(today, inclusive=False).strftime("%Y-%m-%d")
+    stale = [ticker for ticker in dict.fromkeys(tickers) if cache.get(ticker, {}).get("last_date", "") < last_session]
+    if stale:
+        fetch_from = min(
+            (pd.to_datetime(cache[ticker]["last_date"]) + timedelta(days=1)).strftime("%Y-%m-%d") if ticker in cache else start_date
+            for ticker in stale
+        )
+        history = close_frame(yf.download(stale, start=fetch_from, end=today, progress=False, threads=True), stale)
+        for ticker in stale:
+            entry = cache.get(ticker, {"max_price": 0.0, "last_date": ""})
+            closes = history[ticker].dropna()
+            if not closes.empty:
+                closes = closes[closes.index.strftime("%Y-%m-%d") > entry["last_date"]]
+            if not closes.empty:
+                entry["max_price"] = max(entry["max_price"], float(closes.max()))
+                entry["last_date"] = closes.index[-1].strftime("%Y-%m-%d")
+            cache[ticker] = entry
+        # Временный файл + os.replace: сбой посередине записи не портит кэш максимумов
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, cache_file)
+    return {ticker: cache[ticker]["max_price"] for ticker in tickers}
+
+# Пакетный режим: много стратегий из конфигурации, все цены одним запросом
+def apply_batch(config_file, db_file="strategy_state.db", output_file="recommendations.json"):
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+    strategies = config["strategies"]
+    start_date = config.get("start_date", "2020-01-01")
+
+    indexes = [strategy["index"] for strategy in strategies]
+    current_prices = fetch_current_prices(indexes, config.get("workers", 8), config.get("quote_ttl", 60.0))
+    history_max = update_max_cache(indexes, start_date)
+
+    strategy_ids = [strategy.get("id", f"{strategy['index']}:{strategy['ticker_1']}/{strategy['ticker_2']}/{strategy['ticker_3']}")
+                    for strategy in strategies]
+    conn = open_state_store(db_file)
+    states = state_store.get_states(conn, strategy_ids)
+    updates = []
+    results = []
+    for strategy_id, strategy in zip(strategy_ids, strategies):
+        index = strategy["index"]
+        if index not in current_prices:
+            print(f"Нет цены для {index}, стратегия {strategy_id} пропущена")
+            continue
+        current_price = current_prices[index]
+        state = states[strategy_id]
+        max_price = max(state["max_price"], history_max.get(index, 0.0), current_price)
+        recommendations, last_action = recommend(current_price, max_price, strategy["ticker_1"], strategy["ticker_2"], strategy["ticker_3"],
+                                                 strategy.get("dropdown_1", 0.10), strategy.get("dropdown_2", 0.20), state["last_action"])
+        updates.append({"strategy_id": strategy_id, "max_price": max_price, "last_action": last_action,
+                        "price": current_price, "recommendations": recommendations})
+        results.append({"id": strategy_id, "index": index, "current_price": current_price, "max_price": max_price,
+                        "recommendations": recommendations})
+
+    # Все стратегии обновляются одной транзакцией
+    state_store.update_states(conn, updates)
+    conn.close()
+    with open(output_file, 'w') as f:
+        json.dump({"date": datetime.now().strftime('%Y-%m-%d %H:%M'), "results": results}, f, ensure_ascii=False, indent=2)
+
+    print(f"Текущая дата: {datetime.now().strftime('%Y-%m-%d')}")
+    for result in results:
+        print(f"{result['id']}: {result['index']} ${result['current_price']:.2f}, максимум ${result['max_price']:.2f}")
+        for rec in result["recommendations"]:
+            print(f"- {rec}")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Daily strategy signals")
+    parser.add_argument("--batch", type=str, help="JSON config with many strategies (see strategies.example.json)")
+    parser.add_argument("--output", type=str, default="recommendations.json", help="File for batch recommendations")
+    args = parser.parse_args()
     try:
-        apply_strategy()
+        if args.batch:
+            apply_batch(args.batch, output_file=args.output)
+        else:
+            apply_strategy()
     except Exception as e:
         print(f"Произошла ошибка: {e}")
\ No newline at end of file
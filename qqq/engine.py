@@ -0,0 +1,299 @@
+# Пакетный (векторизованный) движок тестируемой стратегии.
+# Повторяет правила apply_test_strategy из investing.py, но считает сразу много "дорожек":
+# каждая дорожка - это свой ценовой путь и/или свой набор параметров (dropdown_1, dropdown_2, sell_threshold).
+# Цикл идёт только по неделям, все операции внутри недели - над массивами длиной n_lanes.
+#
+# Формы входных данных (ось времени первая, чтобы срез по неделе был непрерывным):
+#   index_close: (n_steps,) или (n_steps, n_lanes) - цена индекса для расчёта просадки;
+#   tier_closes: (3, n_steps) или (3, n_steps, n_lanes) - цены ticker_1, ticker_2, ticker_3
+#                (NaN или 0 означает, что инструмент недоступен, как в investing.py).
+# Параметры - скаляры или массивы (n_lanes,). sell_threshold=None/0/NaN отключает продажу.
+# ledger - необязательный ledger.LotLedger: покупки и продажи дополнительно учитываются по лотам.
+# costs - необязательная модель издержек (costs.cost_model), volumes - дневные объёмы в форме tier_closes
+# для проскальзывания от объёма. Без издержек цикл остаётся прежним: сделки по close без комиссий.
+# stream - необязательный streaming.CurveStream: строки кривых уходят в кольцевой буфер фиксированного размера
+# (метрики на лету, колоночный файл), память не растёт с числом шагов.
+# precision="compact" - компактный режим для больших пакетов: цены, доли и кривые во float32, остаток cash
+# дополнительно отдаётся в целых центах (см. precision.py - границы погрешности и сверка с float64).
+# fx - необязательный курс валюты пополнения (долларов за единицу валюты, (n_steps,) или (n_steps, n_lanes), см. fx.py):
+# weekly_investment задан в этой валюте, сделки и cash - в долларах, а взносы, вложения, стоимость портфеля и просадка -
+# в валюте пополнения.
+
+import numpy as np
+
+import costs as cost_models
+
+N_TIERS = 3
+# Кривые стоимости позиций по уровням (в валюте портфеля): result[...] и колонки CurveStream
+TIER_VALUE_KEYS = tuple(f"value_tier_{k + 1}" for k in range(N_TIERS))
+PRECISIONS = ("float64", "compact")
+
+
+def _lane_param(value, n_lanes):
+    if value is None:
+        return np.zeros(n_lanes)
+    arr = np.broadcast_to(np.asarray(value, dtype=np.float64), (n_lanes,))
+    return np.nan_to_num(arr, nan=0.0)
+
+
+def count_lanes(index_close, tier_closes, *params):
+    """Количество дорожек после broadcast цен и параметров."""
+    shapes = [np.shape(index_close)[1:], np.shape(tier_closes)[2:]]
+    shapes += [np.shape(p) for p in params if p is not None]
+    shape = np.broadcast_shapes(*shapes)
+    return int(shape[0]) if shape else 1
+
+
+def tier_choice(close, max_price, dropdown_1, dropdown_2, tier_2_close, tier_3_close):
+    """Выбор инструмента для покупки: 0 - ticker_1, 1 - ticker_2, 2 - ticker_3, -1 - покупки нет."""
+    return np.where(close >= max_price * (1 - dropdown_1), 0,
+                    np.where((close >= max_price * (1 - dropdown_2)) & (tier_2_close > 0), 1,
+                             np.where(tier_3_close > 0, 2, -1)))
+
+
+def initial_state(n_lanes, max_price=0.0):
+    """Начальное состояние стратегии; max_price можно засеять историческим максимумом индекса."""
+    return {
+        "cash": np.zeros(n_lanes),
+        "total_invested": np.zeros(n_lanes),
+        "max_price": np.broadcast_to(np.asarray(max_price, dtype=np.float64), (n_lanes,)).copy(),
+        "sell_price": np.zeros(n_lanes),
+        "prev_close": np.full(n_lanes, np.nan),
+        "has_sold": np.zeros(n_lanes, dtype=bool),
+        "units": np.zeros((N_TIERS, n_lanes)),
+        "last_max_portfolio": np.zeros(n_lanes),
+        "max_drawdown": np.zeros(n_lanes),
+        "n_sells": np.zeros(n_lanes, dtype=np.int64),
+        "costs_paid": np.zeros(n_lanes),
+    }
+
+
+def simulate_tiered(index_close, tier_closes, weekly_investment, dropdown_1, dropdown_2, sell_threshold=None, record_curves=True, state=None, ledger=None,
+                    costs=None, volumes=None, stream=None, precision="float64", fx=None):
+    """Прогон тестируемой стратегии по всем дорожкам. Возвращает словарь с итогами и (опционально) кривыми.
+
+    state - состояние из предыдущего вызова (result["state"]) или initial_state(): прогон продолжается
+    с того места, где остановился, без повторного расчёта префикса.
+    ledger - LotLedger на n_lanes дорожек; при продолжении прогона (state) передаётся тот же ledger,
+    шаги в нём сквозные (ledger.n_steps).
+    costs/volumes - издержки сделок; покупки и продажи идут по цене с учётом спреда и проскальзывания,
+    комиссии списываются из cash, сумма издержек - в result["costs_paid"].
+    stream - CurveStream на n_lanes дорожек; кривые пишутся в него на каждом шаге (обычно с record_curves=False),
+    при продолжении прогона передаётся тот же stream, закрывает его вызывающий (stream.close() -> метрики).
+    precision="compact" - цены, доли и кривые во float32; арифметика сделок и cash (векторы длины n_lanes)
+    остаются во float64, поэтому прогон совпадает с float64 на ценах, округлённых до float32.
+    Остаток cash - также в целых центах (result["cash_cents"]).
+    fx - курс валюты пополнения к доллару по шагам: бюджет шага в долларах и обратный курс считаются одним
+    векторным проходом до цикла. total_invested, final_value, max_drawdown и кривые - в валюте пополнения,
+    cash_balance, costs_paid и лоты ledger - в долларах.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision}")
+    compact = precision == "compact"
+    dtype = np.float32 if compact else np.float64
+    index_close = np.asarray(index_close, dtype=dtype)
+    tier_closes = np.asarray(tier_closes, dtype=dtype)
+    if index_close.ndim == 1:
+        index_close = index_close[:, None]
+    if tier_closes.ndim == 2:
+        tier_closes = tier_closes[:, :, None]
+    n_steps = index_close.shape[0]
+    n_lanes = count_lanes(index_close, tier_closes, weekly_investment, dropdown_1, dropdown_2, sell_threshold)
+
+    # Недоступные инструменты (NaN) считаем по цене 0, как в investing.py
+    tier_closes = np.where(np.isnan(tier_closes) | (tier_closes <= 0), 0.0, tier_closes)
+    priced = not cost_models.is_free(costs)
+    if priced and volumes is not None:
+        volumes = np.asarray(volumes, dtype=np.float64)
+        if volumes.ndim == 2:
+            volumes = volumes[:, :, None]
+        volumes = np.nan_to_num(volumes, nan=0.0)
+    else:
+        volumes = None
+
+    weekly = _lane_param(weekly_investment, n_lanes)
+    d1 = _lane_param(dropdown_1, n_lanes)
+    d2 = _lane_param(dropdown_2, n_lanes)
+    st = _lane_param(sell_threshold, n_lanes)
+    sell_enabled = st > 0
+    if fx is not None:
+        fx = np.asarray(fx, dtype=np.float64)
+        fx = np.broadcast_to(fx[:, None] if fx.ndim == 1 else fx, (n_steps, n_lanes))
+        budgets = weekly * fx
+        to_home = 1.0 / fx
+
+    if state is None:
+        state = initial_state(n_lanes)
+    cash = state["cash"].copy()
+    invested = state["total_invested"].copy()
+    max_price = state["max_price"].copy()
+    sell_price = state["sell_price"].copy()
+    prev_close = state["prev_close"].copy()
+    has_sold = state["has_sold"].copy()
+    units = state["units"].astype(dtype)
+    last_max_portfolio = state["last_max_portfolio"].copy()
+    max_drawdown = state["max_drawdown"].copy()
+    n_sells = state["n_sells"].copy()
+    costs_paid = state["costs_paid"].copy() if "costs_paid" in state else np.zeros(n_lanes)
+
+    if record_curves:
+        portfolio_curve = np.empty((n_steps, n_lanes), dtype=dtype)
+        invested_curve = np.empty((n_steps, n_lanes), dtype=dtype)
+        contributions = np.empty((n_steps, n_lanes), dtype=dtype)
+        tier_curve = np.empty((n_steps, n_lanes), dtype=np.int8)
+        value_curve = np.empty((N_TIERS, n_steps, n_lanes), dtype=dtype)
+
+    lanes = np.arange(n_lanes)
+    for t in range(n_steps):
+        close = np.broadcast_to(index_close[t], (n_lanes,))
+        px = np.broadcast_to(tier_closes[:, t], (N_TIERS, n_lanes))
+        vol = np.broadcast_to(volumes[:, t], (N_TIERS, n_lanes)) if volumes is not None else None
+        max_price = np.maximum(max_price, close)
+
+        # Продажа всех позиций при достижении sell_threshold
+        sell = sell_enabled & ~has_sold & (close <= max_price * (1 - st))
+        if sell.any():
+            if priced:
+                net = np.where((units > 0) & (px > 0), cost_models.sell_proceeds(costs, units, px, vol), 0.0)
+                proceeds = net.sum(axis=0)
+                costs_paid += np.where(sell, np.multiply(units, px, dtype=np.float64).sum(axis=0) - proceeds, 0.0)
+                exit_price = np.divide(net, units, out=np.zeros_like(net), where=units > 0)
+            else:
+                proceeds = np.multiply(units, px, dtype=np.float64).sum(axis=0)
+                exit_price = px
+            if ledger is not None:
+                ledger.close_all(ledger.n_steps + t, sell, exit_price)
+            cash = np.where(sell, cash + proceeds, cash)
+            units[:, sell] = 0.0
+            has_sold |= sell
+            sell_price = np.where(sell, close, sell_price)
+            n_sells += sell
+
+        # Выкуп ticker_1 после возврата цены к уровню продажи
+        rebuy = has_sold & (cash > 0) & (prev_close < sell_price) & (close >= sell_price) & (px[0] > 0)
+        if rebuy.any():
+            if priced:
+                rebuy_units, spent = cost_models.buy_units(costs, np.where(rebuy, cash, 0.0), px[0], vol[0] if vol is not None else None)
+                costs_paid += spent - rebuy_units * px[0]
+                rebuy_price = np.divide(spent, rebuy_units, out=np.zeros(n_lanes), where=rebuy_units > 0)
+            else:
+                rebuy_units = np.floor(np.divide(cash, px[0], out=np.zeros(n_lanes), where=rebuy))
+                spent = rebuy_units * px[0]
+                rebuy_price = px[0]
+            bought = rebuy & (rebuy_units > 0)
+            units[0] += np.where(bought, rebuy_units, 0.0)
+            if ledger is not None:
+                ledger.buy(ledger.n_steps + t, np.where(bought, 0, -1), rebuy_units, rebuy_price)
+            cash = cash - np.where(bought, spent, 0.0)
+            has_sold &= ~bought
+
+        # Пополнение cash до суммы, кратной минимальной цене, и покупка
+        min_price = np.where(px > 0, px, np.inf).min(axis=0)
+        min_price = np.where(np.isfinite(min_price), min_price, 1.0)
+        budget = weekly if fx is None else budgets[t]
+        required = np.floor(budget / min_price) * min_price
+        added = np.maximum(required - cash, 0.0)
+        cash += added
+        amount = np.minimum(cash, budget)
+        if fx is not None:
+            added = added * to_home[t]
+        invested += added
+
+        tier = tier_choice(close, max_price, d1, d2, px[1], px[2])
+        tier = np.where(amount > 0, tier, -1)
+        price = px[np.maximum(tier, 0), lanes]
+        if priced:
+            buy_units, spent = cost_models.buy_units(costs, np.where((tier >= 0) & (price > 0), amount, 0.0), price,
+                                                     vol[np.maximum(tier, 0), lanes] if vol is not None else None)
+            costs_paid += spent - buy_units * price
+            lot_price = np.divide(spent, buy_units, out=np.zeros(n_lanes), where=buy_units > 0)
+        else:
+            buy_units = np.floor(np.divide(amount, price, out=np.zeros(n_lanes), where=(tier >= 0) & (price > 0)))
+            spent = buy_units * price
+            lot_price = price
+        units[np.maximum(tier, 0), lanes] += buy_units
+        if ledger is not None:
+            ledger.buy(ledger.n_steps + t, tier, buy_units, lot_price)
+        cash -= spent
+
+        held = np.multiply(units, px, dtype=np.float64)
+        portfolio = held.sum(axis=0) + cash
+        if fx is not None:
+            portfolio = portfolio * to_home[t]
+            held = held * to_home[t]
+        peak = np.maximum(last_max_portfolio, portfolio)
+        drawdown = np.divide(peak - portfolio, peak, out=np.zeros(n_lanes), where=peak > 0) * 100
+        max_drawdown = np.maximum(max_drawdown, drawdown)
+        last_max_portfolio = peak
+
+        has_sold &= ~(close >= max_price)
+        prev_close = close
+
+        if record_curves:
+            portfolio_curve[t] = portfolio
+            invested_curve[t] = invested
+            contributions[t] = added
+            tier_curve[t] = tier
+            value_curve[:, t] = held
+        if stream is not None:
+            stream.push(portfolio_value=portfolio, invested_amounts=invested, contributions=added, tiers=tier,
+                        **dict(zip(TIER_VALUE_KEYS, held)))
+
+    final_state = {
+        "cash": cash, "total_invested": invested, "max_price": max_price, "sell_price": sell_price,
+        "prev_close": prev_close, "has_sold": has_sold, "units": units,
+        "last_max_portfolio": last_max_portfolio, "max_drawdown": max_drawdown, "n_sells": n_sells,
+        "costs_paid": costs_paid,
+    }
+    final_value = np.multiply(units, np.broadcast_to(tier_closes[:, -1], (N_TIERS, n_lanes)), dtype=np.float64).sum(axis=0) + cash if n_steps else cash
+    if fx is not None and n_steps:
+        final_value = final_value * to_home[-1]
+    result = {
+        "n_lanes": n_lanes,
+        "state": final_state,
+        "total_invested": invested,
+        "final_value": final_value,
+        "cash_balance": cash,
+        "units": units,
+        "max_drawdown": max_drawdown,
+        "n_sells": n_sells,
+        "costs_paid": costs_paid,
+    }
+    if compact:
+        result["cash_cents"] = np.rint(cash * 100).astype(np.int64)
+    if ledger is not None:
+        ledger.n_steps += n_steps
+        result["realized_gain"] = ledger.realized_total.copy()
+        result["unrealized_gain"] = ledger.unrealized(np.broadcast_to(tier_closes[:, -1], (N_TIERS, n_lanes))) if n_steps else np.zeros(n_lanes)
+    if record_curves:
+        result.update(portfolio_value=portfolio_curve, invested_amounts=invested_curve,
+                      contributions=contributions, tiers=tier_curve, **dict(zip(TIER_VALUE_KEYS, value_curve)))
+    return result
+
+
+def roi(final_value, total_invested):
+    """ROI по массивам дорожек (доля, не проценты)."""
+    return np.divide(final_value - total_invested, total_invested,
+                     out=np.zeros(np.shape(final_value)), where=np.asarray(total_invested) > 0)
+
+
+def irr(contributions, final_value, periods_per_year=52, low=-0.99, high=10.0, iterations=60):
+    """Годовая IRR для каждой дорожки методом бисекции.
+
+    contributions: (n_steps, n_lanes) - взносы на каждом шаге, final_value: (n_lanes,).
+    Ищем r, при котором будущая стоимость взносов равна итоговой стоимости портфеля.
+    """
+    contributions = np.asarray(contributions, dtype=np.float64)
+    n_steps = contributions.shape[0]
+    years_left = (n_steps - 1 - np.arange(n_steps))[:, None] / periods_per_year
+    n_lanes = contributions.shape[1]
+    lo = np.full(n_lanes, low)
+    hi = np.full(n_lanes, high)
+    for _ in range(iterations):
+        mid = (lo + hi) / 2
+        future = (contributions * np.exp(np.log1p(mid)[None, :] * years_left)).sum(axis=0)
+        too_high = future > final_value
+        hi = np.where(too_high, mid, hi)
+        lo = np.where(too_high, lo, mid)
+    result = (lo + hi) / 2
+    return np.where(contributions.sum(axis=0) > 0, result, np.nan)
@@ -0,0 +1,131 @@
+# Курсы валюты пополнения к доллару для портфелей, которые пополняются не в USD (EUR, RUB и т.п.).
+# Курс - долларов за единицу валюты: тикер yfinance <CUR>USD=X (EURUSD=X ~ 1.08, RUBUSD=X ~ 0.011).
+# Дневные курсы загружаются один раз и хранятся в price_store (<CUR>USD=X/1d, покрытие дат - "coverage" в meta.json),
+# затем panel.build_panel(currency=...) выравнивает их по датам панели: берётся последний известный курс не позже даты
+# (у рынка валют свои выходные), до первого курса - первый курс.
+# engine.simulate_tiered(fx=panel["fx"]) переводит взнос в доллары по курсу шага, сделки идут в долларах, а взносы,
+# вложения, стоимость портфеля и просадка считаются в валюте пополнения - стратегии сравниваются в домашней валюте.
+#
+# python fx.py EUR RUB --start_date 2010-01-01 --end_date 2024-12-31
+# python fx.py EUR --csv EURUSD.csv
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from price_store import DEFAULT_ROOT, PriceStore, bars_from_frame
+
+BASE_CURRENCY = "USD"
+INTERVAL = "1d"
+# Запас дней до начала периода, чтобы первая дата панели получила курс не позже себя
+LOOKBACK_DAYS = 7
+
+
+def is_base(currency):
+    return currency is None or currency.upper() == BASE_CURRENCY
+
+
+def fx_ticker(currency):
+    return f"{currency.upper()}{BASE_CURRENCY}=X"
+
+
+def _day(value):
+    return str(pd.Timestamp(value).date())
+
+
+def ingest(store, currency, frame, coverage=None):
+    """Запись дневных курсов (Date/индекс и Close) в хранилище со слиянием; coverage - запрошенный диапазон [start, end]."""
+    ticker = fx_ticker(currency)
+    frame = frame.copy()
+    if isinstance(frame.index, pd.DatetimeIndex) and frame.index.tz is not None:
+        # Дневные курсы - календарные даты: таймзона поставщика отбрасывается, а не переводится в биржевую
+        frame.index = frame.index.tz_localize(None).normalize()
+    meta = {}
+    if coverage is not None:
+        previous = store.meta(ticker, INTERVAL).get("coverage") if store.exists(ticker, INTERVAL) else None
+        start, end = (_day(day) for day in coverage)
+        meta["coverage"] = [min(start, previous[0]), max(end, previous[1])] if previous else [start, end]
+    return store.write(ticker, INTERVAL, bars_from_frame(frame), meta=meta)
+
+
+def download(store, currency, start_date, end_date):
+    """Дневные курсы yfinance в хранилище."""
+    import yfinance as yf
+
+    extended_end_date = pd.to_datetime(end_date) + pd.Timedelta(days=1)
+    data = yf.download(fx_ticker(currency), start=start_date, end=extended_end_date, auto_adjust=False, progress=False)
+    if data is None or data.empty:
+        raise ValueError(f"No FX rates downloaded for {currency}")
+    return ingest(store, currency, data, coverage=(start_date, end_date))
+
+
+def covers(store, currency, start_date, end_date):
+    ticker = fx_ticker(currency)
+    if not store.exists(ticker, INTERVAL):
+        return False
+    coverage = store.meta(ticker, INTERVAL).get("coverage")
+    return coverage is not None and coverage[0] <= _day(start_date) and _day(end_date) <= coverage[1]
+
+
+def load_rates(currency, start_date, end_date, store=None):
+    """Курсы валюты (Date, Rate - долларов за единицу) за [start_date - LOOKBACK_DAYS, end_date].
+
+    Недостающий диапазон загружается один раз, дальше курсы читаются из хранилища.
+    """
+    store = store or PriceStore(DEFAULT_ROOT)
+    start_date = pd.Timestamp(start_date) - pd.Timedelta(days=LOOKBACK_DAYS)
+    if not covers(store, currency, start_date, end_date):
+        ticker = fx_ticker(currency)
+        coverage = store.meta(ticker, INTERVAL).get("coverage") if store.exists(ticker, INTERVAL) else None
+        start = min(_day(start_date), coverage[0]) if coverage else _day(start_date)
+        end = max(_day(end_date), coverage[1]) if coverage else _day(end_date)
+        download(store, currency, start, end)
+    bars = store.load(fx_ticker(currency), INTERVAL, start_date, end_date)
+    rates = pd.DataFrame({"Date": pd.to_datetime(np.asarray(bars["time"])), "Rate": np.asarray(bars["close"], dtype=np.float64)})
+    return rates[np.isfinite(rates["Rate"]) & (rates["Rate"] > 0)].reset_index(drop=True)
+
+
+def align(dates, rates):
+    """Курс на каждую дату: последний курс не позже даты, до первого курса - первый курс. Возвращает массив float64."""
+    if len(rates) == 0:
+        raise ValueError("No FX rates to align")
+    times = pd.to_datetime(rates["Date"]).to_numpy()
+    positions = np.searchsorted(times, pd.to_datetime(np.asarray(dates)).to_numpy(), side='right') - 1
+    return rates["Rate"].to_numpy(dtype=np.float64)[np.maximum(positions, 0)]
+
+
+def add_arguments(parser):
+    parser.add_argument("--currency", type=str, default=BASE_CURRENCY,
+                        help="Currency of the weekly investment (e.g., EUR, RUB); results are reported in it, FX rates are cached in the price store")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download and cache daily FX rates of contribution currencies against USD")
+    parser.add_argument("currencies", type=str, nargs="+", help="Currencies (e.g., EUR RUB)")
+    parser.add_argument("--start_date", type=str, help="Start date (YYYY-MM-DD) of the download (with --csv: of the range the file covers)")
+    parser.add_argument("--end_date", type=str, help="End date (YYYY-MM-DD) of the download (with --csv: of the range the file covers)")
+    parser.add_argument("--store", type=str, default=DEFAULT_ROOT, help="Price store directory")
+    parser.add_argument("--csv", type=str, help="Ingest rates (Date, Close in USD per unit) from this CSV instead of downloading (one currency)")
+    args = parser.parse_args()
+
+    store = PriceStore(args.store)
+    for currency in args.currencies:
+        if is_base(currency):
+            parser.error(f"{BASE_CURRENCY} needs no FX rates")
+        if args.csv:
+            frame = pd.read_csv(args.csv, parse_dates=['Date'])
+            ingest(store, currency, frame, coverage=(args.start_date or frame['Date'].min(), args.end_date or frame['Date'].max()))
+        else:
+            if not args.start_date or not args.end_date:
+                parser.error("--start_date and --end_date are required to download")
+            download(store, currency, args.start_date, args.end_date)
+        bars = store.load(fx_ticker(currency), INTERVAL)
+        close = np.asarray(bars["close"])
+        coverage = store.meta(fx_ticker(currency), INTERVAL).get("coverage")
+        print(f"{currency}: {len(close)} rates, coverage: {coverage[0]}..{coverage[1]}, "
+              f"first: {close[0]:.6f}, last: {close[-1]:.6f} {BASE_CURRENCY} per {currency.upper()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+# Проверка и починка кэшированных цен: CSV кэша load_data (<TICKER>_<start>_<end>.csv) и бары price_store.
+# Проверки векторные, за один проход по столбцам Date/Close:
+#   ошибки (чинятся --repair):
+#     - unsorted     - даты идут не по возрастанию;
+#     - duplicates   - повторяющиеся даты (метки времени);
+#     - missing      - пустая цена закрытия (NaN);
+#     - non_positive - цена <= 0;
+#   предупреждения (только отчёт):
+#     - gaps         - сессии биржи (trading_calendar) между первой и последней датой без единой строки;
+#     - off_calendar - строки в дни, когда биржа закрыта;
+#     - jumps        - |log(close_t / close_{t-1})| > jump: возможный сплит или битая цена (сплиты - отдельная задача).
+# Починка: сортировка по дате, из повторов остаётся первая строка (как drop_duplicates в align_to_sessions),
+# строки с NaN и ценой <= 0 удаляются. CSV переписывается атомарно (investing.save_data), бары - PriceStore.write(replace=True).
+# Изменённый файл меняет размер и mtime, поэтому result_cache сам выбрасывает посчитанные на нём результаты.
+#
+# Состояние проверки (integrity.json): для каждого файла - размер и mtime, sha256 содержимого, статус и счётчики.
+# Файл с тем же размером и mtime не перечитывается; если изменился только mtime, а sha256 прежний -
+# результат проверки переиспользуется. Поэтому чистые файлы проверяются один раз, пока не изменятся.
+#
+# python integrity.py                                   # все CSV кэша в текущем каталоге
+# python integrity.py QQQ_2015-01-01_2024-12-31.csv --repair
+# python integrity.py --store price_store --jump 0.3
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import trading_calendar
+
+DEFAULT_STATE = "integrity.json"
+JUMP_THRESHOLD = 0.5
+CACHE_PATTERN = "*_[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]_[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9].csv"
+ERRORS = ("unsorted", "duplicates", "missing", "non_positive")
+WARNINGS = ("gaps", "off_calendar", "jumps")
+N_EXAMPLES = 5
+STATE_VERSION = 1
+
+
+def _examples(dates):
+    timestamps = [pd.Timestamp(day) for day in dates[:N_EXAMPLES]]
+    return [str(stamp.date()) if stamp == stamp.normalize() else str(stamp) for stamp in timestamps]
+
+
+def validate(dates, close, jump=JUMP_THRESHOLD, calendar=None, gaps=True):
+    """Проверка ряда цен. Возвращает {"rows", "first", "last", "counts": {проверка: число}, "examples": {проверка: даты}}.
+
+    gaps=False - не искать пропущенные сессии (недельные и месячные бары).
+    """
+    dates = pd.DatetimeIndex(dates).values.astype("datetime64[ns]")
+    close = np.asarray(close, dtype=np.float64)
+    calendar = calendar or trading_calendar.get_calendar()
+    counts = {}
+    examples = {}
+
+    backwards = np.flatnonzero(dates[1:] < dates[:-1]) + 1
+    counts["unsorted"], examples["unsorted"] = len(backwards), _examples(dates[backwards])
+    order = np.argsort(dates, kind='stable')
+    ordered = dates[order]
+    repeated = np.flatnonzero(ordered[1:] == ordered[:-1]) + 1
+    counts["duplicates"], examples["duplicates"] = len(repeated), _examples(ordered[repeated])
+    missing = np.isnan(close)
+    counts["missing"], examples["missing"] = int(missing.sum()), _examples(dates[missing])
+    non_positive = close <= 0
+    counts["non_positive"], examples["non_positive"] = int(non_positive.sum()), _examples(dates[non_positive])
+
+    # Скачки - между соседними (по времени) корректными ценами
+    prices = close[order]
+    valid = prices > 0
+    log_returns = np.abs(np.diff(np.log(prices[valid])))
+    jumped = np.flatnonzero(log_returns > jump) + 1
+    counts["jumps"], examples["jumps"] = len(jumped), _examples(ordered[valid][jumped])
+
+    # Календарь: дни с данными против сессий биржи (для внутридневных баров - дни, в которые есть хоть один бар)
+    days = np.unique(ordered.astype("datetime64[D]"))
+    days = days[(days >= calendar.first_day) & (days <= calendar.last_day)]
+    if len(days):
+        off_calendar = days[~calendar.is_trading_day(days)]
+        sessions = calendar.sessions_in_range(days[0], days[-1]).values.astype("datetime64[D]")
+        missed = sessions[~np.isin(sessions, days)] if gaps else days[:0]
+    else:
+        off_calendar = missed = days
+    counts["off_calendar"], examples["off_calendar"] = len(off_calendar), _examples(off_calendar)
+    counts["gaps"], examples["gaps"] = len(missed), _examples(missed)
+
+    return {
+        "rows": len(dates),
+        "first": str(pd.Timestamp(ordered[0])) if len(dates) else None,
+        "last": str(pd.Timestamp(ordered[-1])) if len(dates) else None,
+        "counts": {name: int(counts[name]) for name in ERRORS + WARNINGS},
+        "examples": {name: examples[name] for name in ERRORS + WARNINGS if counts[name]},
+    }
+
+
+def status(report):
+    """clean, warnings (только предупреждения) или errors."""
+    if any(report["counts"][name] for name in ERRORS):
+        return "errors"
+    if any(report["counts"][name] for name in WARNINGS):
+        return "warnings"
+    return "clean"
+
+
+def repair_mask(dates, close):
+    """Порядок строк после починки: отсортированные даты, первая из повторов, без NaN и цен <= 0."""
+    dates = pd.DatetimeIndex(dates).values.astype("datetime64[ns]")
+    close = np.asarray(close, dtype=np.float64)
+    order = np.argsort(dates, kind='stable')
+    ordered = dates[order]
+    first = np.append(True, ordered[1:] != ordered[:-1])
+    return order[first & (close[order] > 0)]
+
+
+# --- Источники: CSV кэша и бары price_store ------------------------------------------------------------
+
+
+class CsvSource:
+    def __init__(self, path):
+        self.path = path
+        self.key = os.path.abspath(path)
+        self.files = [path]
+        self.gaps = True
+
+    def read(self):
+        data = pd.read_csv(self.path)
+        data['Date'] = pd.to_datetime(data['Date'])
+        return data["Date"], data["Close"]
+
+    def repair(self):
+        from investing import save_data
+
+        data = pd.read_csv(self.path)
+        data['Date'] = pd.to_datetime(data['Date'])
+        keep = repair_mask(data["Date"], data["Close"])
+        save_data(data.iloc[keep], self.path)
+        return len(data) - len(keep)
+
+
+class StoreSource:
+    def __init__(self, store, ticker, interval):
+        self.store = store
+        self.ticker = ticker
+        self.interval = interval
+        directory = store.path(ticker, interval)
+        self.key = os.path.abspath(directory)
+        self.files = [os.path.join(directory, f"{name}.npy") for name in ("time",) + store.columns(ticker, interval)]
+        self.files.append(os.path.join(directory, "meta.json"))
+        self.path = directory
+        # У недельных и месячных баров нет строки на каждую сессию
+        self.gaps = not interval.endswith(("wk", "mo", "5d"))
+
+    def read(self):
+        bars = self.store.load(self.ticker, self.interval)
+        return bars["time"], bars["close"]
+
+    def repair(self):
+        bars = self.store.load(self.ticker, self.interval)
+        keep = repair_mask(bars["time"], bars["close"])
+        repaired = {name: np.asarray(values)[keep] for name, values in bars.items()}
+        self.store.write(self.ticker, self.interval, repaired, replace=True)
+        return len(bars["time"]) - len(keep)
+
+
+def cache_sources(paths=None, directory="."):
+    """Источники для CSV кэша: переданные пути или все файлы кэша в каталоге."""
+    if not paths:
+        paths = sorted(glob.glob(os.path.join(glob.escape(directory), CACHE_PATTERN)))
+    return [CsvSource(path) for path in paths]
+
+
+def store_sources(store, intervals=None):
+    sources = []
+    for ticker in store.tickers():
+        ticker_dir = os.path.join(store.root, ticker)
+        for interval in sorted(os.listdir(ticker_dir)):
+            if (intervals is None or interval in intervals) and store.exists(ticker, interval):
+                sources.append(StoreSource(store, ticker, interval))
+    return sources
+
+
+def signature(files):
+    """[размер, mtime_ns] каждого файла источника (None для отсутствующих)."""
+    result = []
+    for path in files:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            result.append([stat.st_size, stat.st_mtime_ns])
+        else:
+            result.append(None)
+    return result
+
+
+def checksum(files):
+    digest = hashlib.sha256()
+    for path in files:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+# --- Состояние проверок ---------------------------------------------------------------------------------
+
+
+class IntegrityState:
+    """Результаты проверок по файлам в JSON; запись атомарная (временный файл + os.replace)."""
+
+    def __init__(self, path=DEFAULT_STATE):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    saved = json.load(f)
+                if saved.get("version") == STATE_VERSION:
+                    self.entries = saved["files"]
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_file = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({"version": STATE_VERSION, "files": self.entries}, f, indent=1)
+        os.replace(tmp_file, self.path)
+
+    def check(self, source, jump=JUMP_THRESHOLD, rescan=False):
+        """Результат проверки источника и как он получен: "cached" (файл не менялся), "checksum" (sha256 прежний) или "scanned"."""
+        current = signature(source.files)
+        entry = self.entries.get(source.key)
+        same_options = entry is not None and entry.get("jump") == jump
+        if not rescan and same_options and entry["signature"] == current:
+            return entry, "cached"
+        digest = checksum(source.files)
+        if not rescan and same_options and entry["sha256"] == digest:
+            entry["signature"] = current
+            return entry, "checksum"
+        dates, close = source.read()
+        report = validate(dates, close, jump, gaps=source.gaps)
+        entry = {**report, "status": status(report), "jump": jump, "sha256": digest, "signature": current,
+                 "checked": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        self.entries[source.key] = entry
+        return entry, "scanned"
+
+
+def run(sources, state, jump=JUMP_THRESHOLD, repair=False, rescan=False):
+    """Проверка (и починка) источников. Возвращает [(источник, запись состояния, как получена, удалено строк)]."""
+    results = []
+    for source in sources:
+        entry, how = state.check(source, jump, rescan)
+        removed = 0
+        if repair and entry["status"] == "errors":
+            removed = source.repair()
+            entry, how = state.check(source, jump)
+        results.append((source, entry, how, removed))
+    state.save()
+    return results
+
+
+def print_results(results):
+    for source, entry, how, removed in results:
+        counts = ", ".join(f"{name}: {entry['counts'][name]}" for name in ERRORS + WARNINGS if entry["counts"][name])
+        line = f"{source.path}: {entry['status']} ({entry['rows']} rows, {how}"
+        line += f", repaired: {removed} rows removed" if removed else ""
+        print(line + ")" + (f" - {counts}" if counts else ""))
+        for name, dates in entry.get("examples", {}).items():
+            print(f"    {name}: {', '.join(dates)}")
+    scanned = sum(how == "scanned" for _, _, how, _ in results)
+    statuses = [entry["status"] for _, entry, _, _ in results]
+    print(f"Files: {len(results)}, scanned: {scanned}, skipped: {len(results) - scanned}, clean: {statuses.count('clean')}, "
+          f"warnings: {statuses.count('warnings')}, errors: {statuses.count('errors')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate (and repair) cached price files")
+    parser.add_argument("files", type=str, nargs="*", help="Cached CSV files (default: all price cache files in the current directory, none with --store)")
+    parser.add_argument("--store", type=str, help="Also check bars of this price store directory")
+    parser.add_argument("--interval", type=str, action="append", help="Price store intervals to check (repeatable, default: all)")
+    parser.add_argument("--state", type=str, default=DEFAULT_STATE, help="File with checksums and validation results")
+    parser.add_argument("--jump", type=float, default=JUMP_THRESHOLD, help="Flag bar-to-bar moves with |log return| above this")
+    parser.add_argument("--repair", action="store_true", help="Sort, drop duplicate dates and rows with missing or non-positive prices")
+    parser.add_argument("--rescan", action="store_true", help="Validate every file again even if it has not changed")
+    args = parser.parse_args()
+
+    sources = cache_sources(args.files) if args.files or not args.store else []
+    if args.store:
+        from price_store import PriceStore
+
+        sources += store_sources(PriceStore(args.store), args.interval)
+    results = run(sources, IntegrityState(args.state), args.jump, args.repair, args.rescan)
+    print_results(results)
+    sys.exit(1 if any(entry["status"] == "errors" for _, entry, _, _ in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+# Бэктест тестируемой стратегии на внутридневных барах (1m, 5m, 60m, ...) из price_store.
+# Правила те же, что в engine.simulate_tiered, но продажа по sell_threshold, выкуп и сброс флага продажи
+# проверяются на каждом баре, а пополнение и покупка идут на последнем баре дня расписания (--schedule).
+#
+# Конвейер событийный и векторный: между событиями состояние портфеля постоянно, поэтому бары
+# обрабатываются окнами (не больше chunk баров) - бегущий максимум индекса, поиск первого бара
+# с условием продажи/выкупа и стоимость портфеля для просадки считаются массивами над окном.
+# Python-цикл идёт только по событиям (пополнения и сделки), а не по миллионам баров; колонки
+# читаются из отображённых в память файлов хранилища по мере движения окна.
+#
+# Цена исполнения (--fill): close - закрытие бара сигнала; next_open - открытие следующего бара;
+# mid - (high + low) / 2; worst - покупки по high, продажи по low.
+# Сигнал (--trigger): close - по закрытиям баров, как в дневном движке; extreme - максимум по high,
+# продажа при low ниже порога, выкуп и сброс продажи по high.
+#
+# python intraday.py 1000 --start_date 2024-01-01 --end_date 2024-12-31 --ticker_1 QQQ --ticker_2 QLD --ticker_3 TQQQ --index QQQ --dropdown_1 0.10 --dropdown_2 0.20 --sell_threshold 0.05 --interval 60m --fill next_open
+
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import costs as cost_models
+import schedules
+from engine import N_TIERS, tier_choice
+from price_store import DEFAULT_ROOT, PriceStore
+
+FILLS = ("close", "next_open", "mid", "worst")
+TRIGGERS = ("close", "extreme")
+DEFAULT_CHUNK = 1 << 16
+
+
+def contribution_bars(time, rule=schedules.DEFAULT_RULE, end=None, roll=None):
+    """Позиции баров пополнения: последний бар каждого дня расписания (дни - сессии, в которых есть бары)."""
+    days = np.asarray(time).astype("datetime64[ns]").astype("datetime64[D]")
+    if not len(days):
+        return np.zeros(0, dtype=np.int64)
+    last_bar = np.append(np.flatnonzero(days[1:] != days[:-1]), len(days) - 1)
+    sessions = days[last_bar].astype("datetime64[ns]")
+    return last_bar[schedules.positions(sessions, rule, end=end, roll=roll)]
+
+
+def _aligned(tier_bars, time, field):
+    """Поле бара инструмента на метки time (последний бар не позже метки; до первого бара - 0)."""
+    position = np.searchsorted(tier_bars["time"], time, side='right') - 1
+    values = np.asarray(tier_bars[field])[np.maximum(position, 0)]
+    values = np.where((position >= 0) & np.isfinite(values) & (values > 0), values, 0.0)
+    return values
+
+
+class _Window:
+    """Окно баров [begin, end) с ценами уровней, выровненными на бары индекса."""
+
+    def __init__(self, index_bars, tier_bars, begin, end, trigger):
+        self.begin, self.end = begin, end
+        self.time = np.asarray(index_bars["time"][begin:end])
+        close = np.asarray(index_bars["close"][begin:end], dtype=np.float64)
+        self.close = close
+        self.peak_source = np.asarray(index_bars["high"][begin:end]) if trigger == "extreme" else close
+        self.down_source = np.asarray(index_bars["low"][begin:end]) if trigger == "extreme" else close
+        self.tier_bars = tier_bars
+        self.px = np.stack([_aligned(bars, self.time, "close") for bars in tier_bars])
+
+    def field(self, tier, field, j):
+        return _aligned(self.tier_bars[tier], self.time[j:j + 1], field)[0]
+
+
+def simulate_intraday(index_bars, tier_bars, weekly_investment, dropdown_1, dropdown_2, sell_threshold=None,
+                      contributions=None, fill="close", trigger="close", costs=None, chunk=DEFAULT_CHUNK):
+    """Прогон на барах: index_bars и tier_bars (3 словаря колонок price_store) на одной оси времени индекса.
+
+    contributions - позиции баров пополнения (contribution_bars). Возвращает итоги в формате engine
+    (скаляры), кривые на барах пополнения и журнал сделок.
+    """
+    if fill not in FILLS or trigger not in TRIGGERS:
+        raise ValueError(f"Unknown fill or trigger rule: {fill}, {trigger}")
+    n_bars = len(index_bars["time"])
+    contributions = np.asarray(contributions if contributions is not None else contribution_bars(index_bars["time"]))
+    is_contribution = np.zeros(n_bars, dtype=bool)
+    is_contribution[contributions] = True
+    st = sell_threshold if sell_threshold and sell_threshold > 0 else 0.0
+    priced = not cost_models.is_free(costs)
+
+    cash = invested = costs_paid = 0.0
+    units = np.zeros(N_TIERS)
+    max_price = sell_price = last_max_portfolio = max_drawdown = 0.0
+    prev_close = np.nan
+    has_sold = False
+    n_sells = 0
+    dates, portfolio_curve, invested_curve, trades = [], [], [], []
+
+    def execution(window, j, tier, side):
+        """Цена исполнения сделки уровня tier по правилу fill на баре j окна."""
+        if fill == "close":
+            return window.px[tier, j]
+        if fill == "next_open":
+            if window.begin + j + 1 >= n_bars:
+                return window.px[tier, j]
+            following = np.asarray(index_bars["time"][window.begin + j + 1:window.begin + j + 2])
+            price = _aligned(tier_bars[tier], following, "open")[0]
+            return price if price > 0 else window.px[tier, j]
+        if fill == "mid":
+            return (window.field(tier, "high", j) + window.field(tier, "low", j)) / 2
+        return window.field(tier, "high" if side == "buy" else "low", j)
+
+    def volume(window, tier, j):
+        return window.field(tier, "volume", j) if priced else None
+
+    begin = 0
+    while begin < n_bars:
+        # Окно заканчивается на баре пополнения или через chunk баров
+        end = min(begin + chunk, n_bars)
+        window = _Window(index_bars, tier_bars, begin, end, trigger)
+        peak = np.maximum.accumulate(np.maximum(window.peak_source, max_price))
+        previous_close = np.concatenate([[prev_close], window.close[:-1]])
+        flagged = is_contribution[begin:end]
+        position = 0
+        while position < end - begin:
+            # Первый бар, на котором что-то может измениться при текущем состоянии
+            rest = slice(position, end - begin)
+            if has_sold:
+                event = window.peak_source[rest] >= peak[rest]
+                if cash > 0:
+                    event |= (previous_close[rest] < sell_price) & (window.peak_source[rest] >= sell_price) & (window.px[0, rest] > 0)
+            elif st > 0:
+                event = window.down_source[rest] <= peak[rest] * (1 - st)
+            else:
+                event = np.zeros(end - begin - position, dtype=bool)
+            event |= flagged[rest]
+            hits = np.flatnonzero(event)
+            j = position + hits[0] if len(hits) else end - begin
+
+            # Бары без событий: состояние постоянно, меняется только стоимость портфеля
+            if j > position:
+                values = units @ window.px[:, position:j] + cash
+                span_peak = np.maximum.accumulate(np.maximum(values, last_max_portfolio))
+                drawdown = np.divide(span_peak - values, span_peak, out=np.zeros_like(values), where=span_peak > 0) * 100
+                max_drawdown = max(max_drawdown, drawdown.max())
+                last_max_portfolio = span_peak[-1]
+            if j >= end - begin:
+                break
+
+            max_price = peak[j]
+            close = window.close[j]
+            px = window.px[:, j]
+            time = pd.Timestamp(window.time[j])
+
+            # Продажа всех позиций при достижении sell_threshold
+            if st > 0 and not has_sold and window.down_source[j] <= max_price * (1 - st):
+                proceeds = 0.0
+                for tier in np.flatnonzero((units > 0) & (px > 0)):
+                    price = execution(window, j, tier, "sell")
+                    if priced:
+                        net = float(cost_models.sell_proceeds(costs, units[tier], price, volume(window, tier, j)))
+                        costs_paid += units[tier] * price - net
+                    else:
+                        net = units[tier] * price
+                    proceeds += net
+                    trades.append({"time": time, "action": "sell", "tier": int(tier), "units": units[tier], "price": price})
+                cash += proceeds
+                units[:] = 0.0
+                has_sold = True
+                sell_price = close if trigger == "close" else max_price * (1 - st)
+                n_sells += 1
+
+            # Выкуп ticker_1 после возврата цены к уровню продажи
+            if has_sold and cash > 0 and previous_close[j] < sell_price and window.peak_source[j] >= sell_price and px[0] > 0:
+                price = execution(window, j, 0, "buy")
+                if priced:
+                    bought, spent = cost_models.buy_units(costs, cash, price, volume(window, 0, j))
+                    bought, spent = float(bought), float(spent)
+                    costs_paid += spent - bought * price
+                else:
+                    bought = np.floor(cash / price)
+                    spent = bought * price
+                if bought > 0:
+                    units[0] += bought
+                    cash -= spent
+                    has_sold = False
+                    trades.append({"time": time, "action": "rebuy", "tier": 0, "units": bought, "price": price})
+
+            # Пополнение cash до суммы, кратной минимальной цене, и покупка
+            if flagged[j]:
+                available = px[px > 0]
+                min_price = available.min() if len(available) else 1.0
+                added = max(np.floor(weekly_investment / min_price) * min_price - cash, 0.0)
+                cash += added
+                invested += added
+                amount = min(cash, weekly_investment)
+                tier = int(tier_choice(close, max_price, dropdown_1, dropdown_2, px[1], px[2])) if amount > 0 else -1
+                if tier >= 0 and px[tier] > 0:
+                    price = execution(window, j, tier, "buy")
+                    if priced:
+                        bought, spent = cost_models.buy_units(costs, amount, price, volume(window, tier, j))
+                        bought, spent = float(bought), float(spent)
+                        costs_paid += spent - bought * price
+                    else:
+                        bought = np.floor(amount / price) if price > 0 else 0.0
+                        spent = bought * price
+                    units[tier] += bought
+                    cash -= spent
+                    if bought > 0:
+                        trades.append({"time": time, "action": "buy", "tier": tier, "units": bought, "price": price})
+
+            portfolio = float(units @ px) + cash
+            last_max_portfolio = max(last_max_portfolio, portfolio)
+            if last_max_portfolio > 0:
+                max_drawdown = max(max_drawdown, (last_max_portfolio - portfolio) / last_max_portfolio * 100)
+            if flagged[j]:
+                dates.append(time)
+                portfolio_curve.append(portfolio)
+                invested_curve.append(invested)
+            if has_sold and window.peak_source[j] >= max_price:
+                has_sold = False
+            position = j + 1
+
+        max_price = peak[-1]
+        prev_close = window.close[-1]
+        begin = end
+
+    last_px = np.array([_aligned(bars, np.asarray(index_bars["time"][-1:]), "close")[0] for bars in tier_bars]) if n_bars else np.zeros(N_TIERS)
+    return {
+        "total_invested": invested,
+        "final_value": float(units @ last_px) + cash,
+        "cash_balance": cash,
+        "units": units,
+        "max_drawdown": max_drawdown,
+        "n_sells": n_sells,
+        "costs_paid": costs_paid,
+        "n_bars": n_bars,
+        "dates": dates,
+        "portfolio_value": portfolio_curve,
+        "invested_amounts": invested_curve,
+        "trades": trades,
+    }
+
+
+def load_bars(store, index, ticker_2, ticker_3, interval, start_date, end_date):
+    """Бары индекса и трёх уровней из хранилища; ticker_1 торгуется по цене индекса, как в apply_test_strategy."""
+    index_bars = store.load(index, interval, start_date, end_date)
+    return index_bars, [index_bars, store.load(ticker_2, interval, start_date, end_date), store.load(ticker_3, interval, start_date, end_date)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the dropdown strategy on intraday bars from the price store")
+    parser.add_argument("weekly_investment", type=float, help="Investment per schedule date in dollars")
+    parser.add_argument("--start_date", type=str, required=True, help="Start date (YYYY-MM-DD)")
+    parser.add_argument("--end_date", type=str, default=datetime.now().strftime("%Y-%m-%d"), help="End date (YYYY-MM-DD)")
+    parser.add_argument("--ticker_1", type=str, required=True, help="Main ticker (e.g., QQQ)")
+    parser.add_argument("--ticker_2", type=str, required=True, help="Ticker for 10% dropdown (e.g., QLD)")
+    parser.add_argument("--ticker_3", type=str, help="Ticker for 20% dropdown (e.g., TQQQ)")
+    parser.add_argument("--index", type=str, required=True, help="Base ticker for drawdown (e.g., QQQ)")
+    parser.add_argument("--dropdown_1", type=float, required=True, help="First drawdown level (e.g., 0.10)")
+    parser.add_argument("--dropdown_2", type=float, required=True, help="Second drawdown level (e.g., 0.20)")
+    parser.add_argument("--sell_threshold", type=float, help="Threshold for selling all assets, checked on every bar")
+    parser.add_argument("--interval", type=str, default="1m", help="Bar interval in the store (1m, 5m, 60m, ...)")
+    parser.add_argument("--store", type=str, default=DEFAULT_ROOT, help="Price store directory")
+    parser.add_argument("--download", action="store_true", help="Download the bars with yfinance into the store first")
+    parser.add_argument("--fill", choices=FILLS, default="close", help="Bar price used to fill orders")
+    parser.add_argument("--trigger", choices=TRIGGERS, default="close", help="Bar prices used for drawdown triggers")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="Bars per vectorized window")
+    cost_models.add_arguments(parser)
+    schedules.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.ticker_3 is None:
+        args.ticker_3 = args.ticker_2
+
+    store = PriceStore(args.store)
+    if args.download:
+        for ticker in dict.fromkeys([args.index, args.ticker_2, args.ticker_3]):
+            store.download(ticker, args.interval, args.start_date, pd.Timestamp(args.end_date) + pd.Timedelta(days=1))
+    index_bars, tier_bars = load_bars(store, args.index, args.ticker_2, args.ticker_3, args.interval, args.start_date, args.end_date)
+    contributions = contribution_bars(index_bars["time"], args.schedule, pd.Timestamp(args.end_date), args.roll)
+    result = simulate_intraday(index_bars, tier_bars, args.weekly_investment, args.dropdown_1, args.dropdown_2, args.sell_threshold,
+                               contributions, args.fill, args.trigger, cost_models.from_args(args), args.chunk)
+
+    invested, final_value = result["total_invested"], result["final_value"]
+    print(f"=== Intraday Test Strategy ({args.interval}, {result['n_bars']} bars, fill={args.fill}, trigger={args.trigger}) ===")
+    print(f"Total Invested: ${invested:.2f}")
+    print(f"Final Portfolio Value: ${final_value:.2f}")
+    print(f"Profit: ${final_value - invested:.2f}")
+    print(f"Max Drawdown: {result['max_drawdown']:.2f}%")
+    print(f"ROI: {(final_value - invested) / invested * 100 if invested > 0 else 0:.2f}%")
+    print(f"Sells: {result['n_sells']}, Trades: {len(result['trades'])}, Costs: ${result['costs_paid']:.2f}")
+    for ticker, count in zip((args.ticker_1, args.ticker_2, args.ticker_3), result["units"]):
+        print(f"Shares of {ticker}: {count:.2f}")
+    print(f"Remaining Cash Balance: ${result['cash_balance']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
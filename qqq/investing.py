@@ -12,12 +12,20 @@
 # Необязательные параметры:
 # --sell_threshold: Порог продажи активов (например, 0.10 для 10% просадки).
 # --skip_simple: Пропустить выполнение простой стратегии (флаг).
+# --metrics: Метрики риска тестовой стратегии (Sharpe, Sortino, Calmar, ulcer index, время в просадке, экспозиция по уровням).
+# --backend: Ядро стратегии для --metrics (auto, numba, numpy, python; см. kernels.py).
+# --lots: Учёт по лотам: реализованная прибыль по годам и открытые лоты (продажи стратегии всегда полные, см. ledger.py).
 # --skip_graf: Пропустить отображение графика (флаг).
+# --price_basis: База цены: close (CSV кэш, по умолчанию), raw, adjusted (сплиты и дивиденды), total_return; см. adjustments.py.
+# --schedule: Расписание пополнений (W-FRI, 2W-MON, M-15, M-START, M-END, D; по умолчанию W-FRI), --roll: backward/forward.
+# --result_cache: Каталог кэша результатов (по умолчанию result_cache), --cache_entries: размер кэша, --no_cache: всегда пересчитывать.
 
 # python investing.py 1000 --start_date 2015-01-01 --end_date 2024-12-31 --ticker_1 QQQ --ticker_2 QLD --ticker_3 TQQQ --index QQQ --dropdown_1 0.10 --dropdown_2 0.20 --sell_threshold 0.10 --skip_graf --skip_simple 
 
 import argparse
+import io
 import os
+import threading
 import yfinance as yf
 import pandas as pd
 import numpy as np
@@ -25,27 +33,69 @@ import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 import math
 
-def load_data(ticker, start_date, end_date):
-    cache_file = f"{ticker}_{start_date}_{end_date}.csv"
+import adjustments
+import profiling
+import result_cache
+import schedules
+import trading_calendar
+
+def cache_file_name(ticker, start_date, end_date):
+    # Даты нормализуются, чтобы str и Timestamp давали один и тот же файл кэша
+    return f"{ticker}_{pd.Timestamp(start_date):%Y-%m-%d}_{pd.Timestamp(end_date):%Y-%m-%d}.csv"
+
+def download_data(ticker, start_date, end_date):
+    """Дневные цены yfinance в формате кэша: Date, Close (и Volume, если есть)."""
+    extended_end_date = pd.to_datetime(end_date) + pd.Timedelta(days=1)
+    with profiling.phase("download"):
+        data = yf.download(ticker, start=start_date, end=extended_end_date)
+    data = data.reset_index()
+    if 'Date' not in data.columns:
+        raise ValueError(f"No 'Date' column found in the downloaded data for {ticker}.")
+
+    data.columns = [col if isinstance(col, str) else col[0] + "_" + col[1] if col[1] else col[0] for col in data.columns]
+    # Volume сохраняется для модели проскальзывания (costs.py); старые файлы кэша без него тоже читаются
+    columns = {f"Close_{ticker}": "Close", f"Volume_{ticker}": "Volume"}
+    return data[["Date"] + [column for column in columns if column in data.columns]].rename(columns=columns)
+
+def save_data(data, cache_file, verify=None):
+    """Запись CSV кэша через временный файл и os.replace: сбой посередине не оставляет недописанный кэш.
+
+    verify(tmp_file) - необязательная проверка записанного файла до переименования (исключение отменяет запись).
+    """
+    tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        data.to_csv(tmp_file, index=False)
+        if verify is not None:
+            verify(tmp_file)
+        os.replace(tmp_file, cache_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+def load_data(ticker, start_date, end_date, basis="close"):
+    # Другие базы цены (сплиты, дивиденды) считаются один раз и хранятся в price_store - см. adjustments.py
+    if basis != "close":
+        return adjustments.load_series(ticker, start_date, end_date, basis)
+    cache_file = cache_file_name(ticker, start_date, end_date)
     
     if os.path.exists(cache_file):
-        data = pd.read_csv(cache_file)
-        data['Date'] = pd.to_datetime(data['Date'])
+        with profiling.phase("csv_parse"):
+            data = pd.read_csv(cache_file)
+            data['Date'] = pd.to_datetime(data['Date'])
     else:
-        extended_end_date = pd.to_datetime(end_date) + pd.Timedelta(days=1)
-        data = yf.download(ticker, start=start_date, end=extended_end_date)
-        data = data.reset_index()
-        if 'Date' not in data.columns:
-            raise ValueError(f"No 'Date' column found in the downloaded data for {ticker}.")
-        
-        data.columns = [col if isinstance(col, str) else col[0] + "_" + col[1] if col[1] else col[0] for col in data.columns]
-        data = data[["Date", f"Close_{ticker}"]].rename(columns={f"Close_{ticker}": "Close"})
-        data.to_csv(cache_file, index=False)
+        data = download_data(ticker, start_date, end_date)
+        save_data(data, cache_file)
     return data
 
+def write_report(filename, text):
+    with open(filename, 'w') as report_file:
+        report_file.write(text)
+
 def get_last_trading_day(data, target_date):
-    row = data[data["Date"] <= target_date].iloc[-1:]
-    return row["Date"].values[0] if not row.empty else None
+    # Даты в data отсортированы, поэтому последний торговый день не позже target_date - бинарный поиск
+    dates = data["Date"].to_numpy()
+    position = np.searchsorted(dates, np.datetime64(pd.Timestamp(target_date)), side='right') - 1
+    return dates[position] if position >= 0 else None
 
 def calculate_drawdown(current_value, last_max):
     if last_max <= 0 or current_value >= last_max:
@@ -61,7 +111,7 @@ def calculate_roi(initial, final, invested):
 def calculate_cagr(start_value, end_value, years):
     return (end_value / start_value) ** (1 / years) - 1 if years > 0 and start_value > 0 else 0
 
-def apply_simple_strategy(data, weekly_investment, ticker_1, end_date):
+def apply_simple_strategy(data, weekly_investment, ticker_1, end_date, schedule=schedules.DEFAULT_RULE, roll=None):
     total_invested = 0
     total_units = 0
     portfolio_value = []
@@ -71,14 +121,12 @@ def apply_simple_strategy(data, weekly_investment, ticker_1, end_date):
     drawdown_history = []
     max_drawdown = 0.0
 
-    with open('report_simple.txt', 'w') as report_file:
+    with io.StringIO() as report_file:
         report_file.write("Simple Strategy Report\n")
-        for current_date in pd.date_range(data["Date"].min(), end_date, freq="W-FRI"):
-            last_trading_day = get_last_trading_day(data, current_date)
-            if last_trading_day is None:
-                continue
-
-            row = data[data["Date"] == last_trading_day].iloc[0]
+        trading_days = data["Date"].to_numpy()
+        for position in schedules.positions(trading_days, schedule, end=end_date, roll=roll):
+            last_trading_day = trading_days[position]
+            row = data.iloc[position]
             close = row["Close"]
 
             units = math.floor(weekly_investment / close)
@@ -96,9 +144,12 @@ def apply_simple_strategy(data, weekly_investment, ticker_1, end_date):
             invested_amounts.append(total_invested)
             dates.append(last_trading_day)
 
+        with profiling.phase("report"):
+            write_report('report_simple.txt', report_file.getvalue())
+
     return total_invested, portfolio_value, invested_amounts, dates, {ticker_1: total_units}, max_drawdown
 
-def apply_test_strategy(data, weekly_investment, ticker_1, ticker_2, ticker_3, index, end_date, dropdown_1, dropdown_2, start_date, sell_threshold=None):
+def apply_test_strategy(data, weekly_investment, ticker_1, ticker_2, ticker_3, index, end_date, dropdown_1, dropdown_2, start_date, sell_threshold=None, schedule=schedules.DEFAULT_RULE, roll=None, basis="close"):
     cash_balance = 0.0  # Виртуальный cash_balance, инициализированный как 0
     total_invested = 0
     total_units = 0
@@ -115,23 +166,23 @@ def apply_test_strategy(data, weekly_investment, ticker_1, ticker_2, ticker_3, i
     max_drawdown = 0.0
 
     # Загрузка данных
-    data_index = load_data(index, start_date, end_date)
-    data = data_index.drop_duplicates(subset=['Date']).set_index('Date').resample('B').ffill().reset_index()
-    data_ticker1 = load_data(ticker_1, start_date, end_date)
-    data_ticker2 = load_data(ticker_2, start_date, end_date)
-    data_ticker3 = load_data(ticker_3, start_date, end_date)
-    data = data.merge(data_ticker1[['Date', 'Close']], on="Date", how="left", suffixes=('', f'_{ticker_1}'))
-    data = data.merge(data_ticker2[['Date', 'Close']].rename(columns={'Close': f'Close_{ticker_2}'}), on="Date", how="left")
-    data = data.merge(data_ticker3[['Date', 'Close']].rename(columns={'Close': f'Close_{ticker_3}'}), on="Date", how="left")
-
-    with open('report_test.txt', 'w') as report_file:
+    with profiling.phase("load_data"):
+        data_index = load_data(index, start_date, end_date, basis)
+        data_ticker1 = load_data(ticker_1, start_date, end_date, basis)
+        data_ticker2 = load_data(ticker_2, start_date, end_date, basis)
+        data_ticker3 = load_data(ticker_3, start_date, end_date, basis)
+    with profiling.phase("alignment"):
+        data = trading_calendar.align_to_sessions(data_index)
+        data = data.merge(data_ticker1[['Date', 'Close']], on="Date", how="left", suffixes=('', f'_{ticker_1}'))
+        data = data.merge(data_ticker2[['Date', 'Close']].rename(columns={'Close': f'Close_{ticker_2}'}), on="Date", how="left")
+        data = data.merge(data_ticker3[['Date', 'Close']].rename(columns={'Close': f'Close_{ticker_3}'}), on="Date", how="left")
+
+    with io.StringIO() as report_file:
         report_file.write("Test Strategy Report\n")
-        for current_date in pd.date_range(data["Date"].min(), end_date, freq="W-FRI"):
-            last_trading_day = get_last_trading_day(data, current_date)
-            if last_trading_day is None:
-                continue
-
-            row = data[data["Date"] == last_trading_day].iloc[0]
+        trading_days = data["Date"].to_numpy()
+        for position in schedules.positions(trading_days, schedule, end=end_date, roll=roll):
+            last_trading_day = trading_days[position]
+            row = data.iloc[position]
             qqq_close = row["Close"]
             qld_close = row.get(f"Close_{ticker_2}", 0) if not pd.isna(row.get(f"Close_{ticker_2}")) else 0
             tqqq_close = row.get(f"Close_{ticker_3}", 0) if not pd.isna(row.get(f"Close_{ticker_3}")) else 0
@@ -272,6 +323,9 @@ def apply_test_strategy(data, weekly_investment, ticker_1, ticker_2, ticker_3, i
 
             prev_close = qqq_close
 
+        with profiling.phase("report"):
+            write_report('report_test.txt', report_file.getvalue())
+
     final_shares = {ticker: sum(units for units, _ in shares[ticker]) for ticker in shares}
     return total_invested, portfolio_value, invested_amounts, dates, final_shares, max_drawdown, cash_balance
 
@@ -287,17 +341,16 @@ def plot_results(simple_dates, simple_portfolio, simple_invested, test_dates, te
                 plt.plot(test_dates, test_invested, "--", label="Invested (Test)", color='red', alpha=0.7)
 
         max_price = np.max(data['Close']) if data['Close'].size > 0 else 0
-        for date, price in zip(data['Date'], data['Close']):
-            last_trading_day = get_last_trading_day(data, date)
-            if last_trading_day:
-                row = data[data["Date"] == last_trading_day].iloc[0]
-                qqq_close = row["Close"]
-                qld_close = row.get(f"Close_{ticker_2}", 0) if not np.isnan(row.get(f"Close_{ticker_2}", 0)) else 0
-                tqqq_close = row.get(f"Close_{ticker_3}", 0) if not np.isnan(row.get(f"Close_{ticker_3}", 0)) else 0
-                if qqq_close <= max_price * (1 - 0.20) and tqqq_close > 0:
-                    plt.axvspan(date, date + pd.Timedelta(days=1), facecolor='red', alpha=0.2)
-                elif qqq_close <= max_price * (1 - 0.10) and qld_close > 0 and tqqq_close == 0:
-                    plt.axvspan(date, date + pd.Timedelta(days=1), facecolor='orange', alpha=0.2)
+        # Подсветка дней просадки считается масками по всем дням сразу (первая строка каждой даты)
+        days = data.drop_duplicates(subset=['Date'])
+        qqq_close = days['Close'].to_numpy(dtype=np.float64)
+        qld_close = np.nan_to_num(days[f"Close_{ticker_2}"].to_numpy(dtype=np.float64)) if f"Close_{ticker_2}" in days else np.zeros(len(days))
+        tqqq_close = np.nan_to_num(days[f"Close_{ticker_3}"].to_numpy(dtype=np.float64)) if f"Close_{ticker_3}" in days else np.zeros(len(days))
+        red = (qqq_close <= max_price * (1 - 0.20)) & (tqqq_close > 0)
+        orange = ~red & (qqq_close <= max_price * (1 - 0.10)) & (qld_close > 0) & (tqqq_close == 0)
+        for color, mask in (('red', red), ('orange', orange)):
+            for date in days['Date'][mask]:
+                plt.axvspan(date, date + pd.Timedelta(days=1), facecolor=color, alpha=0.2)
 
         plt.title("Strategy Comparison")
         plt.xlabel("Date")
@@ -320,30 +373,58 @@ def main():
     parser.add_argument("--dropdown_1", type=float, required=True, help="First drawdown level (e.g., 0.10)")
     parser.add_argument("--dropdown_2", type=float, required=True, help="Second drawdown level (e.g., 0.20)")
     parser.add_argument("--sell_threshold", type=float, help="Threshold for selling all assets (e.g., 0.10 for 10%)")
+    parser.add_argument("--metrics", action="store_true", help="Print Sharpe, Sortino, Calmar, ulcer index and other risk metrics of the test strategy")
+    parser.add_argument("--backend", type=str, default="auto", choices=["auto", "numba", "numpy", "python"], help="Strategy kernel used for --metrics (see kernels.py)")
+    parser.add_argument("--lots", action="store_true", help="Report realized gains per year and open lots (the strategy always liquidates whole positions)")
+    schedules.add_arguments(parser)
+    adjustments.add_arguments(parser)
+    result_cache.add_arguments(parser)
+    profiling.add_arguments(parser)
     args = parser.parse_args()
 
     if args.ticker_3 is None:
         args.ticker_3 = args.ticker_2
 
-    end_date = pd.to_datetime(args.end_date)
-    data = load_data(args.index, args.start_date, args.end_date)
-    data_ticker1 = load_data(args.ticker_1, args.start_date, args.end_date)
-    data_ticker2 = load_data(args.ticker_2, args.start_date, args.end_date)
-    data_ticker3 = load_data(args.ticker_3, args.start_date, args.end_date)
+    profiling.run_profiled(lambda: run(args), args)
 
-    with open('report_simple.txt', 'w') as report_simple_file:
-        report_simple_file.write("Simple Strategy Report\n")
-    with open('report_test.txt', 'w') as report_test_file:
-        report_test_file.write("Test Strategy Report\n")
+def run(args):
+    end_date = pd.to_datetime(args.end_date)
+    with profiling.phase("load_data"):
+        data = load_data(args.index, args.start_date, args.end_date, args.price_basis)
+        data_ticker1 = load_data(args.ticker_1, args.start_date, args.end_date, args.price_basis)
+        data_ticker2 = load_data(args.ticker_2, args.start_date, args.end_date, args.price_basis)
+        data_ticker3 = load_data(args.ticker_3, args.start_date, args.end_date, args.price_basis)
+
+    # Повторный прогон с теми же параметрами и теми же ценами берётся из кэша результатов вместе с отчётами;
+    # отчёт сбрасывается до заголовка только при новом прогоне, восстановленный из кэша файл не трогается
+    cache = result_cache.from_args(args)
+    frames = [data, data_ticker1, data_ticker2, data_ticker3]
+    sources = [cache_file_name(ticker, args.start_date, args.end_date) for ticker in (args.index, args.ticker_1, args.ticker_2, args.ticker_3)]
+    params = {"weekly_investment": args.weekly_investment, "tickers": [args.index, args.ticker_1, args.ticker_2, args.ticker_3],
+              "start_date": args.start_date, "end_date": args.end_date, "schedule": args.schedule, "roll": args.roll,
+              "price_basis": args.price_basis}
+
+    def run_simple():
+        write_report('report_simple.txt', "Simple Strategy Report\n")
+        return apply_simple_strategy(data, args.weekly_investment, args.ticker_1, end_date, args.schedule, args.roll)
+
+    def run_test():
+        write_report('report_test.txt', "Test Strategy Report\n")
+        return apply_test_strategy(data, args.weekly_investment, args.ticker_1, args.ticker_2, args.ticker_3, args.index, end_date,
+                                   args.dropdown_1, args.dropdown_2, args.start_date, args.sell_threshold, args.schedule, args.roll,
+                                   args.price_basis)
 
     if not args.skip_simple:
-        simple_invested, simple_portfolio, simple_invested_curve, simple_dates, simple_shares, simple_max_drawdown = apply_simple_strategy(data, args.weekly_investment, args.ticker_1, end_date)
+        with profiling.phase("simple_strategy"):
+            simple_invested, simple_portfolio, simple_invested_curve, simple_dates, simple_shares, simple_max_drawdown = result_cache.cached_call(
+                cache, "simple", params, frames, run_simple, sources, ['report_simple.txt'])
         simple_end_value = simple_portfolio[-1] if simple_portfolio else 0
 
-    test_invested, test_portfolio, test_invested_curve, test_dates, test_shares, test_max_drawdown, final_cash_balance = apply_test_strategy(
-        data, args.weekly_investment, args.ticker_1, args.ticker_2, args.ticker_3, 
-        args.index, end_date, args.dropdown_1, args.dropdown_2, args.start_date, args.sell_threshold
-    )
+    # Собственное время фазы test_strategy (без вложенных load_data/alignment/report) - это недельный цикл
+    with profiling.phase("test_strategy"):
+        test_params = {**params, "dropdown_1": args.dropdown_1, "dropdown_2": args.dropdown_2, "sell_threshold": args.sell_threshold}
+        test_invested, test_portfolio, test_invested_curve, test_dates, test_shares, test_max_drawdown, final_cash_balance = result_cache.cached_call(
+            cache, "test", test_params, frames, run_test, sources, ['report_test.txt'])
     test_end_value = test_portfolio[-1] + (final_cash_balance if final_cash_balance is not None else 0) if test_portfolio else 0
 
     start_year = datetime.strptime(args.start_date, "%Y-%m-%d").year
@@ -392,10 +473,31 @@ def main():
     portfolio_value_current = (qqq_units * qqq_close if qqq_units > 0 else 0) + (qld_units * qld_close if qld_units > 0 else 0) + (tqqq_units * tqqq_close if tqqq_units > 0 else 0) + final_cash_balance
     print(f"Remaining Cash Balance: ${final_cash_balance:.2f} (included in Portfolio Value: ${portfolio_value_current:.2f})")
 
-    if not args.skip_simple:
-        plot_results(simple_dates, simple_portfolio, simple_invested_curve, test_dates, test_portfolio, test_invested_curve, data, args.ticker_1, args.ticker_2, args.ticker_3, args.skip_simple, args.skip_graf, args.dropdown_1, args.dropdown_2)
-    else:
-        plot_results(None, None, None, test_dates, test_portfolio, test_invested_curve, data, args.ticker_1, args.ticker_2, args.ticker_3, args.skip_simple, args.skip_graf, args.dropdown_1, args.dropdown_2)
+    if args.metrics:
+        from kernels import simulate_tiered
+        from metrics import from_result, print_metrics
+        from panel import build_panel
+
+        panel = build_panel(args.index, args.ticker_1, args.ticker_2, args.ticker_3, args.start_date, args.end_date,
+                            schedule=args.schedule, roll=args.roll, basis=args.price_basis)
+        result = simulate_tiered(panel["index_close"], panel["closes"], args.weekly_investment, args.dropdown_1, args.dropdown_2, args.sell_threshold,
+                                 backend=args.backend)
+        print("\n=== Risk Metrics (Test Strategy) ===")
+        print_metrics(from_result(result, panel["periods_per_year"]))
+
+    if args.lots:
+        from ledger import print_lot_report, run_with_ledger
+        from panel import build_panel
+
+        panel = build_panel(args.index, args.ticker_1, args.ticker_2, args.ticker_3, args.start_date, args.end_date,
+                            schedule=args.schedule, roll=args.roll, basis=args.price_basis)
+        print_lot_report(panel, *run_with_ledger(panel, args.weekly_investment, args.dropdown_1, args.dropdown_2, args.sell_threshold))
+
+    with profiling.phase("plot"):
+        if not args.skip_simple:
+            plot_results(simple_dates, simple_portfolio, simple_invested_curve, test_dates, test_portfolio, test_invested_curve, data, args.ticker_1, args.ticker_2, args.ticker_3, args.skip_simple, args.skip_graf, args.dropdown_1, args.dropdown_2)
+        else:
+            plot_results(None, None, None, test_dates, test_portfolio, test_invested_curve, data, args.ticker_1, args.ticker_2, args.ticker_3, args.skip_simple, args.skip_graf, args.dropdown_1, args.dropdown_2)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,663 @@
+# Скомпилированные ядра пошаговых стратегий (Numba, если установлена) с запасным путём на NumPy.
+# Продажа по sell_threshold, выкуп и флаг has_sold делают тестируемую стратегию последовательной: шаг t
+# зависит от cash и долей после шага t - 1. engine.simulate_tiered векторизует её по дорожкам, но на одной
+# дорожке это ~20 операций NumPy на шаг. Здесь тот же шаг написан над скалярами и типизированными массивами:
+# Numba компилирует цикл в машинный код, и 25 лет недельных шагов (~1300) идут за микросекунды.
+#
+# Стратегии:
+#   - tiered     - тестируемая стратегия investing.py / engine.py (QQQ/QLD/TQQQ, продажа и выкуп), без издержек;
+#   - multiplier - develop/test_advince_multiplier.py: докупка weekly * multiplier при просадке от максимума;
+#   - price_step - develop/test_advince_price_step.py: докупка weekly * price_step * (2, 3, 4) по уровням просадки;
+#   - psar       - develop/test_simple_psar_high.py / _low.py: покупка, когда недельный PSAR ниже (выше) цены.
+# Бэкенды (backend=...):
+#   - "numba"  - ядра, скомпилированные numba.njit (без fastmath: порядок операций как в эталоне);
+#   - "numpy"  - запасной путь без Numba: engine.simulate_tiered для tiered, накопленные суммы для остальных
+#                (рекурсия PSAR - цикл Python по спискам);
+#   - "python" - те же ядра, исполняемые интерпретатором (медленно; проверка логики ядер без Numba);
+#   - "auto"   - numba, если она установлена, иначе numpy (для tiered на одной дорожке - python: интерпретируемый
+#                цикл по скалярам в ~20 раз быстрее векторного шага engine на массивах длины 1).
+# Все бэкенды совпадают с эталоном бит в бит; verify и CLI это проверяют и замеряют время одного прогона.
+#
+# python kernels.py 100 --start_date 2000-01-01 --end_date 2024-12-31 --index QQQ --ticker_2 QLD --ticker_3 TQQQ --sell_threshold 0.10
+# python kernels.py 100 --synthetic 25
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import engine
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAS_NUMBA = numba is not None
+BACKENDS = ("auto", "numba", "numpy", "python")
+MULTIPLIER_THRESHOLDS = (0.10, 0.20, 0.30)
+PRICE_STEP_LEVELS = ((0.10, 2), (0.20, 3), (0.30, 4))
+PSAR_START, PSAR_STEP, PSAR_MAX = 0.02, 0.02, 0.2
+
+
+def _jit(function):
+    return numba.njit(cache=True)(function) if HAS_NUMBA else function
+
+
+def resolve_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    if backend == "auto":
+        return "numba" if HAS_NUMBA else "numpy"
+    if backend == "numba" and not HAS_NUMBA:
+        raise ImportError("The numba backend needs numba (pip install numba)")
+    return backend
+
+
+# --- Ядра -------------------------------------------------------------------------------------------------
+# Каждое ядро пишет кривые в переданные массивы; кривые нулевой длины означают "не записывать".
+
+
+def _tiered_steps(index_close, tier_closes, weekly, dropdown_1, dropdown_2, sell_threshold,
+                  cash_out, invested_out, units_out, max_drawdown_out, n_sells_out,
+                  portfolio_curve, invested_curve, contributions, tier_curve, value_curve):
+    """Шаги engine.simulate_tiered (без издержек, ledger и state) по дорожкам; цены - столбец дорожки или общий столбец 0."""
+    n_steps = index_close.shape[0]
+    record = portfolio_curve.shape[0] == n_steps
+    for lane in range(cash_out.shape[0]):
+        i = lane if index_close.shape[1] > 1 else 0
+        j = lane if tier_closes.shape[2] > 1 else 0
+        weekly_investment = weekly[lane]
+        d1 = dropdown_1[lane]
+        d2 = dropdown_2[lane]
+        st = sell_threshold[lane]
+        cash = 0.0
+        invested = 0.0
+        max_price = 0.0
+        sell_price = 0.0
+        prev_close = np.nan
+        has_sold = False
+        u0 = 0.0
+        u1 = 0.0
+        u2 = 0.0
+        last_max_portfolio = 0.0
+        max_drawdown = 0.0
+        n_sells = 0
+        for t in range(n_steps):
+            close = index_close[t, i]
+            p0 = tier_closes[0, t, j]
+            p1 = tier_closes[1, t, j]
+            p2 = tier_closes[2, t, j]
+            if close > max_price:
+                max_price = close
+
+            # Продажа всех позиций при достижении sell_threshold
+            if st > 0 and not has_sold and close <= max_price * (1 - st):
+                cash = cash + (u0 * p0 + u1 * p1 + u2 * p2)
+                u0 = 0.0
+                u1 = 0.0
+                u2 = 0.0
+                has_sold = True
+                sell_price = close
+                n_sells += 1
+
+            # Выкуп ticker_1 после возврата цены к уровню продажи
+            if has_sold and cash > 0 and prev_close < sell_price and close >= sell_price and p0 > 0:
+                rebuy_units = np.floor(cash / p0)
+                if rebuy_units > 0:
+                    u0 += rebuy_units
+                    cash = cash - rebuy_units * p0
+                    has_sold = False
+
+            # Пополнение cash до суммы, кратной минимальной цене, и покупка
+            min_price = np.inf
+            if p0 > 0:
+                min_price = p0
+            if p1 > 0 and p1 < min_price:
+                min_price = p1
+            if p2 > 0 and p2 < min_price:
+                min_price = p2
+            if min_price == np.inf:
+                min_price = 1.0
+            required = np.floor(weekly_investment / min_price) * min_price
+            added = required - cash
+            if added < 0.0:
+                added = 0.0
+            cash += added
+            invested += added
+            amount = cash if cash < weekly_investment else weekly_investment
+
+            tier = -1
+            if amount > 0:
+                if close >= max_price * (1 - d1):
+                    tier = 0
+                elif close >= max_price * (1 - d2) and p1 > 0:
+                    tier = 1
+                elif p2 > 0:
+                    tier = 2
+            price = p1 if tier == 1 else (p2 if tier == 2 else p0)
+            buy_units = 0.0
+            if tier >= 0 and price > 0:
+                buy_units = np.floor(amount / price)
+            if tier == 1:
+                u1 += buy_units
+            elif tier == 2:
+                u2 += buy_units
+            else:
+                u0 += buy_units
+            cash -= buy_units * price
+
+            portfolio = u0 * p0 + u1 * p1 + u2 * p2 + cash
+            peak = portfolio if portfolio > last_max_portfolio else last_max_portfolio
+            drawdown = (peak - portfolio) / peak * 100 if peak > 0 else 0.0
+            if drawdown > max_drawdown:
+                max_drawdown = drawdown
+            last_max_portfolio = peak
+
+            if close >= max_price:
+                has_sold = False
+            prev_close = close
+
+            if record:
+                portfolio_curve[t, lane] = portfolio
+                invested_curve[t, lane] = invested
+                contributions[t, lane] = added
+                tier_curve[t, lane] = tier
+                value_curve[0, t, lane] = u0 * p0
+                value_curve[1, t, lane] = u1 * p1
+                value_curve[2, t, lane] = u2 * p2
+        cash_out[lane] = cash
+        invested_out[lane] = invested
+        units_out[0, lane] = u0
+        units_out[1, lane] = u1
+        units_out[2, lane] = u2
+        max_drawdown_out[lane] = max_drawdown
+        n_sells_out[lane] = n_sells
+
+
+def _ladder_steps(close, buy_day, weekly_investment, scale, thresholds, factors, portfolio_curve, invested_curve):
+    """Дробные покупки weekly / close в дни взносов плюс докупка weekly * scale * factor на первом сработавшем уровне."""
+    total_units = 0.0
+    total_invested = 0.0
+    max_price = 0.0
+    for t in range(close.shape[0]):
+        price = close[t]
+        if price > max_price:
+            max_price = price
+        if buy_day[t]:
+            total_units += weekly_investment / price
+            total_invested += weekly_investment
+        for k in range(thresholds.shape[0]):
+            if price <= max_price * (1 - thresholds[k]):
+                extra_investment = weekly_investment * scale * factors[k]
+                total_units += extra_investment / price
+                total_invested += extra_investment
+                break
+        portfolio_curve[t] = total_units * price
+        invested_curve[t] = total_invested
+    return total_units, total_invested
+
+
+def _psar_values(high, low, start, step, maximum, psar):
+    """Parabolic SAR как calculate_psar в develop/test_simple_psar_*.py."""
+    af = start
+    trend = 1
+    ep = high[0]
+    psar[0] = low[0]
+    for i in range(1, len(high)):
+        value = psar[i - 1] + af * (ep - psar[i - 1])
+        if trend == 1:
+            if low[i] < value:
+                trend = -1
+                value = ep
+                ep = low[i]
+                af = start
+            elif high[i] > ep:
+                ep = high[i]
+                af = min(af + step, maximum)
+        else:
+            if high[i] > value:
+                trend = 1
+                value = ep
+                ep = high[i]
+                af = start
+            elif low[i] < ep:
+                ep = low[i]
+                af = min(af + step, maximum)
+        psar[i] = value
+
+
+def _signal_steps(signal, close, weekly_investment, portfolio_curve, invested_curve):
+    """Покупка weekly / close на каждом шаге, где signal истинен (PSAR ниже или выше цены)."""
+    total_units = 0.0
+    total_invested = 0.0
+    for t in range(close.shape[0]):
+        if signal[t]:
+            total_units += weekly_investment / close[t]
+            total_invested += weekly_investment
+        portfolio_curve[t] = total_units * close[t]
+        invested_curve[t] = total_invested
+    return total_units, total_invested
+
+
+_KERNELS = {"tiered": _tiered_steps, "ladder": _ladder_steps, "psar": _psar_values, "signal": _signal_steps}
+_COMPILED = {}
+
+
+def _kernel(name, backend):
+    """Ядро для бэкенда: исходная функция для "python", скомпилированная (один раз за процесс) для "numba"."""
+    if backend == "python":
+        return _KERNELS[name]
+    if name not in _COMPILED:
+        _COMPILED[name] = _jit(_KERNELS[name])
+    return _COMPILED[name]
+
+
+# --- Стратегии --------------------------------------------------------------------------------------------
+
+
+def simulate_tiered(index_close, tier_closes, weekly_investment, dropdown_1, dropdown_2, sell_threshold=None, record_curves=True, backend="auto"):
+    """Тестируемая стратегия: те же входы и ключи результата, что у engine.simulate_tiered без издержек.
+
+    Продолжение прогона (state), ledger, costs, stream и precision есть только в engine - для них backend="numpy".
+    """
+    if backend == "auto" and not HAS_NUMBA and engine.count_lanes(index_close, tier_closes, weekly_investment, dropdown_1, dropdown_2, sell_threshold) == 1:
+        backend = "python"
+    backend = resolve_backend(backend)
+    if backend == "numpy":
+        return engine.simulate_tiered(index_close, tier_closes, weekly_investment, dropdown_1, dropdown_2, sell_threshold, record_curves)
+    index_close = np.asarray(index_close, dtype=np.float64)
+    tier_closes = np.asarray(tier_closes, dtype=np.float64)
+    if index_close.ndim == 1:
+        index_close = index_close[:, None]
+    if tier_closes.ndim == 2:
+        tier_closes = tier_closes[:, :, None]
+    n_steps = index_close.shape[0]
+    n_lanes = engine.count_lanes(index_close, tier_closes, weekly_investment, dropdown_1, dropdown_2, sell_threshold)
+    index_close = np.ascontiguousarray(index_close)
+    tier_closes = np.ascontiguousarray(np.where(np.isnan(tier_closes) | (tier_closes <= 0), 0.0, tier_closes))
+    params = [np.ascontiguousarray(engine._lane_param(value, n_lanes)) for value in (weekly_investment, dropdown_1, dropdown_2, sell_threshold)]
+
+    cash = np.zeros(n_lanes)
+    invested = np.zeros(n_lanes)
+    units = np.zeros((engine.N_TIERS, n_lanes))
+    max_drawdown = np.zeros(n_lanes)
+    n_sells = np.zeros(n_lanes, dtype=np.int64)
+    curve_steps = n_steps if record_curves else 0
+    portfolio_curve = np.empty((curve_steps, n_lanes))
+    invested_curve = np.empty((curve_steps, n_lanes))
+    contributions = np.empty((curve_steps, n_lanes))
+    tier_curve = np.empty((curve_steps, n_lanes), dtype=np.int8)
+    value_curve = np.empty((engine.N_TIERS, curve_steps, n_lanes))
+    _kernel("tiered", backend)(index_close, tier_closes, *params, cash, invested, units, max_drawdown, n_sells,
+                               portfolio_curve, invested_curve, contributions, tier_curve, value_curve)
+
+    result = {
+        "n_lanes": n_lanes,
+        "total_invested": invested,
+        "final_value": np.multiply(units, np.broadcast_to(tier_closes[:, -1], (engine.N_TIERS, n_lanes))).sum(axis=0) + cash if n_steps else cash,
+        "cash_balance": cash,
+        "units": units,
+        "max_drawdown": max_drawdown,
+        "n_sells": n_sells,
+        "costs_paid": np.zeros(n_lanes),
+    }
+    if record_curves:
+        result.update(portfolio_value=portfolio_curve, invested_amounts=invested_curve,
+                      contributions=contributions, tiers=tier_curve, **dict(zip(engine.TIER_VALUE_KEYS, value_curve)))
+    return result
+
+
+def _accumulate(close, buys, extras):
+    """Доли и вложения по шагам как при последовательном сложении: сначала взнос шага, затем докупка."""
+    units = np.cumsum(np.column_stack([buys / close, extras / close]).ravel())[1::2]
+    invested = np.cumsum(np.column_stack([buys, extras]).ravel())[1::2]
+    return units, invested
+
+
+def _ladder(close, buy_day, weekly_investment, scale, thresholds, factors, backend):
+    backend = resolve_backend(backend)
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    buy_day = np.ascontiguousarray(buy_day, dtype=np.bool_)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    factors = np.asarray(factors, dtype=np.float64)
+    if backend == "numpy":
+        max_price = np.maximum.accumulate(np.maximum(close, 0.0))
+        extras = np.zeros(len(close))
+        hit = np.zeros(len(close), dtype=bool)
+        for threshold, factor in zip(thresholds, factors):
+            level = ~hit & (close <= max_price * (1 - threshold))
+            extras[level] = weekly_investment * scale * factor
+            hit |= level
+        units, invested = _accumulate(close, np.where(buy_day, weekly_investment, 0.0), extras)
+        portfolio = units * close
+    else:
+        portfolio = np.empty(len(close))
+        invested = np.empty(len(close))
+        _kernel("ladder", backend)(close, buy_day, float(weekly_investment), float(scale), thresholds, factors, portfolio, invested)
+    return _summary(portfolio, invested)
+
+
+def simulate_multiplier(close, buy_day, weekly_investment, multiplier, backend="auto"):
+    """develop/test_advince_multiplier.py: любой из уровней 10/20/30% даёт одну докупку weekly * multiplier."""
+    return _ladder(close, buy_day, weekly_investment, multiplier, MULTIPLIER_THRESHOLDS, np.ones(len(MULTIPLIER_THRESHOLDS)), backend)
+
+
+def simulate_price_step(close, buy_day, weekly_investment, price_step, backend="auto"):
+    """develop/test_advince_price_step.py: уровни проверяются по порядку, срабатывает первый (как break в оригинале)."""
+    thresholds, factors = zip(*PRICE_STEP_LEVELS)
+    return _ladder(close, buy_day, weekly_investment, price_step, thresholds, factors, backend)
+
+
+def psar(high, low, backend="auto"):
+    """Значения Parabolic SAR по барам (обычно недельным)."""
+    backend = resolve_backend(backend)
+    high = np.ascontiguousarray(high, dtype=np.float64)
+    low = np.ascontiguousarray(low, dtype=np.float64)
+    values = np.empty(len(high))
+    if not len(high):
+        return values
+    if backend == "numpy":
+        # Рекурсия не векторизуется; цикл по спискам float быстрее поэлементного доступа к массиву
+        values[:] = _psar_list(high.tolist(), low.tolist())
+    else:
+        _kernel("psar", backend)(high, low, PSAR_START, PSAR_STEP, PSAR_MAX, values)
+    return values
+
+
+def _psar_list(high, low):
+    values = [0.0] * len(high)
+    _KERNELS["psar"](high, low, PSAR_START, PSAR_STEP, PSAR_MAX, values)
+    return values
+
+
+def simulate_psar(high, low, close, weekly_investment, side="high", backend="auto"):
+    """develop/test_simple_psar_high.py (side="high": PSAR ниже цены) и _low.py (side="low": PSAR выше цены)."""
+    backend = resolve_backend(backend)
+    direction = 1 if side == "high" else -1
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    if backend == "numpy" or not len(close):
+        values = psar(high, low, "numpy")
+        buy = values < close if direction > 0 else values > close
+        units, invested = _accumulate(close, np.where(buy, weekly_investment, 0.0), np.zeros(len(close)))
+        portfolio = units * close
+    else:
+        values = psar(high, low, backend)
+        portfolio = np.empty(len(close))
+        invested = np.empty(len(close))
+        _kernel("signal", backend)(values < close if direction > 0 else values > close, close, float(weekly_investment), portfolio, invested)
+    return {**_summary(portfolio, invested), "psar": values}
+
+
+def _summary(portfolio, invested):
+    return {
+        "total_invested": invested[-1] if len(invested) else 0.0,
+        "final_value": portfolio[-1] if len(portfolio) else 0.0,
+        "portfolio_value": portfolio,
+        "invested_amounts": invested,
+    }
+
+
+# --- Эталоны и сверка -------------------------------------------------------------------------------------
+# Циклы из develop/*.py над списками float, без pandas: эталон для multiplier, price_step и psar.
+# Для tiered эталон - engine.simulate_tiered (векторная версия apply_test_strategy).
+
+
+def reference_multiplier(closes, buy_day, weekly_investment, multiplier):
+    total_invested = 0
+    total_units = 0
+    max_price = 0
+    portfolio_value = []
+    for close, is_buy_day in zip(closes, buy_day):
+        max_price = max(max_price, close)
+        if is_buy_day:
+            total_units += weekly_investment / close
+            total_invested += weekly_investment
+        for threshold in {0.10, 0.20, 0.30}:
+            if close <= max_price * (1 - threshold):
+                extra_investment = weekly_investment * multiplier
+                total_units += extra_investment / close
+                total_invested += extra_investment
+                break
+        portfolio_value.append(total_units * close)
+    return total_invested, portfolio_value
+
+
+def reference_price_step(closes, buy_day, weekly_investment, price_step):
+    total_invested = 0
+    total_units = 0
+    max_price = 0
+    portfolio_value = []
+    for close, is_buy_day in zip(closes, buy_day):
+        max_price = max(max_price, close)
+        if is_buy_day:
+            total_units += weekly_investment / close
+            total_invested += weekly_investment
+        for threshold, multiplier in {0.10: 2, 0.20: 3, 0.30: 4}.items():
+            if close <= max_price * (1 - threshold):
+                extra_investment = weekly_investment * price_step * multiplier
+                total_units += extra_investment / close
+                total_invested += extra_investment
+                break
+        portfolio_value.append(total_units * close)
+    return total_invested, portfolio_value
+
+
+def reference_psar(high, low, close, weekly_investment, side="high"):
+    af = 0.02
+    af_max = 0.2
+    psar = np.zeros_like(close)
+    trend = np.ones_like(close)
+    ep = high[0]
+    psar[0] = low[0]
+    for i in range(1, len(close)):
+        previous_psar = psar[i - 1]
+        previous_trend = trend[i - 1]
+        if previous_trend == 1:
+            psar[i] = previous_psar + af * (ep - previous_psar)
+            if low[i] < psar[i]:
+                trend[i] = -1
+                psar[i] = ep
+                ep = low[i]
+                af = 0.02
+            else:
+                trend[i] = 1
+                if high[i] > ep:
+                    ep = high[i]
+                    af = min(af + 0.02, af_max)
+        else:
+            psar[i] = previous_psar + af * (ep - previous_psar)
+            if high[i] > psar[i]:
+                trend[i] = 1
+                psar[i] = ep
+                ep = high[i]
+                af = 0.02
+            else:
+                trend[i] = -1
+                if low[i] < ep:
+                    ep = low[i]
+                    af = min(af + 0.02, af_max)
+    total_invested = 0
+    total_units = 0
+    portfolio_value = []
+    for value, price in zip(psar, close):
+        if (value < price) if side == "high" else (value > price):
+            total_units += weekly_investment / price
+            total_invested += weekly_investment
+        portfolio_value.append(total_units * price)
+    return total_invested, portfolio_value, psar
+
+
+def _same(a, b):
+    """Совпадение бит в бит (NaN совпадает с NaN)."""
+    a = np.asarray(a)
+    b = np.asarray(b)
+    return a.shape == b.shape and bool(np.all((a == b) | (np.isnan(a) & np.isnan(b)) if a.dtype.kind == 'f' else a == b))
+
+
+TIERED_KEYS = ("total_invested", "final_value", "cash_balance", "units", "max_drawdown", "n_sells",
+               "portfolio_value", "invested_amounts", "contributions", "tiers") + engine.TIER_VALUE_KEYS
+
+
+def verify(data, weekly_investment, dropdown_1, dropdown_2, sell_threshold=None, multiplier=1.0, price_step=1.0, backends=None):
+    """Сверка всех стратегий на всех бэкендах с эталоном. Возвращает {(стратегия, бэкенд): [несовпавшие ключи]}.
+
+    data - словарь из prepare_data (или synthetic_data): недельная панель, дневные цены и недельные бары.
+    """
+    if backends is None:
+        backends = available_backends()
+    report = {}
+    reference = engine.simulate_tiered(data["index_close"], data["closes"], weekly_investment, dropdown_1, dropdown_2, sell_threshold)
+    for backend in backends:
+        result = simulate_tiered(data["index_close"], data["closes"], weekly_investment, dropdown_1, dropdown_2, sell_threshold, backend=backend)
+        report[("tiered", backend)] = [key for key in TIERED_KEYS if not _same(reference[key], result[key])]
+
+    daily_close, buy_day = data["daily_close"].tolist(), data["buy_day"].tolist()
+    high, low, close = data["weekly_high"], data["weekly_low"], data["weekly_close"]
+    references = {
+        "multiplier": reference_multiplier(daily_close, buy_day, weekly_investment, multiplier),
+        "price_step": reference_price_step(daily_close, buy_day, weekly_investment, price_step),
+        "psar": reference_psar(high, low, close, weekly_investment),
+        "psar_low": reference_psar(high, low, close, weekly_investment, "low"),
+    }
+    for backend in backends:
+        runs = {
+            "multiplier": simulate_multiplier(data["daily_close"], data["buy_day"], weekly_investment, multiplier, backend),
+            "price_step": simulate_price_step(data["daily_close"], data["buy_day"], weekly_investment, price_step, backend),
+            "psar": simulate_psar(high, low, close, weekly_investment, "high", backend),
+            "psar_low": simulate_psar(high, low, close, weekly_investment, "low", backend),
+        }
+        for name, result in runs.items():
+            expected = references[name]
+            mismatched = [key for key, value in (("total_invested", expected[0]), ("portfolio_value", expected[1]))
+                          if not _same(np.asarray(value, dtype=np.float64), result[key])]
+            if name.startswith("psar") and not _same(expected[2], result["psar"]):
+                mismatched.append("psar")
+            report[(name, backend)] = mismatched
+    return report
+
+
+def available_backends():
+    return [backend for backend in BACKENDS[1:] if backend != "numba" or HAS_NUMBA]
+
+
+def time_run(function, repeat):
+    """Медиана времени одного вызова в секундах (первый вызов - прогрев и компиляция - не учитывается)."""
+    function()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings))
+
+
+def timings(data, weekly_investment, dropdown_1, dropdown_2, sell_threshold=None, multiplier=1.0, price_step=1.0, backends=None, repeat=100):
+    """Время одного прогона каждой стратегии на каждом бэкенде: {(стратегия, бэкенд): секунды}."""
+    if backends is None:
+        backends = available_backends()
+    high, low, close = data["weekly_high"], data["weekly_low"], data["weekly_close"]
+    result = {}
+    for backend in backends:
+        # Интерпретируемые ядра на порядки медленнее - для них хватает нескольких повторов
+        n = repeat if backend != "python" else max(1, min(repeat, 3))
+        runs = {
+            "tiered": lambda: simulate_tiered(data["index_close"], data["closes"], weekly_investment, dropdown_1, dropdown_2,
+                                              sell_threshold, backend=backend),
+            "multiplier": lambda: simulate_multiplier(data["daily_close"], data["buy_day"], weekly_investment, multiplier, backend),
+            "price_step": lambda: simulate_price_step(data["daily_close"], data["buy_day"], weekly_investment, price_step, backend),
+            "psar": lambda: simulate_psar(high, low, close, weekly_investment, "high", backend),
+        }
+        for name, run in runs.items():
+            result[(name, backend)] = time_run(run, n)
+    return result
+
+
+# --- Данные -----------------------------------------------------------------------------------------------
+
+
+def weekly_bars(dates, close, high=None, low=None):
+    """Недельные бары (resample('W'), как resample_to_weekly в develop/test_simple_psar_*.py).
+
+    Без дневных High/Low (кэш load_data хранит только Close) берутся максимум и минимум закрытий недели.
+    """
+    import pandas as pd
+
+    frame = pd.DataFrame({"Date": pd.to_datetime(dates), "Close": close,
+                          "High": close if high is None else high, "Low": close if low is None else low})
+    weekly = frame.resample('W', on='Date').agg({"High": "max", "Low": "min", "Close": "last"}).dropna()
+    return weekly["High"].to_numpy(), weekly["Low"].to_numpy(), weekly["Close"].to_numpy()
+
+
+def prepare_data(index, ticker_2, ticker_3, start_date, end_date):
+    """Недельная панель для tiered и дневные цены индекса с днями взносов для остальных стратегий."""
+    import pandas as pd
+
+    import schedules
+    from panel import build_daily_frame, build_panel
+
+    panel = build_panel(index, index, ticker_2, ticker_3, start_date, end_date)
+    daily = build_daily_frame(index, [], start_date, end_date)
+    return _with_daily(panel, daily["Date"].to_numpy(), daily["Close"].to_numpy(dtype=np.float64),
+                       schedules.positions(daily["Date"], schedules.DEFAULT_RULE, end=pd.to_datetime(end_date)))
+
+
+def synthetic_data(years=25, seed=0, start_price=100.0):
+    """Синтетические дневные цены (индекс и 2x/3x без комиссий) на years лет; взносы - каждая пятая сессия."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0005, 0.015, years * 252)
+    paths = start_price * np.cumprod(1 + np.outer((1.0, 2.0, 3.0), returns), axis=1)
+    positions = np.arange(4, paths.shape[1], 5)
+    panel = {"index_close": paths[0, positions], "closes": paths[:, positions]}
+    dates = pd.bdate_range("2000-01-03", periods=paths.shape[1]).to_numpy()
+    return _with_daily(panel, dates, paths[0], positions)
+
+
+def _with_daily(panel, dates, daily_close, positions):
+    buy_day = np.zeros(len(daily_close), dtype=bool)
+    buy_day[positions] = True
+    high, low, close = weekly_bars(dates, daily_close)
+    return {**panel, "daily_close": daily_close, "buy_day": buy_day, "weekly_high": high, "weekly_low": low, "weekly_close": close}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the compiled strategy kernels against the Python reference and time them")
+    parser.add_argument("weekly_investment", type=float, help="Weekly investment in dollars")
+    parser.add_argument("--start_date", type=str, default="2000-01-01", help="Start date (YYYY-MM-DD)")
+    parser.add_argument("--end_date", type=str, default="2024-12-31", help="End date (YYYY-MM-DD)")
+    parser.add_argument("--index", type=str, default="QQQ", help="Index ticker, also the first tier (e.g., QQQ)")
+    parser.add_argument("--ticker_2", type=str, default="QLD", help="Ticker for the first drawdown level (e.g., QLD)")
+    parser.add_argument("--ticker_3", type=str, default="TQQQ", help="Ticker for the second drawdown level (e.g., TQQQ)")
+    parser.add_argument("--synthetic", type=int, metavar="YEARS", help="Use synthetic prices of this length instead of downloaded data")
+    parser.add_argument("--dropdown_1", type=float, default=0.10, help="First drawdown level")
+    parser.add_argument("--dropdown_2", type=float, default=0.20, help="Second drawdown level")
+    parser.add_argument("--sell_threshold", type=float, help="Threshold for selling all assets")
+    parser.add_argument("--multiplier", type=float, default=1.0, help="Extra investment multiplier of the multiplier strategy")
+    parser.add_argument("--price_step", type=float, default=1.0, help="Price step of the price_step strategy")
+    parser.add_argument("--backend", type=str, action="append", choices=BACKENDS[1:], help="Backend to check (repeatable, default: all available)")
+    parser.add_argument("--repeat", type=int, default=200, help="Timed runs per strategy and backend")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        data = synthetic_data(args.synthetic)
+    else:
+        data = prepare_data(args.index, args.ticker_2, args.ticker_3, args.start_date, args.end_date)
+    backends = [resolve_backend(backend) for backend in args.backend] if args.backend else available_backends()
+    options = (args.weekly_investment, args.dropdown_1, args.dropdown_2, args.sell_threshold, args.multiplier, args.price_step)
+
+    print(f"Numba: {'numba ' + numba.__version__ if HAS_NUMBA else 'not installed (numpy fallback)'}")
+    print(f"Weekly steps: {len(data['index_close'])}, daily steps: {len(data['daily_close'])}, weekly bars: {len(data['weekly_close'])}")
+    report = verify(data, *options, backends=backends)
+    elapsed = timings(data, *options, backends=backends, repeat=args.repeat)
+    for (name, backend), mismatched in report.items():
+        timing = f", {elapsed[(name, backend)] * 1e6:.1f} us per run" if (name, backend) in elapsed else ""
+        status = "bit-identical" if not mismatched else "MISMATCH in " + ", ".join(mismatched)
+        print(f"{name:<11} {backend:<7} {status}{timing}")
+    sys.exit(0 if not any(report.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# Учёт позиций по лотам для engine.simulate_tiered: реализованная и нереализованная прибыль
+# по каждой покупке, списание лотов по FIFO, LIFO или средней цене, реализованная прибыль по годам.
+#
+# Хранение - растущие массивы формы (ёмкость, n_lanes), одна строка на событие покупки:
+# покупка на шаге t во всех дорожках сразу - одна строка (в дорожках без покупки units = 0),
+# поэтому добавление лота - O(1) (амортизированно, ёмкость удваивается).
+# Открытые лоты каждой пары (уровень, дорожка) связаны в двусвязный список по строкам (next_row/prev_row)
+# с указателями на самый старый (first) и самый новый (last) открытый лот. Продажа идёт с начала (FIFO)
+# или с конца (LIFO) списка и выбранные до конца лоты из него исключаются, поэтому частичная продажа
+# стоит O(k), где k - число затронутых лотов: лоты других уровней и уже закрытые лоты не просматриваются.
+# При методе "average" лоты списываются по FIFO, а прибыль считается от средней цены позиции.
+#
+# Стратегия engine продаёт позиции только целиком (close_all по sell_threshold), а при полной продаже
+# реализованная прибыль не зависит от метода. Метод влияет только на частичные продажи (sell).
+
+import numpy as np
+import pandas as pd
+
+METHODS = ("fifo", "lifo", "average")
+
+
+class LotLedger:
+    def __init__(self, n_lanes=1, n_tiers=3, method="fifo", capacity=64):
+        if method not in METHODS:
+            raise ValueError(f"Unknown lot method: {method}")
+        self.n_lanes = n_lanes
+        self.n_tiers = n_tiers
+        self.method = method
+        self.n_steps = 0  # сколько шагов уже прогнал engine (для сквозной нумерации при продолжении)
+        self.n_lots = 0
+        self.step = np.zeros(capacity, dtype=np.int32)
+        self.tier = np.full((capacity, n_lanes), -1, dtype=np.int8)
+        self.units = np.zeros((capacity, n_lanes))
+        self.price = np.zeros((capacity, n_lanes))
+        self.remaining = np.zeros((capacity, n_lanes))
+        # Списки открытых лотов по (уровень, дорожка); -1 - нет лота
+        self.next_row = np.full((capacity, n_lanes), -1, dtype=np.int64)
+        self.prev_row = np.full((capacity, n_lanes), -1, dtype=np.int64)
+        self.first = np.full((n_tiers, n_lanes), -1, dtype=np.int64)
+        self.last = np.full((n_tiers, n_lanes), -1, dtype=np.int64)
+        # Текущая позиция и её стоимость покупки по уровням
+        self.position = np.zeros((n_tiers, n_lanes))
+        self.cost_basis = np.zeros((n_tiers, n_lanes))
+        self.realized_total = np.zeros(n_lanes)
+        # Продажи редки, поэтому журнал реализованной прибыли - список событий (шаг, прибыль по дорожкам)
+        self.realized = []
+
+    def _grow(self):
+        capacity = len(self.step) * 2
+        self.step = np.resize(self.step, capacity)
+        for name in ("tier", "units", "price", "remaining", "next_row", "prev_row"):
+            old = getattr(self, name)
+            new = np.zeros((capacity, self.n_lanes), dtype=old.dtype)
+            if name in ("tier", "next_row", "prev_row"):
+                new.fill(-1)
+            new[:self.n_lots] = old[:self.n_lots]
+            setattr(self, name, new)
+
+    def buy(self, step, tier, units, price):
+        """Покупка: tier, units, price - массивы (n_lanes,); tier = -1 или units = 0 - покупки нет."""
+        tier = np.broadcast_to(tier, (self.n_lanes,))
+        units = np.where(tier >= 0, np.broadcast_to(units, (self.n_lanes,)), 0.0)
+        if not units.any():
+            return
+        if self.n_lots == len(self.step):
+            self._grow()
+        row = self.n_lots
+        self.step[row] = step
+        self.tier[row] = np.where(units > 0, tier, -1)
+        self.units[row] = units
+        self.price[row] = price
+        self.remaining[row] = units
+        self.n_lots += 1
+        lanes = np.flatnonzero(units > 0)
+        tiers = self.tier[row, lanes]
+        # Новый лот - в конец списка своего уровня
+        tail = self.last[tiers, lanes]
+        linked = tail >= 0
+        self.next_row[tail[linked], lanes[linked]] = row
+        self.first[tiers[~linked], lanes[~linked]] = row
+        self.prev_row[row, lanes] = tail
+        self.last[tiers, lanes] = row
+        self.position[tiers, lanes] += units[lanes]
+        self.cost_basis[tiers, lanes] += units[lanes] * np.broadcast_to(price, (self.n_lanes,))[lanes]
+
+    def _consume(self, tier, lanes, quantity):
+        """Списывает quantity единиц уровня tier в дорожках lanes; возвращает стоимость покупки списанного.
+
+        Просматриваются только списываемые лоты: с начала списка (FIFO, average) или с конца (LIFO).
+        """
+        lifo = self.method == "lifo"
+        cost = np.zeros(len(lanes))
+        need = quantity.astype(np.float64).copy()
+        cursor = (self.last if lifo else self.first)[tier, lanes].copy()
+        step = self.prev_row if lifo else self.next_row
+        active = (need > 1e-12) & (cursor >= 0)
+        while active.any():
+            idx = np.flatnonzero(active)
+            rows, cols = cursor[idx], lanes[idx]
+            take = np.minimum(self.remaining[rows, cols], need[idx])
+            self.remaining[rows, cols] -= take
+            cost[idx] += take * self.price[rows, cols]
+            need[idx] -= take
+            # Выбранный до конца лот исключается из списка, курсор переходит к следующему; иначе остаётся на лоте
+            exhausted = self.remaining[rows, cols] <= 0
+            cursor[idx[exhausted]] = step[rows[exhausted], cols[exhausted]]
+            active[idx] = (need[idx] > 1e-12) & (cursor[idx] >= 0)
+        # Новый край списка: первый (FIFO) или последний (LIFO) ещё открытый лот
+        empty = cursor < 0
+        if lifo:
+            self.last[tier, lanes] = cursor
+            self.next_row[cursor[~empty], lanes[~empty]] = -1
+            self.first[tier, lanes[empty]] = -1
+        else:
+            self.first[tier, lanes] = cursor
+            self.prev_row[cursor[~empty], lanes[~empty]] = -1
+            self.last[tier, lanes[empty]] = -1
+        return cost
+
+    def sell(self, step, tier, units, price):
+        """Частичная продажа units (n_lanes,) уровня tier по цене price; возвращает реализованную прибыль."""
+        units = np.minimum(np.broadcast_to(units, (self.n_lanes,)), self.position[tier])
+        lanes = np.flatnonzero(units > 0)
+        realized = np.zeros(self.n_lanes)
+        if not len(lanes):
+            return realized
+        price = np.broadcast_to(price, (self.n_lanes,))
+        quantity = units[lanes]
+        lot_cost = self._consume(tier, lanes, quantity)
+        if self.method == "average":
+            lot_cost = self.cost_basis[tier, lanes] * quantity / self.position[tier, lanes]
+        realized[lanes] = quantity * price[lanes] - lot_cost
+        self.position[tier, lanes] -= quantity
+        self.cost_basis[tier, lanes] = np.where(self.position[tier, lanes] > 1e-12, self.cost_basis[tier, lanes] - lot_cost, 0.0)
+        self._record(step, realized)
+        return realized
+
+    def close_all(self, step, mask, prices):
+        """Полная продажа всех уровней в дорожках mask по ценам prices (n_tiers, n_lanes)."""
+        lanes = np.flatnonzero(mask)
+        realized = np.zeros(self.n_lanes)
+        if not len(lanes):
+            return realized
+        realized[lanes] = (self.position[:, lanes] * prices[:, lanes] - self.cost_basis[:, lanes]).sum(axis=0)
+        self.remaining[:self.n_lots, lanes] = 0.0
+        self.first[:, lanes] = -1
+        self.last[:, lanes] = -1
+        self.position[:, lanes] = 0.0
+        self.cost_basis[:, lanes] = 0.0
+        self._record(step, realized)
+        return realized
+
+    def _record(self, step, realized):
+        self.realized_total += realized
+        self.realized.append((step, realized))
+
+    def unrealized(self, prices):
+        """Нереализованная прибыль по дорожкам при ценах prices (n_tiers, n_lanes)."""
+        return (self.position * prices - self.cost_basis).sum(axis=0)
+
+    def open_lots(self, lane=0, prices=None):
+        """Открытые лоты дорожки: DataFrame step, tier, units, price (+ unrealized при заданных ценах)."""
+        rows = np.flatnonzero(self.remaining[:self.n_lots, lane] > 0)
+        lots = pd.DataFrame({
+            "step": self.step[rows],
+            "tier": self.tier[rows, lane],
+            "units": self.remaining[rows, lane],
+            "price": self.price[rows, lane],
+        })
+        if prices is not None:
+            lots["unrealized"] = lots["units"] * (np.asarray(prices)[lots["tier"], lane] - lots["price"])
+        return lots
+
+    def realized_by_year(self, dates):
+        """Реализованная прибыль по календарным годам: DataFrame (год x дорожка)."""
+        years = pd.DatetimeIndex(dates).year
+        by_year = {}
+        for step, realized in self.realized:
+            year = years[step]
+            by_year[year] = by_year.get(year, 0.0) + realized
+        return pd.DataFrame.from_dict(by_year, orient="index", columns=range(self.n_lanes)).sort_index()
+
+
+def run_with_ledger(panel, weekly_investment, dropdown_1, dropdown_2, sell_threshold=None):
+    """Прогон стратегии по панели (panel.build_panel) с учётом лотов; возвращает (result, ledger).
+
+    Продажи стратегии - всегда полные (close_all), поэтому метод списания лотов на результат не влияет.
+    """
+    from engine import simulate_tiered
+
+    ledger = LotLedger()
+    result = simulate_tiered(panel["index_close"], panel["closes"], weekly_investment, dropdown_1, dropdown_2, sell_threshold,
+                             record_curves=False, ledger=ledger)
+    return result, ledger
+
+
+def print_lot_report(panel, result, ledger):
+    print("\n=== Lots ===")
+    by_year = ledger.realized_by_year(panel["dates"])
+    for year, realized in by_year[0].items():
+        print(f"Realized gain {year}: ${realized:.2f}")
+    print(f"Realized gain total: ${result['realized_gain'][0]:.2f}")
+    print(f"Unrealized gain: ${result['unrealized_gain'][0]:.2f}")
+    lots = ledger.open_lots(0, panel["closes"][:, -1:])
+    for tier, ticker in enumerate(panel["tickers"]):
+        tier_lots = lots[lots["tier"] == tier]
+        if len(tier_lots):
+            print(f"Open lots of {ticker}: {len(tier_lots)}, units {tier_lots['units'].sum():.2f}, unrealized ${tier_lots['unrealized'].sum():.2f}")
@@ -0,0 +1,147 @@
+# Метрики риска и доходности по кривым капитала за один векторный проход.
+# Вход - двумерные массивы (n_steps, n_lanes): стоимость портфеля (с кэшем) и взносы на каждом шаге,
+# как их пишет engine.simulate_tiered(record_curves=True). Все метрики считаются по столбцам сразу,
+# поэтому прогон сетки получает их для всех комбинаций без цикла на Python.
+# Экспозиция по уровням - средняя по шагам доля стоимости портфеля в позициях уровня k (кривые value_tier_k движка).
+#
+# Доходность шага очищена от взносов: r_t = (V_t - C_t) / V_{t-1} - 1 (шаги с V_{t-1} = 0 пропускаются).
+# По ней строится индекс благосостояния (time-weighted), от которого считаются просадки, ulcer index и Calmar.
+# Проценты - в процентах (как ROI/CAGR в sweep.score), коэффициенты - годовые.
+# StreamingMetrics считает те же метрики по кускам кривых (streaming.py) без хранения всей истории.
+
+import numpy as np
+
+from engine import N_TIERS, TIER_VALUE_KEYS
+
+METRICS = ("twr_cagr", "volatility", "sharpe", "sortino", "calmar", "ulcer_index", "twr_max_drawdown",
+           "time_in_drawdown", "best_period", "worst_period") + tuple(f"exposure_tier_{k + 1}" for k in range(N_TIERS))
+
+
+def period_returns(portfolio, contributions, previous=None):
+    """Доходности шагов без учёта взносов и маска шагов, где доходность определена.
+
+    previous - стоимость портфеля на шаге перед первой строкой (для продолжения по кускам), по умолчанию 0.
+    """
+    portfolio = np.asarray(portfolio, dtype=np.float64)
+    contributions = np.asarray(contributions, dtype=np.float64)
+    first = np.zeros((1, portfolio.shape[1])) if previous is None else np.asarray(previous, dtype=np.float64)[None, :]
+    previous = np.vstack([first, portfolio[:-1]])
+    valid = previous > 0
+    returns = np.divide(portfolio - contributions, previous, out=np.ones_like(portfolio), where=valid) - 1
+    return returns, valid
+
+
+class StreamingMetrics:
+    """Метрики, которые обновляются по кускам кривых (k, n_lanes) и не хранят сами кривые.
+
+    Среднее и дисперсия доходностей объединяются по кускам (Chan et al.), просадки считаются
+    от переносимых между кусками индекса благосостояния и его пика - результат совпадает с compute.
+    """
+
+    def __init__(self, n_lanes, periods_per_year=52, risk_free=0.0):
+        self.periods_per_year = periods_per_year
+        self.risk_free = risk_free
+        self.n_steps = 0
+        self.count = np.zeros(n_lanes, dtype=np.int64)
+        self.mean = np.zeros(n_lanes)
+        self.m2 = np.zeros(n_lanes)
+        self.downside_sq = np.zeros(n_lanes)
+        self.previous = np.zeros(n_lanes)
+        self.wealth = np.ones(n_lanes)
+        self.peak = np.ones(n_lanes)
+        self.max_drawdown = np.zeros(n_lanes)
+        self.drawdown_sq = np.zeros(n_lanes)
+        self.drawdown_steps = np.zeros(n_lanes, dtype=np.int64)
+        self.best = np.full(n_lanes, -np.inf)
+        self.worst = np.full(n_lanes, np.inf)
+        self.tier_shares = np.zeros((N_TIERS, n_lanes))
+        self.has_tiers = True
+
+    def update(self, portfolio, contributions, tier_values=None):
+        if not len(portfolio):
+            return self
+        returns, valid = period_returns(portfolio, contributions, self.previous)
+        excess = np.where(valid, returns - self.risk_free / self.periods_per_year, 0.0)
+        count = valid.sum(axis=0)
+        mean = excess.sum(axis=0) / np.maximum(count, 1)
+        m2 = (np.where(valid, excess - mean, 0.0) ** 2).sum(axis=0)
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / np.maximum(total, 1)
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / np.maximum(total, 1)
+        self.count = total
+        self.downside_sq += (np.minimum(excess, 0.0) ** 2).sum(axis=0)
+
+        wealth = self.wealth * np.cumprod(np.where(valid, 1 + returns, 1.0), axis=0)
+        peak = np.maximum(self.peak, np.maximum.accumulate(wealth, axis=0))
+        drawdown = 1 - wealth / peak
+        self.max_drawdown = np.maximum(self.max_drawdown, drawdown.max(axis=0))
+        self.drawdown_sq += (drawdown ** 2).sum(axis=0)
+        self.drawdown_steps += (drawdown > 0).sum(axis=0)
+        self.wealth, self.peak = wealth[-1], peak[-1]
+
+        self.best = np.maximum(self.best, np.where(valid, returns, -np.inf).max(axis=0))
+        self.worst = np.minimum(self.worst, np.where(valid, returns, np.inf).min(axis=0))
+        if tier_values is None:
+            self.has_tiers = False
+        else:
+            value = np.asarray(portfolio, dtype=np.float64)
+            for k in range(N_TIERS):
+                held = np.asarray(tier_values[k], dtype=np.float64)
+                self.tier_shares[k] += np.divide(held, value, out=np.zeros_like(value), where=value > 0).sum(axis=0)
+        self.previous = np.asarray(portfolio, dtype=np.float64)[-1].copy()
+        self.n_steps += len(portfolio)
+        return self
+
+    def result(self):
+        """Словарь метрик {имя: массив (n_lanes,)}."""
+        n_lanes = len(self.count)
+        active = self.count > 1
+        std = np.sqrt(self.m2 / np.maximum(self.count - 1, 1))
+        downside = np.sqrt(self.downside_sq / np.maximum(self.count, 1))
+        annual = np.sqrt(self.periods_per_year)
+        years = self.count / self.periods_per_year
+        cagr = np.where(active & (self.wealth > 0), self.wealth ** (1 / np.where(years > 0, years, 1.0)), 1.0) - 1
+        steps = max(self.n_steps, 1)
+        metrics = {
+            "twr_cagr": cagr * 100,
+            "volatility": std * annual * 100,
+            "sharpe": np.divide(self.mean, std, out=np.full(n_lanes, np.nan), where=active & (std > 0)) * annual,
+            "sortino": np.divide(self.mean, downside, out=np.full(n_lanes, np.nan), where=active & (downside > 0)) * annual,
+            "calmar": np.divide(cagr, self.max_drawdown, out=np.full(n_lanes, np.nan), where=active & (self.max_drawdown > 0)),
+            "ulcer_index": np.sqrt(self.drawdown_sq / steps) * 100,
+            "twr_max_drawdown": self.max_drawdown * 100,
+            "time_in_drawdown": self.drawdown_steps / steps * 100,
+            "best_period": np.where(self.count > 0, self.best, np.nan) * 100,
+            "worst_period": np.where(self.count > 0, self.worst, np.nan) * 100,
+        }
+        for k in range(N_TIERS):
+            metrics[f"exposure_tier_{k + 1}"] = self.tier_shares[k] / steps * 100 if self.has_tiers else np.full(n_lanes, np.nan)
+        return metrics
+
+
+def compute(portfolio, contributions, periods_per_year=52, tier_values=None, risk_free=0.0):
+    """Словарь метрик {имя: массив (n_lanes,)} для кривых (n_steps, n_lanes).
+
+    tier_values - стоимость позиций каждого уровня по шагам (N_TIERS кривых (n_steps, n_lanes), engine: value_tier_k);
+    exposure_tier_k - средняя по шагам доля стоимости портфеля в уровне k.
+    risk_free - годовая безрисковая ставка (доля) для Sharpe и Sortino.
+    """
+    portfolio = np.asarray(portfolio, dtype=np.float64)
+    streaming = StreamingMetrics(portfolio.shape[1], periods_per_year, risk_free)
+    return streaming.update(portfolio, contributions, tier_values).result()
+
+
+def from_result(result, periods_per_year=52, risk_free=0.0):
+    """Метрики по результату engine.simulate_tiered с record_curves=True."""
+    tier_values = [result[key] for key in TIER_VALUE_KEYS] if TIER_VALUE_KEYS[0] in result else None
+    return compute(result["portfolio_value"], result["contributions"], periods_per_year, tier_values, risk_free)
+
+
+def print_metrics(metrics, lane=0):
+    print(f"TWR CAGR: {metrics['twr_cagr'][lane]:.2f}%, Volatility: {metrics['volatility'][lane]:.2f}%")
+    print(f"Sharpe: {metrics['sharpe'][lane]:.2f}, Sortino: {metrics['sortino'][lane]:.2f}, Calmar: {metrics['calmar'][lane]:.2f}")
+    print(f"Ulcer Index: {metrics['ulcer_index'][lane]:.2f}, TWR Max Drawdown: {metrics['twr_max_drawdown'][lane]:.2f}%, "
+          f"Time in Drawdown: {metrics['time_in_drawdown'][lane]:.2f}%")
+    print(f"Best Period: {metrics['best_period'][lane]:.2f}%, Worst Period: {metrics['worst_period'][lane]:.2f}%")
+    print("Exposure by tier: " + ", ".join(f"{metrics[f'exposure_tier_{k + 1}'][lane]:.2f}%" for k in range(N_TIERS)))
@@ -0,0 +1,228 @@
+# Адаптивный поиск параметров тестируемой стратегии вместо полного перебора сетки x_matrix_test.py.
+# Методы:
+#   random  - случайные точки сетки;
+#   halving - successive halving: много кандидатов на коротком окне, лучшая 1/eta часть переходит
+#             на окно в eta раз длиннее, пока не останется полная история;
+#   tpe     - Tree-structured Parzen Estimator: кандидаты выбираются по отношению плотностей
+#             "хороших" и "плохих" уже посчитанных точек;
+#   grid    - полный перебор (эталон для сравнения).
+# Порядок кандидатов - как в is_better_combination (ROI, CAGR, меньшая просадка), либо любая функция
+# objective(row) -> число (больше - лучше). Бэктесты считаются пачками в пуле процессов.
+#
+# python optimizer.py 100 --start_date 2015-01-01 --end_date 2024-12-31 --ticker_1 QQQ --ticker_2 QLD --ticker_3 TQQQ --index QQQ --method tpe --budget 60 --sell_threshold 0.05 0.30 --workers 4
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import costs as cost_models
+import profiling
+from panel import build_panel, slice_panel
+from sweep import run_sweep, init_worker, worker_panel, pool_map
+
+DEFAULT_SPACE = {
+    "dropdown_1": (0.05, 0.50, 0.01),
+    "dropdown_2": (0.05, 0.50, 0.01),
+}
+
+
+def grid_values(space):
+    """Значения сетки для каждого параметра пространства {name: (low, high, step)}."""
+    return {name: np.round(np.arange(low, high + step / 2, step), 6) for name, (low, high, step) in space.items()}
+
+
+def to_combination(params):
+    """Параметры кандидата -> (dropdown_1, dropdown_2, sell_threshold) с dropdown_1 <= dropdown_2."""
+    d1, d2 = sorted((params["dropdown_1"], params["dropdown_2"]))
+    return (float(d1), float(d2), float(params["sell_threshold"]) if "sell_threshold" in params else None)
+
+
+def default_key(row):
+    """Ключ сортировки, эквивалентный is_better_combination."""
+    return (row["roi"], row["cagr"], -row["max_drawdown"])
+
+
+def _evaluate_chunk(combinations, weekly_investment, n_weeks):
+    scores, _ = run_sweep(slice_panel(worker_panel(), 0, n_weeks), weekly_investment, combinations)
+    return [{name: float(values[i]) for name, values in scores.items()} for i in range(len(combinations))]
+
+
+class Evaluator:
+    """Пачечная оценка комбинаций в пуле процессов с подсчётом количества бэктестов."""
+
+    def __init__(self, panel, weekly_investment, workers=1, objective=None):
+        self.panel = panel
+        self.weekly_investment = weekly_investment
+        self.workers = workers
+        self.key = objective or default_key
+        self.n_backtests = 0
+        self.cache = {}
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(panel,)) if workers > 1 else None
+        if self.executor is None:
+            init_worker(panel)
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown()
+
+    def evaluate(self, combinations, n_weeks=None):
+        """Метрики для списка комбинаций на первых n_weeks неделях (по умолчанию - вся панель)."""
+        n_weeks = n_weeks or len(self.panel["index_close"])
+        todo = [c for c in dict.fromkeys(combinations) if (c, n_weeks) not in self.cache]
+        if todo:
+            chunks = [todo[i::self.workers] for i in range(self.workers)] if self.executor else [todo]
+            chunks = [chunk for chunk in chunks if chunk]
+            results = pool_map(self.executor, _evaluate_chunk, chunks, [self.weekly_investment] * len(chunks), [n_weeks] * len(chunks))
+            for chunk, rows in zip(chunks, results):
+                for combination, row in zip(chunk, rows):
+                    self.cache[(combination, n_weeks)] = row
+            self.n_backtests += len(todo)
+        return [self.cache[(c, n_weeks)] for c in combinations]
+
+    def best(self, combinations, n_weeks=None):
+        rows = self.evaluate(combinations, n_weeks)
+        i = max(range(len(rows)), key=lambda j: self.key(rows[j]))
+        return combinations[i], rows[i]
+
+
+def _sample(values, n, rng):
+    names = list(values)
+    picks = [rng.choice(values[name], size=n) for name in names]
+    return [to_combination(dict(zip(names, point))) for point in zip(*picks)]
+
+
+def random_search(evaluator, space, budget, rng):
+    candidates = list(dict.fromkeys(_sample(grid_values(space), budget * 2, rng)))[:budget]
+    return evaluator.best(candidates)
+
+
+def successive_halving(evaluator, space, budget, rng, eta=3, min_weeks=26):
+    """Successive halving по всё более длинным окнам; budget - количество стартовых кандидатов."""
+    n_total = len(evaluator.panel["index_close"])
+    n_rungs = max(1, int(np.floor(np.log(max(n_total / min_weeks, 1)) / np.log(eta))) + 1)
+    candidates = list(dict.fromkeys(_sample(grid_values(space), budget * 2, rng)))[:budget]
+    for rung in range(n_rungs):
+        n_weeks = n_total if rung == n_rungs - 1 else int(n_total / eta ** (n_rungs - 1 - rung))
+        rows = evaluator.evaluate(candidates, n_weeks)
+        order = sorted(range(len(candidates)), key=lambda j: evaluator.key(rows[j]), reverse=True)
+        if rung == n_rungs - 1:
+            return candidates[order[0]], rows[order[0]]
+        candidates = [candidates[j] for j in order[:max(1, len(candidates) // eta)]]
+
+
+def _parzen(values, observed, bandwidth):
+    """Сглаженная плотность наблюдений на сетке значений (плюс равномерный prior)."""
+    weights = np.exp(-0.5 * ((values[:, None] - np.asarray(observed)[None, :]) / bandwidth) ** 2).sum(axis=1)
+    density = 0.9 * weights / weights.sum() + 0.1 / len(values)
+    return density / density.sum()
+
+
+def tpe_search(evaluator, space, budget, rng, n_startup=16, gamma=0.25, n_candidates=128, batch=8):
+    """TPE по дискретной сетке; по batch кандидатов за шаг, чтобы загрузить пул процессов."""
+    values = grid_values(space)
+    names = list(values)
+    evaluated = list(dict.fromkeys(_sample(values, n_startup * 2, rng)))[:n_startup]
+    rows = evaluator.evaluate(evaluated)
+    seen = set(evaluated)
+    while len(evaluated) < budget:
+        order = sorted(range(len(evaluated)), key=lambda j: evaluator.key(rows[j]), reverse=True)
+        n_good = max(1, int(np.ceil(gamma * len(order))))
+        good = [evaluated[j] for j in order[:n_good]]
+        bad = [evaluated[j] for j in order[n_good:]] or good
+
+        picks, log_ratio = [], np.zeros(n_candidates)
+        for k, name in enumerate(names):
+            grid = values[name]
+            bandwidth = max((grid[-1] - grid[0]) / 10, 1e-9)
+            good_density = _parzen(grid, [c[k] for c in good], bandwidth)
+            bad_density = _parzen(grid, [c[k] for c in bad], bandwidth)
+            chosen = rng.choice(len(grid), size=n_candidates, p=good_density)
+            picks.append(grid[chosen])
+            log_ratio += np.log(good_density[chosen]) - np.log(bad_density[chosen])
+
+        proposals = []
+        for i in np.argsort(-log_ratio):
+            combination = to_combination(dict(zip(names, (p[i] for p in picks))))
+            if combination not in seen:
+                seen.add(combination)
+                proposals.append(combination)
+            if len(proposals) >= min(batch, budget - len(evaluated)):
+                break
+        if not proposals:
+            break
+        evaluated += proposals
+        rows += evaluator.evaluate(proposals)
+
+    best = max(range(len(evaluated)), key=lambda j: evaluator.key(rows[j]))
+    return evaluated[best], rows[best]
+
+
+def grid_search(evaluator, space):
+    values = grid_values(space)
+    names = list(values)
+    mesh = np.meshgrid(*(values[name] for name in names), indexing='ij')
+    candidates = list(dict.fromkeys(to_combination(dict(zip(names, point))) for point in zip(*(m.ravel() for m in mesh))))
+    return evaluator.best(candidates)
+
+
+METHODS = {
+    "random": random_search,
+    "halving": successive_halving,
+    "tpe": tpe_search,
+}
+
+
+def optimize(panel, weekly_investment, method="tpe", budget=60, space=None, workers=1, objective=None, seed=0):
+    """Поиск лучшей комбинации. Возвращает (combination, metrics, количество бэктестов)."""
+    space = space or DEFAULT_SPACE
+    evaluator = Evaluator(panel, weekly_investment, workers, objective)
+    try:
+        if method == "grid":
+            combination, row = grid_search(evaluator, space)
+        else:
+            combination, row = METHODS[method](evaluator, space, budget, np.random.default_rng(seed))
+    finally:
+        evaluator.close()
+    return combination, row, evaluator.n_backtests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adaptive parameter search for the test strategy")
+    parser.add_argument("weekly_investment", type=float, help="Weekly investment in dollars")
+    parser.add_argument("--start_date", type=str, required=True, help="Start date (YYYY-MM-DD)")
+    parser.add_argument("--end_date", type=str, default=datetime.now().strftime("%Y-%m-%d"), help="End date (YYYY-MM-DD)")
+    parser.add_argument("--ticker_1", type=str, required=True, help="Main ticker (e.g., QQQ)")
+    parser.add_argument("--ticker_2", type=str, required=True, help="Ticker for 10% dropdown (e.g., QLD)")
+    parser.add_argument("--ticker_3", type=str, help="Ticker for 20% dropdown (e.g., TQQQ)")
+    parser.add_argument("--index", type=str, required=True, help="Base ticker for drawdown (e.g., QQQ)")
+    parser.add_argument("--method", choices=["random", "halving", "tpe", "grid"], default="tpe", help="Search method")
+    parser.add_argument("--budget", type=int, default=60, help="Backtests for random/tpe, initial candidates for halving")
+    parser.add_argument("--dropdown_range", type=float, nargs=3, default=[0.05, 0.50, 0.01], metavar=("LOW", "HIGH", "STEP"), help="Dropdown search range")
+    parser.add_argument("--sell_threshold", type=float, nargs=2, metavar=("LOW", "HIGH"), help="Also search sell_threshold in this range (step 0.01)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    cost_models.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.ticker_3 is None:
+        args.ticker_3 = args.ticker_2
+
+    space = {"dropdown_1": tuple(args.dropdown_range), "dropdown_2": tuple(args.dropdown_range)}
+    if args.sell_threshold:
+        space["sell_threshold"] = (args.sell_threshold[0], args.sell_threshold[1], 0.01)
+
+    def run():
+        panel = build_panel(args.index, args.ticker_1, args.ticker_2, args.ticker_3, args.start_date, args.end_date, cost_models.from_args(args))
+        return optimize(panel, args.weekly_investment, args.method, args.budget, space, args.workers, seed=args.seed)
+
+    (dropdown_1, dropdown_2, sell_threshold), row, n_backtests = profiling.run_profiled(run, args)
+    print(f"Best ROI: {row['roi']:.2f}%, Best CAGR: {row['cagr']:.2f}%, Min Max Drawdown: {row['max_drawdown']:.2f}% "
+          f"with dropdown_1={dropdown_1}, dropdown_2={dropdown_2}, sell_threshold={sell_threshold}")
+    print(f"Backtests: {n_backtests}")
+
+
+if __name__ == "__main__":
+    main()
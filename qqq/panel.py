@@ -0,0 +1,92 @@
+# Выровненная недельная панель цен для пакетных прогонов (engine.simulate_tiered).
+# Данные загружаются один раз через investing.load_data и выравниваются так же, как в apply_test_strategy:
+# индекс выравнивается по сессиям биржи (trading_calendar.align_to_sessions), цены тикеров подклеиваются left-merge,
+# затем для каждой пятницы берётся последний торговый день не позже неё.
+# Для взносов не в долларах (currency) к датам панели подбирается курс валюты (fx.align) - panel["fx"] для engine.
+
+import numpy as np
+import pandas as pd
+
+import fx as fx_rates
+import profiling
+import schedules
+import trading_calendar
+from investing import load_data
+
+
+def build_daily_frame(index, tickers, start_date, end_date, basis="close"):
+    """Дневной DataFrame: Date, Close (индекс) и Close_<ticker> для каждого тикера (и Volume/Volume_<ticker>, если есть).
+
+    basis - база цены (adjustments.BASES): close из CSV кэша или ряды с поправкой на сплиты и дивиденды.
+    """
+    data_index = load_data(index, start_date, end_date, basis)
+    data = trading_calendar.align_to_sessions(data_index)
+    for ticker in dict.fromkeys(tickers):
+        data_ticker = load_data(ticker, start_date, end_date, basis).drop_duplicates(subset=['Date'])
+        columns = [column for column in ('Close', 'Volume') if column in data_ticker.columns]
+        data = data.merge(data_ticker[['Date'] + columns].rename(columns={column: f'{column}_{ticker}' for column in columns}),
+                          on="Date", how="left")
+    return data
+
+
+def weekly_positions(dates, end_date, freq=schedules.DEFAULT_RULE, roll=None):
+    """Позиции торговых дней расписания (schedules.positions) от первой даты до end_date."""
+    return schedules.positions(dates, freq, end=end_date, roll=roll)
+
+
+def build_panel(index, ticker_1, ticker_2, ticker_3, start_date, end_date, costs=None, schedule=schedules.DEFAULT_RULE, roll=None, basis="close",
+                currency=fx_rates.BASE_CURRENCY):
+    """Недельная панель: даты, цена индекса и цены трёх уровней в формате engine.
+
+    ticker_1 торгуется по цене индекса, как в apply_test_strategy.
+    costs - модель издержек (costs.cost_model), которую run_sweep передаёт в engine вместе с объёмами.
+    schedule/roll - правило дат взносов (schedules.py); шаг панели - одна дата расписания.
+    basis - база цены (adjustments.py).
+    currency - валюта взносов: panel["fx"] - курс (долларов за единицу) на каждую дату панели, None для USD.
+    """
+    with profiling.phase("alignment"):
+        daily = build_daily_frame(index, [ticker_2, ticker_3], start_date, end_date, basis)
+        positions = weekly_positions(daily['Date'], pd.to_datetime(end_date), schedule, roll)
+        weekly = daily.iloc[positions]
+        fx = None
+        if not fx_rates.is_base(currency):
+            fx = fx_rates.align(weekly['Date'], fx_rates.load_rates(currency, start_date, end_date))
+    index_close = weekly['Close'].to_numpy(dtype=np.float64)
+    closes = np.stack([
+        index_close,
+        weekly[f'Close_{ticker_2}'].to_numpy(dtype=np.float64),
+        weekly[f'Close_{ticker_3}'].to_numpy(dtype=np.float64),
+    ])
+    volume_columns = ['Volume', f'Volume_{ticker_2}', f'Volume_{ticker_3}']
+    volumes = None
+    if all(column in weekly.columns for column in volume_columns):
+        volumes = np.stack([weekly[column].to_numpy(dtype=np.float64) for column in volume_columns])
+    return {
+        "tickers": (ticker_1, ticker_2, ticker_3),
+        "index": index,
+        "dates": weekly['Date'].to_numpy(),
+        "index_close": index_close,
+        "closes": closes,
+        "volumes": volumes,
+        "costs": costs,
+        "currency": currency.upper(),
+        "fx": fx,
+        "periods_per_year": schedules.periods_per_year(schedule),
+        # Исторический максимум индекса до каждой недели (включительно) - общий префикс для всех окон
+        "peak": np.maximum.accumulate(index_close),
+        "prior_peak": 0.0,
+    }
+
+
+def slice_panel(panel, begin, end):
+    """Срез панели по неделям [begin, end) без копирования массивов."""
+    return {
+        **panel,
+        "dates": panel["dates"][begin:end],
+        "index_close": panel["index_close"][begin:end],
+        "closes": panel["closes"][:, begin:end],
+        "volumes": panel["volumes"][:, begin:end] if panel.get("volumes") is not None else None,
+        "fx": panel["fx"][begin:end] if panel.get("fx") is not None else None,
+        "peak": panel["peak"][begin:end],
+        "prior_peak": panel["peak"][begin - 1] if begin > 0 else panel["prior_peak"],
+    }
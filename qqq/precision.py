@@ -0,0 +1,146 @@
+# Компактный режим движка (simulate_tiered(precision="compact")) и сверка с float64.
+#
+# Что меняется:
+#   - цены (index_close, tier_closes) хранятся во float32 - самый большой массив (3 x шаги x пути) вдвое меньше;
+#   - доли (units) во float32: это целые числа, они точны до 2**24 (16.7 млн бумаг на дорожку);
+#   - кривые (record_curves) во float32;
+#   - остаток cash дополнительно отдаётся в целых центах (result["cash_cents"], int64);
+#   - в scenarios.py синтетические пути накапливаются во float32 (scenarios.weekly_paths).
+# Память main измеряет (пик tracemalloc за прогон чанков scenarios.run_scenarios), а не оценивает.
+# Арифметика сделок, cash, вложения и стоимость портфеля остаются во float64: это векторы длины n_lanes,
+# памяти они почти не занимают, а точность денег важнее. Округление cash до центов на каждой операции
+# было проверено и отклонено: правило "пополнить до суммы, кратной цене, и купить целые бумаги" стоит
+# ровно на границе floor(amount / price), и любое округление денег систематически меняет число бумаг.
+#
+# Границы погрешности относительно float64 (проверяет verify):
+#   1. На одних и тех же входах (цены, округлённые до float32) компактный прогон совпадает с float64
+#      бит в бит: решения, доли, cash, стоимость и просадка. Исключение - дорожки, где доли
+#      доходят до 2**24 (units_limit_lanes): там доли во float32 округляются.
+#   2. Кривые во float32 отличаются от float64 не больше чем на 2**-24 относительно (CURVE_BOUND).
+#   3. Округление самих цен до float32 (относительно не больше 2**-24 ~ 6e-8) - это возмущение входа.
+#      Стратегия к нему чувствительна так же, как к любому шуму float64: на "лезвии" floor(amount / price)
+#      число купленных бумаг меняется на одну. verify показывает число таких дорожек и сдвиг перцентилей
+#      итоговой стоимости - это свойство правила покупки целых бумаг, а не ошибка режима.
+#
+# python precision.py 100 --paths 20000 --years 20 --dropdown_1 0.10 --dropdown_2 0.20 --sell_threshold 0.10
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from engine import PRECISIONS, simulate_tiered
+
+UNITS_LIMIT = 2 ** 24
+CURVE_BOUND = 2.0 ** -24
+PERCENTILES = (5, 50, 95)
+EXACT_KEYS = ("units", "n_sells", "cash_balance", "total_invested", "final_value", "max_drawdown")
+
+
+def peak_memory(function, *args, **kwargs):
+    """Пик памяти в байтах, выделенной за вызов function (tracemalloc учитывает и буферы NumPy)."""
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def compare(reference, compact):
+    """Сверка компактного прогона с float64 на тех же (округлённых до float32) ценах."""
+    in_limit = np.asarray(reference["units"]).max(axis=0) < UNITS_LIMIT
+    mismatch = np.zeros(len(in_limit), dtype=bool)
+    for key in EXACT_KEYS:
+        values = np.asarray(reference[key], dtype=np.float64)
+        mismatch |= np.any(values != np.asarray(compact[key], dtype=np.float64), axis=0) if values.ndim > 1 else values != compact[key]
+    report = {
+        "n_lanes": len(in_limit),
+        "units_limit_lanes": int((~in_limit).sum()),
+        "exact_mismatch": int((mismatch & in_limit).sum()),
+    }
+    if "portfolio_value" in reference and "portfolio_value" in compact:
+        curve = reference["portfolio_value"][:, in_limit]
+        error = np.abs(compact["portfolio_value"][:, in_limit] - curve) / np.where(curve != 0, np.abs(curve), 1.0)
+        report["max_curve_error"] = float(error.max(initial=0.0))
+    return report
+
+
+def sensitivity(reference, compact):
+    """Влияние округления цен до float32: дорожки с другим числом бумаг и сдвиг перцентилей итоговой стоимости."""
+    changed = np.any(reference["units"] != compact["units"], axis=0) | (reference["n_sells"] != compact["n_sells"])
+    base = np.percentile(reference["final_value"], PERCENTILES)
+    shifted = np.percentile(compact["final_value"], PERCENTILES)
+    return {"changed_lanes": int(changed.sum()), "percentile_shift": dict(zip(PERCENTILES, shifted / base - 1))}
+
+
+def within_bounds(report):
+    return report["exact_mismatch"] == 0 and report.get("max_curve_error", 0.0) <= CURVE_BOUND
+
+
+def verify(index_close, tier_closes, weekly_investment, dropdown_1, dropdown_2, sell_threshold=None, costs=None, volumes=None):
+    """Прогоны float64 на исходных ценах, float64 на ценах float32 и compact.
+
+    Возвращает (compare - точность режима, sensitivity - влияние округления цен, время float64, время compact).
+    """
+    run = lambda closes, index, **options: simulate_tiered(index, closes, weekly_investment, dropdown_1, dropdown_2, sell_threshold,
+                                                           costs=costs, volumes=volumes, **options)
+    started = time.perf_counter()
+    reference = run(tier_closes, index_close)
+    reference_time = time.perf_counter() - started
+    started = time.perf_counter()
+    compact = run(tier_closes, index_close, precision="compact")
+    compact_time = time.perf_counter() - started
+    rounded = run(np.asarray(tier_closes, dtype=np.float32).astype(np.float64), np.asarray(index_close, dtype=np.float32).astype(np.float64))
+    return compare(rounded, compact), sensitivity(reference, compact), reference_time, compact_time
+
+
+def main():
+    from scenarios import TRADING_DAYS_PER_YEAR, load_daily_returns, run_scenarios, stationary_bootstrap_indices, weekly_paths
+
+    parser = argparse.ArgumentParser(description="Compare the compact (float32) engine mode against float64")
+    parser.add_argument("weekly_investment", type=float, help="Weekly investment in dollars")
+    parser.add_argument("--dropdown_1", type=float, default=0.10, help="First drawdown level")
+    parser.add_argument("--dropdown_2", type=float, default=0.20, help="Second drawdown level")
+    parser.add_argument("--sell_threshold", type=float, help="Threshold for selling all assets")
+    parser.add_argument("--paths", type=int, default=2000, help="Number of bootstrap paths")
+    parser.add_argument("--years", type=int, default=20, help="Length of each path in years")
+    parser.add_argument("--index", type=str, help="Bootstrap from this ticker's history (default: synthetic normal returns)")
+    parser.add_argument("--start_date", type=str, default="2000-01-01", help="Start of the history used with --index")
+    parser.add_argument("--end_date", type=str, default="2024-12-31", help="End of the history used with --index")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--chunk", type=int, default=1000, help="Paths per chunk of scenarios.run_scenarios for the memory measurement")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.index:
+        returns = load_daily_returns(args.index, args.start_date, args.end_date)
+    else:
+        returns = rng.normal(0.0005, 0.015, 6000)
+    indices = stationary_bootstrap_indices(len(returns), args.paths, args.years * TRADING_DAYS_PER_YEAR, 20, rng)
+    closes = weekly_paths(returns, indices, start_price=args.weekly_investment / 10)
+    del indices
+    report, shift, reference_time, compact_time = verify(closes[0], closes, args.weekly_investment, args.dropdown_1,
+                                                         args.dropdown_2, args.sell_threshold)
+
+    n_steps = closes.shape[1]
+    print(f"Lanes: {report['n_lanes']}, steps: {n_steps}")
+    memory = {precision: peak_memory(run_scenarios, returns, args.weekly_investment, args.dropdown_1, args.dropdown_2, args.sell_threshold,
+                                     n_paths=args.paths, years=args.years, chunk_size=args.chunk, seed=args.seed, precision=precision)
+              for precision in PRECISIONS}
+    print(f"Peak memory of scenarios ({min(args.chunk, args.paths)} paths per chunk): float64 {memory['float64'] / 2 ** 20:.1f} MiB, "
+          f"compact {memory['compact'] / 2 ** 20:.1f} MiB")
+    print(f"Time: float64 {reference_time:.2f}s, compact {compact_time:.2f}s")
+    print(f"Same inputs: {report['exact_mismatch']} lanes differ from float64, "
+          f"{report['units_limit_lanes']} lanes reach 2**24 units, max curve error {report['max_curve_error']:.2e} (bound {CURVE_BOUND:.2e})")
+    print(f"Price rounding: {shift['changed_lanes']} lanes buy a different number of shares, percentile shift "
+          + ", ".join(f"p{p}: {value * 100:+.3f}%" for p, value in shift["percentile_shift"].items()))
+    ok = within_bounds(report)
+    print("Within bounds" if ok else "Bounds exceeded")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
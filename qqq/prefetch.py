@@ -0,0 +1,194 @@
+# Параллельная предзагрузка кэша цен (CSV investing.load_data) для списка тикеров перед большим прогоном.
+# Тикеры загружаются пулом потоков ограниченного размера (--workers), неудачные попытки повторяются
+# с экспоненциальной паузой (--retries, --backoff). Каждый файл пишется во временный файл, проверяется
+# (строки есть, число строк после чтения совпадает с записанным, даты строго возрастают) и только потом
+# переименовывается в имя кэша (os.replace) - прерванная загрузка не оставляет недописанных CSV.
+# Уже существующие корректные файлы кэша пропускаются (--force - загрузить заново).
+# --local <каталог> подменяет yfinance локальными CSV (<TICKER>.csv или файлы кэша <TICKER>_*.csv),
+# --fail_rate добавляет случайные сбои - так проверяются повторы и атомарность без сети.
+#
+# python prefetch.py QQQ QLD TQQQ SPY --start_date 2000-01-01 --end_date 2024-12-31 --workers 8
+# python prefetch.py --universe universe.txt --start_date 2015-01-01 --end_date 2024-12-31 --local data --fail_rate 0.3
+
+import argparse
+import glob
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from investing import cache_file_name, download_data, save_data
+
+DEFAULT_WORKERS = 8
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+
+
+def yfinance_provider(ticker, start_date, end_date):
+    return download_data(ticker, start_date, end_date)
+
+
+class LocalProvider:
+    """Поставщик цен из локальных CSV вместо yfinance; fail_rate - доля запросов, которые падают с ConnectionError."""
+
+    def __init__(self, directory, fail_rate=0.0, delay=0.0, seed=0):
+        self.directory = directory
+        self.fail_rate = fail_rate
+        self.delay = delay
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def source(self, ticker):
+        path = os.path.join(self.directory, f"{ticker}.csv")
+        if os.path.exists(path):
+            return path
+        matches = sorted(glob.glob(os.path.join(glob.escape(self.directory), f"{glob.escape(ticker)}_*.csv")))
+        if not matches:
+            raise FileNotFoundError(f"No local data for {ticker} in {self.directory}")
+        return matches[0]
+
+    def __call__(self, ticker, start_date, end_date):
+        if self.delay:
+            time.sleep(self.delay)
+        with self.lock:
+            failed = self.rng.random() < self.fail_rate
+        if failed:
+            raise ConnectionError(f"Simulated provider failure for {ticker}")
+        data = pd.read_csv(self.source(ticker))
+        data['Date'] = pd.to_datetime(data['Date'])
+        data = data[(data['Date'] >= pd.Timestamp(start_date)) & (data['Date'] <= pd.Timestamp(end_date))]
+        return data[['Date'] + [column for column in ('Close', 'Volume') if column in data.columns]].reset_index(drop=True)
+
+
+def read_universe(path):
+    """Тикеры из файла: через пробел, запятую или по одному в строке; # - комментарий."""
+    tickers = []
+    with open(path, 'r') as f:
+        for line in f:
+            tickers += line.split('#', 1)[0].replace(',', ' ').split()
+    return tickers
+
+
+def check_frame(data, ticker):
+    """Проверка цен перед записью: строки есть, Date и Close на месте, даты строго возрастают."""
+    if data is None or len(data) == 0:
+        raise ValueError(f"No rows for {ticker}")
+    if 'Date' not in data.columns or 'Close' not in data.columns:
+        raise ValueError(f"Data for {ticker} needs Date and Close columns")
+    dates = pd.to_datetime(data['Date'])
+    if not (dates.is_monotonic_increasing and dates.is_unique):
+        raise ValueError(f"Dates for {ticker} are not strictly increasing")
+
+
+def check_file(path, ticker, n_rows=None):
+    """Проверка CSV кэша: читается, даты строго возрастают и (если задано) строк ровно n_rows. Возвращает число строк."""
+    data = pd.read_csv(path)
+    check_frame(data, ticker)
+    if n_rows is not None and len(data) != n_rows:
+        raise ValueError(f"{path}: {len(data)} rows on disk, {n_rows} written")
+    return len(data)
+
+
+def fetch(ticker, start_date, end_date, provider=yfinance_provider, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, force=False):
+    """Загрузка одного тикера в кэш. Возвращает словарь: status (fetched/cached/failed), rows, bytes, attempts, error."""
+    cache_file = cache_file_name(ticker, start_date, end_date)
+    result = {"ticker": ticker, "file": cache_file, "status": "failed", "rows": 0, "bytes": 0, "attempts": 0, "error": None}
+    if not force and os.path.exists(cache_file):
+        try:
+            result.update(status="cached", rows=check_file(cache_file, ticker), bytes=os.path.getsize(cache_file))
+            return result
+        except (ValueError, OSError, pd.errors.ParserError) as error:
+            # Повреждённый файл (например, записанный до атомарной записи) загружается заново
+            result["error"] = f"Invalid cache file, refetching: {error}"
+    for attempt in range(retries + 1):
+        result["attempts"] = attempt + 1
+        try:
+            data = provider(ticker, start_date, end_date)
+            check_frame(data, ticker)
+            save_data(data, cache_file, verify=lambda tmp_file: check_file(tmp_file, ticker, len(data)))
+            result.update(status="fetched", rows=len(data), bytes=os.path.getsize(cache_file), error=None)
+            return result
+        except Exception as error:
+            result["error"] = f"{type(error).__name__}: {error}"
+            if attempt < retries:
+                time.sleep(backoff * 2 ** attempt)
+    return result
+
+
+def prefetch(tickers, start_date, end_date, provider=yfinance_provider, workers=DEFAULT_WORKERS, retries=DEFAULT_RETRIES,
+             backoff=DEFAULT_BACKOFF, force=False, progress=None):
+    """Параллельная загрузка тикеров. Возвращает (результаты fetch по тикерам в исходном порядке, сводка).
+
+    progress(result) вызывается по мере завершения тикеров.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    started = time.perf_counter()
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(fetch, ticker, start_date, end_date, provider, retries, backoff, force): ticker for ticker in tickers}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            if progress is not None:
+                progress(result)
+    elapsed = time.perf_counter() - started
+    results = [results[ticker] for ticker in tickers]
+    fetched = [result for result in results if result["status"] == "fetched"]
+    summary = {
+        "tickers": len(results),
+        "fetched": len(fetched),
+        "cached": sum(result["status"] == "cached" for result in results),
+        "failed": sum(result["status"] == "failed" for result in results),
+        "retries": sum(max(result["attempts"] - 1, 0) for result in results),
+        "rows": sum(result["rows"] for result in fetched),
+        "bytes": sum(result["bytes"] for result in fetched),
+        "elapsed": elapsed,
+    }
+    summary["tickers_per_second"] = summary["fetched"] / elapsed if elapsed > 0 else 0.0
+    summary["rows_per_second"] = summary["rows"] / elapsed if elapsed > 0 else 0.0
+    return results, summary
+
+
+def print_summary(summary):
+    print(f"Tickers: {summary['tickers']}, fetched: {summary['fetched']}, cached: {summary['cached']}, "
+          f"failed: {summary['failed']}, retries: {summary['retries']}")
+    print(f"Rows: {summary['rows']}, size: {summary['bytes'] / 2 ** 20:.2f} MiB, time: {summary['elapsed']:.2f}s")
+    print(f"Throughput: {summary['tickers_per_second']:.2f} tickers/s, {summary['rows_per_second']:.0f} rows/s, "
+          f"{summary['bytes'] / 2 ** 20 / summary['elapsed'] if summary['elapsed'] > 0 else 0.0:.2f} MiB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the price cache for a ticker universe in parallel")
+    parser.add_argument("tickers", type=str, nargs="*", help="Tickers to fetch (e.g., QQQ QLD TQQQ)")
+    parser.add_argument("--universe", type=str, help="File with tickers (whitespace, comma or line separated; # comments)")
+    parser.add_argument("--start_date", type=str, required=True, help="Start date (YYYY-MM-DD)")
+    parser.add_argument("--end_date", type=str, required=True, help="End date (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Parallel downloads")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="Retries per ticker after a failed attempt")
+    parser.add_argument("--backoff", type=float, default=DEFAULT_BACKOFF, help="First retry delay in seconds, doubled on each retry")
+    parser.add_argument("--force", action="store_true", help="Fetch again even if a valid cache file exists")
+    parser.add_argument("--local", type=str, help="Read prices from CSV files in this directory instead of yfinance")
+    parser.add_argument("--fail_rate", type=float, default=0.0, help="Share of failing requests of the --local provider")
+    args = parser.parse_args()
+
+    tickers = args.tickers + (read_universe(args.universe) if args.universe else [])
+    if not tickers:
+        parser.error("no tickers: pass them as arguments or with --universe")
+    provider = LocalProvider(args.local, args.fail_rate) if args.local else yfinance_provider
+
+    def report(result):
+        detail = f"{result['rows']} rows" if result["status"] != "failed" else result["error"]
+        print(f"{result['ticker']}: {result['status']} ({detail}, attempts: {result['attempts']})")
+
+    _, summary = prefetch(tickers, args.start_date, args.end_date, provider, args.workers, args.retries, args.backoff,
+                                args.force, progress=report)
+    print_summary(summary)
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Хранилище баров на диске с отображением в память (минутные, часовые, дневные).
+# Раскладка: <root>/<TICKER>/<interval>/time.npy (int64, наносекунды биржевого времени без таймзоны)
+# и open/high/low/close/volume.npy (float64) плюс meta.json (число строк, первая и последняя метка).
+# Дополнительные колонки (например, поправки на сплиты и дивиденды из adjustments.py) лежат рядом
+# в <колонка>.npy и перечислены в meta.json ("columns").
+# Колонки читаются через np.load(mmap_mode='r'): срез по времени - searchsorted по time и вид на файл,
+# поэтому годы минутных баров (миллионы строк) не загружаются в память целиком.
+# Запись сливает новые бары с сохранёнными (при совпадении метки побеждает новый бар) и атомарна
+# для каждого файла (временный файл + os.replace, meta.json - последним).
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_ROOT = "price_store"
+COLUMNS = ("open", "high", "low", "close", "volume")
+EXCHANGE_TZ = "America/New_York"
+META_KEYS = ("ticker", "interval", "n_rows", "first", "last", "columns")
+
+
+def _save(path, array):
+    tmp_file = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_file, array)
+    os.replace(tmp_file, path)
+
+
+def bars_from_frame(frame):
+    """Колонки баров из DataFrame (индекс или колонка Datetime/Date; Open/High/Low/Close/Volume в любом регистре)."""
+    frame = frame.copy()
+    if isinstance(frame.columns, pd.MultiIndex):
+        frame.columns = frame.columns.get_level_values(0)
+    for column in ("Datetime", "Date", "datetime", "date", "time"):
+        if column in frame.columns:
+            frame = frame.set_index(column)
+            break
+    index = pd.DatetimeIndex(frame.index)
+    if index.tz is not None:
+        index = index.tz_convert(EXCHANGE_TZ).tz_localize(None)
+    columns = {column.lower(): column for column in frame.columns}
+    if "close" not in columns:
+        raise ValueError("Bars need at least a Close column")
+    close = frame[columns["close"]].to_numpy(dtype=np.float64)
+    bars = {"time": index.values.astype("datetime64[ns]").astype(np.int64)}
+    for name in COLUMNS:
+        bars[name] = frame[columns[name]].to_numpy(dtype=np.float64) if name in columns else (
+            np.zeros(len(frame)) if name == "volume" else close)
+    return bars
+
+
+class PriceStore:
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+
+    def path(self, ticker, interval):
+        return os.path.join(self.root, ticker, interval)
+
+    def exists(self, ticker, interval):
+        return os.path.exists(os.path.join(self.path(ticker, interval), "meta.json"))
+
+    def meta(self, ticker, interval):
+        with open(os.path.join(self.path(ticker, interval), "meta.json"), 'r') as f:
+            return json.load(f)
+
+    def tickers(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def columns(self, ticker, interval):
+        """Колонки значений записи: COLUMNS и дополнительные (например, поправки adjustments.py)."""
+        return tuple(self.meta(ticker, interval).get("columns", COLUMNS))
+
+    def write(self, ticker, interval, bars, replace=False, meta=None):
+        """Слияние баров (словарь колонок или DataFrame) с сохранёнными; возвращает число строк после записи.
+
+        replace=True - записать только переданные бары, без слияния (починка в integrity.py).
+        Ключи словаря сверх COLUMNS сохраняются как дополнительные колонки (при слиянии недостающие значения - NaN),
+        meta - дополнительные поля meta.json (сохраняются при следующих записях).
+        """
+        if isinstance(bars, pd.DataFrame):
+            bars = bars_from_frame(bars)
+        elif np.issubdtype(np.asarray(bars["time"]).dtype, np.datetime64):
+            bars = {**bars, "time": np.asarray(bars["time"]).astype("datetime64[ns]").astype(np.int64)}
+        columns = COLUMNS + tuple(name for name in bars if name != "time" and name not in COLUMNS)
+        extra_meta = dict(meta or {})
+        if self.exists(ticker, interval):
+            stored_meta = self.meta(ticker, interval)
+            extra_meta = {**{key: value for key, value in stored_meta.items() if key not in META_KEYS}, **extra_meta}
+        if not replace and self.exists(ticker, interval):
+            stored = self.load(ticker, interval)
+            columns += tuple(name for name in stored if name != "time" and name not in columns)
+            fill = lambda part, name: np.asarray(part[name]) if name in part else np.full(len(part["time"]), np.nan)
+            bars = {name: np.concatenate([fill(stored, name), fill(bars, name)]) for name in ("time",) + columns}
+        # Сортировка с сохранением порядка: из повторяющихся меток остаётся последняя (новая) строка
+        order = np.argsort(bars["time"], kind='stable')
+        time = bars["time"][order]
+        keep = np.append(time[1:] != time[:-1], True)
+        directory = self.path(ticker, interval)
+        os.makedirs(directory, exist_ok=True)
+        for name in ("time",) + columns:
+            _save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(np.asarray(bars[name])[order][keep]))
+        n_rows = int(keep.sum())
+        meta = {"ticker": ticker, "interval": interval, "n_rows": n_rows,
+                "first": str(pd.Timestamp(time[keep][0])) if n_rows else None,
+                "last": str(pd.Timestamp(time[keep][-1])) if n_rows else None,
+                "columns": list(columns), **extra_meta}
+        meta_file = os.path.join(directory, "meta.json")
+        with open(f"{meta_file}.{os.getpid()}.tmp", 'w') as f:
+            json.dump(meta, f)
+        os.replace(f"{meta_file}.{os.getpid()}.tmp", meta_file)
+        return n_rows
+
+    def load(self, ticker, interval, start=None, end=None):
+        """Колонки баров в [start, end] как виды на отображённые в память файлы ({"time": int64 ns, "close": ...})."""
+        directory = self.path(ticker, interval)
+        if not self.exists(ticker, interval):
+            raise FileNotFoundError(f"No {interval} bars for {ticker} in {self.root}")
+        time = np.load(os.path.join(directory, "time.npy"), mmap_mode='r')
+        begin = 0 if start is None else int(np.searchsorted(time, pd.Timestamp(start).value, side='left'))
+        stop = len(time) if end is None else int(np.searchsorted(time, _end_of(end), side='right'))
+        bars = {"time": time[begin:stop]}
+        for name in self.columns(ticker, interval):
+            bars[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')[begin:stop]
+        return bars
+
+    def download(self, ticker, interval, start=None, end=None, period=None):
+        """Загрузка баров yfinance в хранилище (1m доступны примерно за 30 дней, 60m - за 730)."""
+        import yfinance as yf
+
+        data = yf.download(ticker, start=start, end=end, period=period, interval=interval, progress=False, auto_adjust=False)
+        if data is None or data.empty:
+            raise ValueError(f"No {interval} bars downloaded for {ticker}")
+        return self.write(ticker, interval, data)
+
+
+def _end_of(end):
+    """Дата без времени в end означает весь день включительно."""
+    end = pd.Timestamp(end)
+    if end == end.normalize():
+        return (end + pd.Timedelta(days=1)).value - 1
+    return end.value
@@ -0,0 +1,164 @@
+# Замер времени по фазам прогона стратегии: wall, CPU и пик памяти (tracemalloc) для каждой фазы.
+# Фазы вкладываются друг в друга (load_data -> download/csv_parse, test_strategy -> alignment/report),
+# для каждой считается и полное время, и "собственное" - без вложенных фаз.
+# profiling.phase(name) ничего не делает, пока профилировщик не запущен, поэтому его можно
+# оставлять в горячем коде. Сводка выводится в JSON; cProfile включается отдельно.
+
+import cProfile
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+_ACTIVE = None
+
+
+class PhaseTimer:
+    """Накопитель времени и памяти по фазам."""
+
+    def __init__(self, memory=True, cprofile=False):
+        self.memory = memory
+        self.phases = {}
+        self._stack = []
+        self._started_tracing = False
+        self.profile = cProfile.Profile() if cprofile else None
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.profile:
+            self.profile.enable()
+
+    def stop(self):
+        if self.profile:
+            self.profile.disable()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _record(self, name):
+        return self.phases.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "self_wall": 0.0, "peak_memory": 0})
+
+    @contextmanager
+    def phase(self, name):
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+        frame = {"children_wall": 0.0, "peak": 0, "base": current if tracing else 0}
+        self._stack.append(frame)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            self._stack.pop()
+            record = self._record(name)
+            record["calls"] += 1
+            record["wall"] += wall
+            record["cpu"] += cpu
+            record["self_wall"] += wall - frame["children_wall"]
+            if tracing:
+                peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                record["peak_memory"] = max(record["peak_memory"], peak - frame["base"])
+                if self._stack:
+                    self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+            if self._stack:
+                self._stack[-1]["children_wall"] += wall
+
+    def merge(self, summary):
+        """Добавляет сводку другого процесса (например, воркера пула)."""
+        for name, other in summary.items():
+            record = self._record(name)
+            for key in ("calls", "wall", "cpu", "self_wall"):
+                record[key] += other[key]
+            record["peak_memory"] = max(record["peak_memory"], other["peak_memory"])
+
+    def summary(self):
+        return {name: dict(record) for name, record in self.phases.items()}
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def dump_stats(self, path):
+        if self.profile:
+            self.profile.dump_stats(path)
+
+
+def start(memory=True, cprofile=False):
+    """Запускает глобальный профилировщик, который подхватывают все вызовы phase()."""
+    global _ACTIVE
+    _ACTIVE = PhaseTimer(memory, cprofile)
+    _ACTIVE.start()
+    return _ACTIVE
+
+
+def stop():
+    global _ACTIVE
+    timer, _ACTIVE = _ACTIVE, None
+    if timer:
+        timer.stop()
+    return timer
+
+
+def is_active():
+    return _ACTIVE is not None
+
+
+def merge(summary):
+    if _ACTIVE:
+        _ACTIVE.merge(summary)
+
+
+def add_arguments(parser):
+    parser.add_argument("--profile", nargs="?", const="profile_summary.json", help="Record per-phase wall/CPU time and peak memory into a JSON file")
+    parser.add_argument("--profile_stats", type=str, help="Also dump cProfile statistics (pstats) into this file")
+
+
+def run_profiled(fn, args):
+    """Запуск fn() с профилированием, если в args заданы --profile/--profile_stats."""
+    if not (args.profile or args.profile_stats):
+        return fn()
+    start(cprofile=bool(args.profile_stats))
+    try:
+        with phase("total"):
+            return fn()
+    finally:
+        timer = stop()
+        print()
+        print_summary(timer.summary())
+        timer.write_json(args.profile or "profile_summary.json")
+        if args.profile_stats:
+            timer.dump_stats(args.profile_stats)
+
+
+def phase(name):
+    return _ACTIVE.phase(name) if _ACTIVE else nullcontext()
+
+
+def profiled_call(name, fn, *args):
+    """Выполняет fn в воркере под своим профилировщиком и возвращает (результат, сводка фаз)."""
+    global _ACTIVE
+    previous = _ACTIVE
+    timer = PhaseTimer()
+    _ACTIVE = timer
+    timer.start()
+    try:
+        with timer.phase(name):
+            result = fn(*args)
+    finally:
+        timer.stop()
+        _ACTIVE = previous
+    return result, timer.summary()
+
+
+def print_summary(summary):
+    print(f"{'Phase':<20} {'Calls':>6} {'Wall s':>9} {'Self s':>9} {'CPU s':>9} {'Peak MB':>9}")
+    for name, record in sorted(summary.items(), key=lambda item: -item[1]["wall"]):
+        print(f"{name:<20} {record['calls']:>6} {record['wall']:>9.3f} {record['self_wall']:>9.3f} "
+              f"{record['cpu']:>9.3f} {record['peak_memory'] / 2 ** 20:>9.2f}")
@@ -0,0 +1,177 @@
+# Асинхронный слой текущих котировок для daily_check.
+# - TTL-кэш: повторный запрос тикера в пределах ttl секунд не идёт в сеть; кэш можно сохранять
+#   на диск (cache_file), тогда и повторный запуск скрипта в течение минуты обходится без запросов;
+# - объединение запросов: одновременные вызовы для одного тикера ждут один и тот же запрос;
+# - промахи кэша отправляются в backend пачками (один bulk-запрос на пачку), число одновременных
+#   запросов ограничено семафором, ошибки повторяются с экспоненциальной задержкой.
+# Backend - объект с async fetch(tickers) -> {ticker: price}; LocalBackend - локальная замена для тестов.
+
+import asyncio
+import json
+import os
+import time
+
+
+class QuoteError(Exception):
+    pass
+
+
+class YFinanceBackend:
+    """Последние цены одним запросом yf.download по минутным барам; пропущенные - через fast_info."""
+
+    def _fetch(self, tickers):
+        import yfinance as yf
+
+        prices = {}
+        data = yf.download(tickers, period="1d", interval="1m", progress=False, threads=True)
+        if data is not None and not data.empty:
+            close = data["Close"]
+            if not hasattr(close, "columns"):
+                close = close.to_frame(tickers[0])
+            for ticker in tickers:
+                if ticker in close.columns:
+                    series = close[ticker].dropna()
+                    if not series.empty:
+                        prices[ticker] = float(series.iloc[-1])
+        # Рынок закрыт или тикер не попал в общий ответ - берём последнюю цену из fast_info
+        for ticker in tickers:
+            if ticker not in prices:
+                price = yf.Ticker(ticker).fast_info.get("lastPrice")
+                if price:
+                    prices[ticker] = float(price)
+        return prices
+
+    async def fetch(self, tickers):
+        return await asyncio.to_thread(self._fetch, list(tickers))
+
+
+class LocalBackend:
+    """Локальный backend: цены из словаря (или функции), искусственная задержка и сбои."""
+
+    def __init__(self, prices, latency=0.0, failures=0):
+        self.prices = prices
+        self.latency = latency
+        self.failures = failures
+        self.calls = 0
+        self.requested = 0
+
+    async def fetch(self, tickers):
+        self.calls += 1
+        self.requested += len(tickers)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("local backend failure")
+        prices = self.prices() if callable(self.prices) else self.prices
+        return {ticker: prices[ticker] for ticker in tickers if ticker in prices}
+
+
+class QuoteService:
+    def __init__(self, backend=None, ttl=60.0, max_concurrency=8, batch_size=100, retries=3, backoff=0.25, cache_file=None):
+        self.backend = backend or YFinanceBackend()
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.cache_file = cache_file
+        self.cache = self._load_cache()
+        self._inflight = {}
+        self._semaphore = None
+        self.max_concurrency = max_concurrency
+
+    def _load_cache(self):
+        if self.cache_file and os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, 'r') as f:
+                    return {ticker: tuple(entry) for ticker, entry in json.load(f).items()}
+            except (OSError, ValueError):
+                return {}
+        return {}
+
+    def save_cache(self):
+        if not self.cache_file:
+            return
+        now = time.time()
+        fresh = {ticker: entry for ticker, entry in self.cache.items() if now - entry[1] < self.ttl}
+        tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(fresh, f)
+        os.replace(tmp_file, self.cache_file)
+
+    def cached(self, ticker, now=None):
+        entry = self.cache.get(ticker)
+        if entry and (now or time.time()) - entry[1] < self.ttl:
+            return entry[0]
+        return None
+
+    async def _fetch_batch(self, tickers, futures):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        error = None
+        async with self._semaphore:
+            for attempt in range(self.retries):
+                try:
+                    prices = await self.backend.fetch(tickers)
+                    break
+                except Exception as e:
+                    error = e
+                    if attempt < self.retries - 1:
+                        await asyncio.sleep(self.backoff * 2 ** attempt)
+            else:
+                prices = {}
+        now = time.time()
+        for ticker in tickers:
+            self._inflight.pop(ticker, None)
+            future = futures[ticker]
+            if ticker in prices:
+                self.cache[ticker] = (prices[ticker], now)
+                future.set_result(prices[ticker])
+            else:
+                future.set_exception(QuoteError(f"No price for {ticker}" + (f": {error}" if error else "")))
+
+    async def get_many(self, tickers):
+        """Цены для списка тикеров; тикеры без цены в результат не попадают."""
+        tickers = list(dict.fromkeys(tickers))
+        now = time.time()
+        prices = {}
+        waiting = {}
+        missing = []
+        for ticker in tickers:
+            price = self.cached(ticker, now)
+            if price is not None:
+                prices[ticker] = price
+            elif ticker in self._inflight:
+                waiting[ticker] = self._inflight[ticker]
+            else:
+                missing.append(ticker)
+
+        loop = asyncio.get_running_loop()
+        tasks = []
+        for begin in range(0, len(missing), self.batch_size):
+            batch = missing[begin:begin + self.batch_size]
+            futures = {ticker: loop.create_future() for ticker in batch}
+            self._inflight.update(futures)
+            waiting.update(futures)
+            tasks.append(asyncio.create_task(self._fetch_batch(batch, futures)))
+
+        results = await asyncio.gather(*waiting.values(), return_exceptions=True)
+        await asyncio.gather(*tasks)
+        for ticker, result in zip(waiting, results):
+            if not isinstance(result, Exception):
+                prices[ticker] = result
+        return {ticker: prices[ticker] for ticker in tickers if ticker in prices}
+
+    async def get(self, ticker):
+        prices = await self.get_many([ticker])
+        if ticker not in prices:
+            raise QuoteError(f"No price for {ticker}")
+        return prices[ticker]
+
+
+def get_prices(tickers, service=None, **options):
+    """Синхронная обёртка: цены для списка тикеров с сохранением дискового кэша."""
+    service = service or QuoteService(cache_file=options.pop("cache_file", "quote_cache.json"), **options)
+    prices = asyncio.run(service.get_many(tickers))
+    service.save_cache()
+    return prices
@@ -0,0 +1,282 @@
+# Ребалансировка к целевым весам по инструментам уровней (обобщение develop/x_rebalance_flot.py).
+# Портфель держит дробные количества бумаг (как в x_rebalance_flot.py) и в дни ребалансировки
+# приводится к целевым весам: holdings = weights * value / price.
+#
+# Расписания:
+#   daily / weekly / monthly / quarterly / yearly - первый торговый день периода;
+#   band     - когда вес любого инструмента отклонился от цели больше чем на band;
+#   drawdown - когда меняется режим просадки индекса (0: выше dropdown_1, 1: между, 2: ниже dropdown_2).
+# Веса - (n_assets,) или (3, n_assets): свой набор весов для каждого режима просадки,
+# например [[1, 0, 0], [0, 1, 0], [0, 0, 1]] - весь портфель в QQQ / QLD / TQQQ по режиму.
+#
+# Без издержек календарное и drawdown-расписания считаются целиком в массивах (см. _simulate_linear):
+# дневная ребалансировка за 20 лет - единицы миллисекунд. С издержками и для band цикл идёт только
+# по событиям ребалансировки, а дрейф весов, взносы и стоимость между ними считаются срезами массивов.
+#
+# python rebalance.py 100 --start_date 2005-01-01 --end_date 2024-12-31 --tickers QQQ QLD TQQQ --index QQQ --weights 0.6 0.3 0.1 --schedule monthly
+
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import costs as cost_models
+import schedules
+from panel import build_daily_frame
+
+CALENDAR = {"daily": "D", "weekly": "W", "monthly": "M", "quarterly": "Q", "yearly": "Y"}
+SCHEDULES = tuple(CALENDAR) + ("band", "drawdown")
+BAND_CHUNK = 256
+
+
+def daily_prices(index, tickers, start_date, end_date):
+    """Дневные цены для ребалансировки: (dates, index_close, prices (n_assets, n_days)).
+
+    Пропуски внутри истории заполняются последней ценой; NaN до начала торгов - инструмент недоступен.
+    """
+    daily = build_daily_frame(index, tickers, start_date, end_date)
+    prices = np.stack([daily[f'Close_{ticker}'].ffill().to_numpy(dtype=np.float64) for ticker in tickers])
+    return daily['Date'].to_numpy(), daily['Close'].to_numpy(dtype=np.float64), prices
+
+
+def calendar_mask(dates, schedule):
+    """Первый торговый день каждого периода календарного расписания."""
+    periods = pd.DatetimeIndex(dates).to_period(CALENDAR[schedule])
+    codes = np.asarray(periods.asi8)
+    mask = np.ones(len(codes), dtype=bool)
+    mask[1:] = codes[1:] != codes[:-1]
+    return mask
+
+
+def drawdown_regimes(index_close, dropdown_1, dropdown_2):
+    """Режим просадки индекса от бегущего максимума для каждого дня: 0, 1 или 2."""
+    close = np.asarray(index_close, dtype=np.float64)
+    peak = np.fmax.accumulate(close)
+    return np.where(close >= peak * (1 - dropdown_1), 0, np.where(close >= peak * (1 - dropdown_2), 1, 2))
+
+
+def _targets(weights, regimes, available):
+    """Целевые веса на день: веса режима, перенормированные на доступные инструменты."""
+    w = weights[regimes] * available
+    total = w.sum()
+    return w / total if total > 0 else w
+
+
+def _targets_many(weights, regimes, available):
+    """_targets сразу для многих дней: regimes (n,), available (n_assets, n) -> (n, n_assets)."""
+    w = weights[regimes] * available.T
+    total = w.sum(axis=1, keepdims=True)
+    return np.divide(w, total, out=np.zeros_like(w), where=total > 0)
+
+
+def _trade(holdings, target_value, price, costs):
+    """Сделки к целевой стоимости по инструментам: (новые holdings, издержки)."""
+    target = np.divide(target_value, price, out=np.zeros_like(target_value), where=price > 0)
+    if costs is None:
+        return target, 0.0
+    traded = np.where(np.abs(target - holdings) > 1e-9, target - holdings, 0.0)
+    cost = float(cost_models.trade_cost(costs, traded, price).sum())
+    return target, cost
+
+
+def _simulate_linear(px, targets, event_days, contributions, initial):
+    """Расписание без издержек целиком в массивах.
+
+    Между ребалансировками k и k+1 стоимость линейна по стоимости V_k в день ребалансировки:
+    V_t = V_k * (u_k . p_t) + C_t . p_t, где u_k = w_k / p_{r_k} - бумаги на доллар, C_t - бумаги, купленные
+    на взносы внутри сегмента. Значит V_{k+1} = a_k * V_k + b_k, и все V_k получаются через cumprod.
+    Возвращает (values, holdings) или None, если рекуррентность вырождена (a_k = 0).
+    """
+    n_assets, n_days = px.shape
+    segment = np.cumsum(np.isin(np.arange(n_days), event_days)) - 1
+    start = event_days[segment]
+    w = targets[segment].T
+    units_per_dollar = np.divide(targets.T, px[:, event_days], out=np.zeros((n_assets, len(event_days))), where=px[:, event_days] > 0)
+    # Бумаги, купленные на взносы после дня ребалансировки (сам день ребалансировки входит в V_k)
+    bought = np.divide(w * contributions, px, out=np.zeros_like(px), where=px > 0)
+    bought[:, event_days] = 0.0
+    cumulative = np.cumsum(bought, axis=1)
+    carried = cumulative - cumulative[:, start]
+    growth = (units_per_dollar[:, segment] * px).sum(axis=0)
+    extra = (carried * px).sum(axis=0)
+
+    # Переход к следующей ребалансировке: по ценам дня r_{k+1}, но с бумагами сегмента k
+    nxt = event_days[1:]
+    a = (units_per_dollar[:, :-1] * px[:, nxt]).sum(axis=0)
+    b = ((cumulative[:, nxt - 1] - cumulative[:, event_days[:-1]]) * px[:, nxt]).sum(axis=0) + contributions[nxt]
+    if np.any(a <= 0):
+        return None
+    scale = np.concatenate(([1.0], np.cumprod(a)))
+    at_events = scale * (initial + contributions[event_days[0]] + np.concatenate(([0.0], np.cumsum(b / scale[1:]))))
+    values = at_events[segment] * growth + extra
+    holdings = at_events[-1] * units_per_dollar[:, -1] + carried[:, -1]
+    return values, holdings
+
+
+def simulate_rebalance(prices, weights, schedule="monthly", dates=None, band=0.05, index_close=None,
+                       dropdown_1=0.10, dropdown_2=0.20, initial=0.0, contributions=None, costs=None, record_curves=True):
+    """Бэктест ребалансировки. prices - (n_assets, n_days), NaN - инструмент ещё не торгуется.
+
+    contributions - взносы по дням (n_days,); между ребалансировками взнос сразу раскладывается по текущим
+    целевым весам. Издержки (costs.cost_model) считаются по объёму сделок до вычета самих издержек.
+    """
+    if schedule not in SCHEDULES:
+        raise ValueError(f"Unknown schedule: {schedule}")
+    prices = np.asarray(prices, dtype=np.float64)
+    n_assets, n_days = prices.shape
+    available = ~np.isnan(prices) & (prices > 0)
+    px = np.where(available, prices, 0.0)
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.ndim == 1:
+        weights = np.broadcast_to(weights, (3, n_assets))
+    contributions = np.zeros(n_days) if contributions is None else np.asarray(contributions, dtype=np.float64)
+    costs = None if cost_models.is_free(costs) else costs
+
+    index_close = px[0] if index_close is None else np.asarray(index_close, dtype=np.float64)
+    regimes = drawdown_regimes(index_close, dropdown_1, dropdown_2)
+    if schedule in CALENDAR:
+        if dates is None:
+            raise ValueError("Calendar schedules need dates")
+        events = calendar_mask(dates, schedule)
+    elif schedule == "drawdown":
+        events = np.ones(n_days, dtype=bool)
+        events[1:] = regimes[1:] != regimes[:-1]
+    else:
+        events = None
+    # Появление нового инструмента - тоже повод перераспределить веса
+    listed = np.zeros(n_days, dtype=bool)
+    listed[1:] = (available[:, 1:] & ~available[:, :-1]).any(axis=0)
+    event_days = np.flatnonzero(events | listed) if events is not None else None
+    listed_days = np.flatnonzero(listed)
+
+    if costs is None and events is not None and n_days:
+        targets = _targets_many(weights, regimes[event_days], available[:, event_days])
+        linear = _simulate_linear(px, targets, event_days, contributions, initial)
+        if linear is not None:
+            values, holdings = linear
+            return _result(values, holdings, initial, contributions, 0.0, event_days, record_curves)
+
+    values = np.empty(n_days)
+    holdings = np.zeros(n_assets)
+    cash = initial
+    costs_paid = 0.0
+    rebalances = []
+
+    day = 0
+    while day < n_days:
+        # Ребалансировка в день day (взнос этого дня входит в ребалансировку)
+        price = px[:, day]
+        target_w = _targets(weights, regimes[day], available[:, day])
+        value = float(holdings @ price) + cash + contributions[day]
+        holdings, cost = _trade(holdings, target_w * value, price, costs)
+        if cost:
+            holdings *= (value - cost) / value
+        costs_paid += cost
+        cash = 0.0
+        rebalances.append(day)
+        values[day] = float(holdings @ price)
+
+        # Следующее событие расписания (для band - ближайшее появление инструмента, дальше ищется нарушение полосы)
+        upcoming = event_days if events is not None else listed_days
+        position = np.searchsorted(upcoming, day, side='right')
+        end = upcoming[position] if position < len(upcoming) else n_days
+
+        # Сегмент (day, end): дрейф весов и взносы по целевым весам без ребалансировки
+        begin = day + 1
+        while begin < end:
+            stop = end if events is not None else min(end, begin + BAND_CHUNK)
+            seg_px = px[:, begin:stop]
+            seg_contrib = contributions[begin:stop]
+            if seg_contrib.any():
+                bought = np.divide(target_w[:, None] * seg_contrib[None, :], seg_px, out=np.zeros_like(seg_px), where=seg_px > 0)
+                if costs is not None:
+                    cost = cost_models.trade_cost(costs, bought, seg_px).sum(axis=0)
+                    bought *= np.divide(seg_contrib - cost, seg_contrib, out=np.zeros_like(seg_contrib), where=seg_contrib > 0)
+                    costs_paid += float(cost.sum())
+                segment_holdings = holdings[:, None] + np.cumsum(bought, axis=1)
+            else:
+                segment_holdings = np.broadcast_to(holdings[:, None], seg_px.shape)
+            seg_values = (segment_holdings * seg_px).sum(axis=0)
+            if events is None:
+                drift = np.divide(segment_holdings * seg_px, seg_values, out=np.zeros_like(seg_px), where=seg_values > 0)
+                breach = np.flatnonzero((np.abs(drift - target_w[:, None]) > band).any(axis=0) & (seg_values > 0))
+                if len(breach):
+                    if costs is not None and seg_contrib.any():
+                        # Взносы после дня нарушения войдут в следующую ребалансировку
+                        costs_paid -= float(cost[breach[0]:].sum())
+                    end = stop = begin + breach[0]
+                    seg_values = seg_values[:breach[0]]
+                    segment_holdings = segment_holdings[:, :breach[0]]
+            values[begin:stop] = seg_values
+            if segment_holdings.shape[1]:
+                holdings = segment_holdings[:, -1].copy()
+            begin = stop
+        day = end
+
+    return _result(values, holdings, initial, contributions, costs_paid, np.asarray(rebalances), record_curves)
+
+
+def _result(values, holdings, initial, contributions, costs_paid, rebalances, record_curves):
+    peak = np.maximum.accumulate(values) if len(values) else values
+    drawdown = np.divide(peak - values, peak, out=np.zeros(len(values)), where=peak > 0)
+    result = {
+        "final_value": float(values[-1]) if len(values) else 0.0,
+        "holdings": holdings,
+        "total_invested": initial + float(contributions.sum()),
+        "costs_paid": costs_paid,
+        "n_rebalances": len(rebalances),
+        "rebalance_days": rebalances,
+        "max_drawdown": float(drawdown.max(initial=0.0)) * 100,
+    }
+    if record_curves:
+        result["portfolio_value"] = values
+        result["invested_amounts"] = initial + np.cumsum(contributions)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebalancing backtest to target weights across tier instruments")
+    parser.add_argument("weekly_investment", type=float, help="Weekly investment in dollars")
+    parser.add_argument("--start_date", type=str, required=True, help="Start date (YYYY-MM-DD)")
+    parser.add_argument("--end_date", type=str, default=datetime.now().strftime("%Y-%m-%d"), help="End date (YYYY-MM-DD)")
+    parser.add_argument("--tickers", type=str, nargs="+", default=["QQQ", "QLD", "TQQQ"], help="Instruments to hold")
+    parser.add_argument("--index", type=str, required=True, help="Base ticker for drawdown (e.g., QQQ)")
+    parser.add_argument("--weights", type=float, nargs="+", required=True,
+                        help="Target weights per ticker, or 3 x n_tickers weights for drawdown regimes (row by row)")
+    parser.add_argument("--schedule", choices=SCHEDULES, default="monthly", help="Rebalancing schedule")
+    parser.add_argument("--band", type=float, default=0.05, help="Allowed weight deviation for the band schedule")
+    parser.add_argument("--dropdown_1", type=float, default=0.10, help="First drawdown level for regimes")
+    parser.add_argument("--dropdown_2", type=float, default=0.20, help="Second drawdown level for regimes")
+    parser.add_argument("--initial", type=float, default=0.0, help="Initial capital")
+    parser.add_argument("--contribution_schedule", type=str, default=schedules.DEFAULT_RULE,
+                        help="Contribution schedule: W-FRI, 2W-MON, M-15, M-START, M-END or D")
+    parser.add_argument("--output", type=str, help="CSV file for the daily portfolio value")
+    cost_models.add_arguments(parser)
+    args = parser.parse_args()
+
+    n_assets = len(args.tickers)
+    if len(args.weights) not in (n_assets, 3 * n_assets):
+        parser.error(f"--weights needs {n_assets} or {3 * n_assets} values")
+    weights = np.array(args.weights).reshape(-1, n_assets)
+    weights = weights[0] if len(weights) == 1 else weights
+
+    dates, index_close, prices = daily_prices(args.index, args.tickers, args.start_date, args.end_date)
+    contributions = schedules.contributions(dates, args.weekly_investment, args.contribution_schedule)
+    result = simulate_rebalance(prices, weights, args.schedule, dates, args.band, index_close, args.dropdown_1, args.dropdown_2,
+                                args.initial, contributions, cost_models.from_args(args))
+
+    invested = result["total_invested"]
+    print(f"Total Invested: ${invested:.2f}")
+    print(f"Final Portfolio Value: ${result['final_value']:.2f}")
+    print(f"ROI: {(result['final_value'] - invested) / invested * 100 if invested > 0 else 0:.2f}%")
+    print(f"Max Drawdown: {result['max_drawdown']:.2f}%")
+    print(f"Rebalances: {result['n_rebalances']}, costs: ${result['costs_paid']:.2f}")
+    for ticker, units, price in zip(args.tickers, result["holdings"], prices[:, -1]):
+        print(f"Shares of {ticker}: {units:.4f}, ${units * price:.2f}")
+    if args.output:
+        pd.DataFrame({"Date": dates, "Portfolio": result["portfolio_value"], "Invested": result["invested_amounts"]}).to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
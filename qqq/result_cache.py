@@ -0,0 +1,164 @@
+# Кэш результатов прогонов стратегий на диске (investing.py).
+# - ключ: имя стратегии + параметры + отпечаток данных (хэш содержимого срезов цен, которые ушли в прогон)
+#   + CACHE_VERSION, который поднимается при изменении логики стратегий;
+# - запись: результат функции (метрики, кривые, доли) и тексты отчётов (report_*.txt), записанных прогоном;
+# - размер ограничен: при превышении max_entries/max_bytes удаляются давно не использованные записи (LRU);
+# - инвалидация: запись помнит размер и mtime CSV кэша цен; если файл изменился или удалён, запись выбрасывается.
+# Индекс (index.json) и файлы записей пишутся атомарно (временный файл + os.replace).
+
+import hashlib
+import json
+import os
+import pickle
+import time
+
+import pandas as pd
+
+CACHE_VERSION = 1
+DEFAULT_DIRECTORY = "result_cache"
+
+
+def fingerprint(frames):
+    """Хэш содержимого DataFrame (значения и названия колонок) - меняется при любой правке цен."""
+    digest = hashlib.sha256()
+    for frame in frames:
+        digest.update(json.dumps(list(map(str, frame.columns))).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def source_signature(paths):
+    """{путь: [размер, mtime_ns]} для существующих файлов кэша цен."""
+    signature = {}
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature[os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+def _atomic_write(path, payload, mode):
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_file, mode) as f:
+        if 'b' in mode:
+            f.write(payload)
+        else:
+            json.dump(payload, f)
+    os.replace(tmp_file, path)
+
+
+class ResultCache:
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_entries=64, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(directory, "index.json")
+        os.makedirs(directory, exist_ok=True)
+        self.index = {}
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r') as f:
+                    self.index = json.load(f)
+            except (OSError, ValueError):
+                self.index = {}
+
+    def key(self, name, params, frames):
+        payload = json.dumps({"version": CACHE_VERSION, "name": name, "params": params}, sort_keys=True, default=str)
+        return hashlib.sha256((payload + fingerprint(frames)).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def _is_stale(self, meta):
+        sources = meta.get("sources", {})
+        return source_signature(sources) != sources or not os.path.exists(self._path(meta["key"]))
+
+    def _remove(self, key):
+        self.index.pop(key, None)
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+    def save_index(self):
+        _atomic_write(self.index_file, self.index, 'w')
+
+    def get(self, key):
+        meta = self.index.get(key)
+        if meta is None:
+            return None
+        if self._is_stale(meta):
+            self._remove(key)
+            self.save_index()
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self._remove(key)
+            self.save_index()
+            return None
+        meta["last_used"] = time.time()
+        self.save_index()
+        return entry
+
+    def put(self, key, entry, sources=()):
+        payload = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        _atomic_write(self._path(key), payload, 'wb')
+        self.index[key] = {"key": key, "size": len(payload), "last_used": time.time(), "sources": source_signature(sources)}
+        self.evict()
+
+    def invalidate(self):
+        """Удаление записей, у которых изменился или исчез исходный файл цен. Возвращает число удалённых."""
+        stale = [key for key, meta in self.index.items() if self._is_stale(meta)]
+        for key in stale:
+            self._remove(key)
+        self.save_index()
+        return len(stale)
+
+    def evict(self):
+        """LRU: удаляются самые давно использованные записи, пока не уложимся в max_entries и max_bytes."""
+        by_age = sorted(self.index, key=lambda key: self.index[key]["last_used"])
+        total = sum(meta["size"] for meta in self.index.values())
+        while by_age and (len(self.index) > self.max_entries or total > self.max_bytes):
+            key = by_age.pop(0)
+            total -= self.index[key]["size"]
+            self._remove(key)
+        self.save_index()
+
+
+def cached_call(cache, name, params, frames, compute, sources=(), reports=()):
+    """Результат compute() из кэша или новый прогон с сохранением результата и отчётов reports.
+
+    При попадании отчёты восстанавливаются из кэша (файл переписывается, только если текст отличается).
+    """
+    if cache is None:
+        return compute()
+    key = cache.key(name, params, frames)
+    entry = cache.get(key)
+    if entry is not None:
+        for filename, text in entry["reports"].items():
+            current = None
+            if os.path.exists(filename):
+                with open(filename, 'r') as f:
+                    current = f.read()
+            if current != text:
+                with open(filename, 'w') as f:
+                    f.write(text)
+        return entry["result"]
+    result = compute()
+    texts = {}
+    for filename in reports:
+        if os.path.exists(filename):
+            with open(filename, 'r') as f:
+                texts[filename] = f.read()
+    cache.put(key, {"result": result, "reports": texts}, sources)
+    return result
+
+
+def add_arguments(parser):
+    parser.add_argument("--result_cache", type=str, default=DEFAULT_DIRECTORY, help="Directory of the memoized result cache")
+    parser.add_argument("--cache_entries", type=int, default=64, help="Maximum number of cached runs (least recently used are evicted)")
+    parser.add_argument("--no_cache", action="store_true", help="Always recompute, do not read or write the result cache")
+
+
+def from_args(args):
+    return None if args.no_cache else ResultCache(args.result_cache, args.cache_entries)
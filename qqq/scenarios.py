@@ -0,0 +1,162 @@
+# Monte Carlo / block-bootstrap сценарии для тестируемой стратегии.
+# Исторические дневные доходности индекса пересобираются стационарным блочным бутстрепом (Politis-Romano),
+# из них строятся синтетические пути индекса и производных 2x/3x инструментов, после чего
+# engine.simulate_tiered прогоняет стратегию сразу по всем путям чанка.
+#
+# python scenarios.py 100 --start_date 2000-01-01 --end_date 2024-12-31 --index QQQ --dropdown_1 0.10 --dropdown_2 0.20 --sell_threshold 0.10 --paths 10000 --years 20
+
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+
+from engine import simulate_tiered, irr
+
+TRADING_DAYS_PER_WEEK = 5
+TRADING_DAYS_PER_YEAR = 252
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def load_daily_returns(index, start_date, end_date):
+    """Дневные доходности индекса из кэша/yfinance (через investing.load_data)."""
+    from investing import load_data
+
+    data = load_data(index, start_date, end_date).drop_duplicates(subset=['Date']).sort_values('Date')
+    close = data['Close'].to_numpy(dtype=np.float64)
+    returns = close[1:] / close[:-1] - 1
+    return returns[np.isfinite(returns)]
+
+
+def stationary_bootstrap_indices(n_obs, n_paths, n_days, mean_block, rng):
+    """Индексы исторических дней (n_paths, n_days), int32, для стационарного блочного бутстрепа.
+
+    Новый блок начинается с вероятностью 1/mean_block, иначе берётся следующий день (по кругу).
+    Случайные числа берутся по строкам (та же последовательность, что и одним вызовом на весь чанк), чтобы
+    не держать временные float64/int64 массивы размера чанка: в памяти только маска начал и сами индексы.
+    """
+    starts = np.empty((n_paths, n_days), dtype=bool)
+    for row in range(n_paths):
+        starts[row] = rng.random(n_days) < 1.0 / mean_block
+    starts[:, 0] = True
+    indices = np.empty((n_paths, n_days), dtype=np.int32)
+    for row in range(n_paths):
+        indices[row] = rng.integers(0, n_obs, size=n_days)
+    positions = np.arange(n_days)
+    for row in range(n_paths):
+        # Позиция начала текущего блока для каждого дня
+        block_start = np.maximum.accumulate(np.where(starts[row], positions, 0))
+        indices[row] = (indices[row][block_start] + positions - block_start) % n_obs
+    return indices
+
+
+def weekly_paths(returns, indices, leverages=(1.0, 2.0, 3.0), annual_fee=(0.0, 0.0095, 0.0086), start_price=100.0, dtype=np.float64):
+    """Цены закрытия каждой пятой сессии ("пятница") синтетических путей в виде (n_tiers, n_weeks, n_paths).
+
+    Плечевые инструменты ребалансируются ежедневно, комиссия фонда списывается равномерно.
+    Дневной рост считается один раз на исторический день и выбирается по indices; дневные цены
+    накапливаются по одному инструменту в массиве dtype и сразу прореживаются до недельных.
+    dtype=np.float32 - пути накапливаются во float32 (другой синтетический путь с относительной
+    погрешностью до n_days * 2**-24, а не округление пути float64), памяти на чанк вдвое меньше.
+    """
+    n_paths, n_days = indices.shape
+    weekly = np.empty((len(leverages), len(range(TRADING_DAYS_PER_WEEK - 1, n_days + 1, TRADING_DAYS_PER_WEEK)), n_paths), dtype=dtype)
+    for k, (leverage, fee) in enumerate(zip(leverages, annual_fee)):
+        growth = np.maximum(1 + leverage * returns - fee / TRADING_DAYS_PER_YEAR, 1e-6).astype(dtype)[indices]
+        np.cumprod(growth, axis=1, out=growth)
+        # Цена сессии d (сессия 0 - стартовая) - start_price * growth[:, d - 1], пятая сессия - d = 4
+        weekly[k] = growth[:, TRADING_DAYS_PER_WEEK - 2::TRADING_DAYS_PER_WEEK].T
+        weekly[k] *= start_price
+        del growth
+    return weekly
+
+
+def summarize(values, percentiles=PERCENTILES):
+    """Перцентили по заполненной части массива метрик."""
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return {p: float('nan') for p in percentiles}
+    return dict(zip(percentiles, np.percentile(values, percentiles)))
+
+
+def run_scenarios(returns, weekly_investment, dropdown_1, dropdown_2, sell_threshold=None, n_paths=10000, years=20,
+                  mean_block=20, chunk_size=1000, seed=0, leverages=(1.0, 2.0, 3.0), on_chunk=None, precision="float64"):
+    """Прогон стратегии на n_paths синтетических путях чанками по chunk_size путей.
+
+    В памяти одновременно живёт только один чанк путей; итоговые метрики по каждому пути -
+    это несколько векторов длины n_paths. on_chunk(done, metrics) вызывается после каждого чанка.
+    Стартовая цена путей - weekly_investment / 10, чтобы покупка целых акций не блокировала взносы.
+    precision="compact" - пути, недельные цены и кривые чанка во float32, cash в центах (см. precision.py).
+    """
+    rng = np.random.default_rng(seed)
+    n_days = years * TRADING_DAYS_PER_YEAR
+    metrics = {
+        "final_value": np.full(n_paths, np.nan),
+        "total_invested": np.full(n_paths, np.nan),
+        "max_drawdown": np.full(n_paths, np.nan),
+        "irr": np.full(n_paths, np.nan),
+    }
+
+    for begin in range(0, n_paths, chunk_size):
+        end = min(begin + chunk_size, n_paths)
+        indices = stationary_bootstrap_indices(len(returns), end - begin, n_days, mean_block, rng)
+        closes = weekly_paths(returns, indices, leverages, start_price=weekly_investment / 10,
+                              dtype=np.float32 if precision == "compact" else np.float64)
+        del indices
+
+        # ticker_1 торгуется по цене индекса, как в investing.py
+        result = simulate_tiered(closes[0], closes, weekly_investment, dropdown_1, dropdown_2, sell_threshold, precision=precision)
+        metrics["final_value"][begin:end] = result["final_value"]
+        metrics["total_invested"][begin:end] = result["total_invested"]
+        metrics["max_drawdown"][begin:end] = result["max_drawdown"]
+        metrics["irr"][begin:end] = irr(result["contributions"], result["final_value"])
+
+        if on_chunk:
+            on_chunk(end, {name: values[:end] for name, values in metrics.items()})
+
+    return metrics
+
+
+def print_summary(metrics):
+    print(f"{'Percentile':>10} {'Final Value':>14} {'Invested':>12} {'Max DD %':>9} {'IRR %':>8}")
+    summaries = {name: summarize(values) for name, values in metrics.items()}
+    for p in PERCENTILES:
+        print(f"{p:>10} {summaries['final_value'][p]:>14.2f} {summaries['total_invested'][p]:>12.2f} "
+              f"{summaries['max_drawdown'][p]:>9.2f} {summaries['irr'][p] * 100:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo scenarios for the test strategy")
+    parser.add_argument("weekly_investment", type=float, help="Weekly investment in dollars")
+    parser.add_argument("--start_date", type=str, required=True, help="Start of the history used for bootstrap (YYYY-MM-DD)")
+    parser.add_argument("--end_date", type=str, default=datetime.now().strftime("%Y-%m-%d"), help="End of the history (YYYY-MM-DD)")
+    parser.add_argument("--index", type=str, required=True, help="Base ticker for drawdown (e.g., QQQ)")
+    parser.add_argument("--dropdown_1", type=float, required=True, help="First drawdown level (e.g., 0.10)")
+    parser.add_argument("--dropdown_2", type=float, required=True, help="Second drawdown level (e.g., 0.20)")
+    parser.add_argument("--sell_threshold", type=float, help="Threshold for selling all assets (e.g., 0.10 for 10%)")
+    parser.add_argument("--paths", type=int, default=10000, help="Number of synthetic paths")
+    parser.add_argument("--years", type=int, default=20, help="Length of each path in years")
+    parser.add_argument("--block", type=float, default=20, help="Mean block length in trading days")
+    parser.add_argument("--chunk", type=int, default=1000, help="Paths simulated per chunk")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--precision", choices=["float64", "compact"], default="float64",
+                        help="compact: paths accumulated in float32, float32 prices and curves with cash in integer cents "
+                             "(about half the peak memory per chunk; precision.py measures it)")
+    args = parser.parse_args()
+
+    returns = load_daily_returns(args.index, args.start_date, args.end_date)
+    started = time.perf_counter()
+
+    def progress(done, partial):
+        median = summarize(partial["final_value"], (50,))[50]
+        print(f"\rPaths: {done}/{args.paths}, median final value: ${median:.2f}", end="", flush=True)
+
+    metrics = run_scenarios(returns, args.weekly_investment, args.dropdown_1, args.dropdown_2, args.sell_threshold,
+                            n_paths=args.paths, years=args.years, mean_block=args.block, chunk_size=args.chunk,
+                            seed=args.seed, on_chunk=progress, precision=args.precision)
+    print(f"\nDone in {time.perf_counter() - started:.1f}s\n")
+    print_summary(metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# Расписания взносов: правило -> массив позиций торговых дней (целочисленный индекс в массиве дат сессий).
+# Позиции считаются один раз через searchsorted и кэшируются по (правило, сдвиг, диапазон, календарь),
+# поэтому стратегии идут по готовому индексу без поиска по DataFrame и сравнения названий дней.
+#
+# Правила:
+#   D         - каждый торговый день;
+#   W-FRI     - каждую неделю в указанный день (MON..SUN), по умолчанию W-FRI, как раньше;
+#   2W-FRI    - раз в две недели (начиная с первого такого дня в диапазоне);
+#   M-15      - ежемесячно N-го числа (для коротких месяцев - последнее число);
+#   M-START   - первый торговый день месяца; M-END - последний торговый день месяца.
+# Сдвиг для неторговых дней: backward - последний торговый день не позже даты (как get_last_trading_day),
+# forward - первый торговый день не раньше даты. По умолчанию backward, для M-START - forward.
+
+import re
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_RULE = "W-FRI"
+CACHE_SIZE = 128
+
+_CACHE = OrderedDict()
+
+
+def parse_rule(rule):
+    """Разбор правила в (вид, параметр): ("D", None), ("W", (шаг, день)), ("M", N | "START" | "END")."""
+    rule = rule.upper()
+    if rule == "D":
+        return "D", None
+    match = re.fullmatch(r"(\d*)W-(MON|TUE|WED|THU|FRI|SAT|SUN)", rule)
+    if match:
+        return "W", (int(match.group(1) or 1), match.group(2))
+    match = re.fullmatch(r"M-(START|END|\d{1,2})", rule)
+    if match:
+        value = match.group(1)
+        if value.isdigit() and not 1 <= int(value) <= 31:
+            raise ValueError(f"Day of month out of range in schedule rule: {rule}")
+        return "M", int(value) if value.isdigit() else value
+    raise ValueError(f"Unknown schedule rule: {rule}")
+
+
+def periods_per_year(rule):
+    kind, value = parse_rule(rule)
+    if kind == "D":
+        return 252
+    if kind == "W":
+        return 52 / value[0]
+    return 12
+
+
+def nominal_dates(rule, start, end):
+    """Календарные даты правила в [start, end] до сдвига на торговые дни."""
+    kind, value = parse_rule(rule)
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if kind == "W":
+        step, day = value
+        return pd.date_range(start, end, freq=f"W-{day}")[::step]
+    months = pd.date_range(start.to_period("M").to_timestamp(), end, freq="MS")
+    if value == "START":
+        dates = months
+    elif value == "END":
+        dates = months + pd.offsets.MonthEnd(0)
+    else:
+        dates = months + pd.to_timedelta(np.minimum(value, months.days_in_month) - 1, unit="D")
+    return dates[(dates >= start) & (dates <= end)]
+
+
+def _roll(sessions, nominal, roll):
+    if roll == "backward":
+        positions = np.searchsorted(sessions, nominal, side='right') - 1
+        positions = positions[positions >= 0]
+    elif roll == "forward":
+        positions = np.searchsorted(sessions, nominal, side='left')
+        positions = positions[positions < len(sessions)]
+    else:
+        raise ValueError(f"Unknown roll: {roll}")
+    # При повторяющихся датах берётся первая строка дня, как data[data["Date"] == day].iloc[0]
+    return np.searchsorted(sessions, sessions[positions], side='left')
+
+
+def positions(sessions, rule=DEFAULT_RULE, start=None, end=None, roll=None):
+    """Позиции торговых дней расписания в отсортированном массиве дат sessions (только для чтения).
+
+    start/end - диапазон дат правила (по умолчанию первая и последняя сессия). Если end позже последней
+    сессии, недели после неё сдвигаются на последнюю сессию - так же вёл себя цикл по W-FRI в investing.py.
+    """
+    sessions = np.asarray(pd.DatetimeIndex(sessions).values)
+    if not len(sessions):
+        return np.zeros(0, dtype=np.int64)
+    kind, value = parse_rule(rule)
+    roll = roll or ("forward" if value == "START" else "backward")
+    start = pd.Timestamp(sessions[0] if start is None else start)
+    end = pd.Timestamp(sessions[-1] if end is None else end)
+    key = (rule.upper(), roll, start, end, len(sessions), hash(sessions.tobytes()))
+    cached = _CACHE.get(key)
+    if cached is not None:
+        _CACHE.move_to_end(key)
+        return cached
+
+    if kind == "D":
+        result = np.flatnonzero((sessions >= start.to_datetime64()) & (sessions <= end.to_datetime64()))
+        result = _roll(sessions, sessions[result], "backward")
+    else:
+        result = _roll(sessions, nominal_dates(rule, start, end).values, roll)
+    result = result.astype(np.int64)
+    result.flags.writeable = False
+    _CACHE[key] = result
+    if len(_CACHE) > CACHE_SIZE:
+        _CACHE.popitem(last=False)
+    return result
+
+
+def contributions(sessions, amount, rule=DEFAULT_RULE, start=None, end=None, roll=None):
+    """Взносы по дням (n_sessions,): amount в каждый торговый день расписания."""
+    vector = np.zeros(len(sessions))
+    vector[positions(sessions, rule, start, end, roll)] = amount
+    return vector
+
+
+def add_arguments(parser):
+    parser.add_argument("--schedule", type=str, default=DEFAULT_RULE,
+                        help="Contribution schedule: W-FRI, 2W-MON, M-15, M-START, M-END or D")
+    parser.add_argument("--roll", choices=["backward", "forward"], help="Move non-trading schedule dates to the previous or next session")
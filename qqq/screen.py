@@ -0,0 +1,239 @@
+# Скрининг вселенной пар "индекс / плечевые фонды" тестируемой стратегией за один запуск.
+# Пара - строка вселенной: INDEX TICKER_2 [TICKER_3] (ticker_1 = индекс) или INDEX TICKER_1 TICKER_2 TICKER_3.
+# Порядок работы:
+#   1. цены всех уникальных тикеров загружаются в кэш параллельно (prefetch.prefetch, пул потоков);
+#   2. панель каждой пары строится один раз (panel.build_panel) в основном процессе;
+#   3. все панели передаются в пул процессов один раз (initializer), задачи - пара x часть сетки параметров
+#      (sweep.run_sweep: сетка пары - дорожки одного пакетного прогона движка, одинаковые траектории считаются один раз);
+#   4. лучшая комбинация каждой пары попадает в таблицу лидеров, пары ранжируются по --rank_by
+#      (по умолчанию - как is_better_combination: ROI, затем CAGR, затем меньшая просадка).
+# Пары, для которых нет цен или не строится панель, пропускаются с причиной.
+#
+# python screen.py 100 --start_date 2012-01-01 --end_date 2024-12-31 --workers 8 --metrics --rank_by sharpe
+# python screen.py 100 --start_date 2015-01-01 --end_date 2024-12-31 --universe universe_pairs.txt --step 0.05 --sell_thresholds 0.10 0.20
+
+import argparse
+import csv
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+import adjustments
+import costs as cost_models
+import fx as fx_rates
+import metrics as metric_models
+import profiling
+import schedules
+from panel import build_panel
+from prefetch import DEFAULT_RETRIES, LocalProvider, prefetch, yfinance_provider
+from sweep import dropdown_grid, init_worker, pool_map, run_sweep, worker_panel
+
+# Индекс, фонд 2x, фонд 3x (если 3x нет - второй фонд повторяется)
+DEFAULT_UNIVERSE = [
+    ("QQQ", "QLD", "TQQQ"),
+    ("SPY", "SSO", "UPRO"),
+    ("IWM", "UWM", "TNA"),
+    ("DIA", "DDM", "UDOW"),
+    ("MDY", "MVV", "UMDD"),
+    ("XLK", "ROM", "TECL"),
+    ("XLF", "UYG", "FAS"),
+    ("XLV", "RXL", "CURE"),
+    ("SOXX", "USD", "SOXL"),
+    ("EEM", "EET", "EDC"),
+    ("TLT", "UBT", "TMF"),
+    ("GLD", "UGL", "UGL"),
+]
+LOWER_IS_BETTER = ("max_drawdown", "volatility", "ulcer_index", "twr_max_drawdown", "time_in_drawdown")
+RANKINGS = ("default", "roi", "cagr", "max_drawdown") + metric_models.METRICS
+
+
+def pair_name(pair):
+    return "/".join(dict.fromkeys(pair))
+
+
+def parse_pair(tokens):
+    """(index, ticker_1, ticker_2, ticker_3) из 2-4 тикеров строки вселенной."""
+    tokens = [token.upper() for token in tokens]
+    if len(tokens) == 4:
+        return tuple(tokens)
+    if len(tokens) in (2, 3):
+        index, ticker_2 = tokens[:2]
+        return index, index, ticker_2, tokens[2] if len(tokens) == 3 else ticker_2
+    raise ValueError(f"Expected INDEX TICKER_2 [TICKER_3] or INDEX TICKER_1 TICKER_2 TICKER_3, got: {' '.join(tokens)}")
+
+
+def read_pairs(path):
+    """Пары из файла: по одной в строке, тикеры через пробел или запятую; # - комментарий."""
+    pairs = []
+    with open(path, 'r') as f:
+        for line in f:
+            tokens = line.split('#', 1)[0].replace(',', ' ').split()
+            if tokens:
+                pairs.append(parse_pair(tokens))
+    return list(dict.fromkeys(pairs))
+
+
+def rank_key(row, rank_by="default"):
+    """Ключ сортировки (больше - лучше); NaN - в конец."""
+    if rank_by == "default":
+        return (row["roi"], row["cagr"], -row["max_drawdown"])
+    value = row[rank_by]
+    if value is None or math.isnan(value):
+        return (-math.inf,)
+    return (-value if rank_by in LOWER_IS_BETTER else value,)
+
+
+def chunk_combinations(combinations, n_chunks):
+    """Непрерывные части сетки: соседние комбинации чаще попадают в одну группу одинаковых траекторий."""
+    size = math.ceil(len(combinations) / max(n_chunks, 1))
+    return [combinations[i:i + size] for i in range(0, len(combinations), size)]
+
+
+def _evaluate(name, combinations, weekly_investment, metrics):
+    scores, _ = run_sweep(worker_panel()[name], weekly_investment, combinations, metrics=metrics)
+    return [{key: float(values[i]) for key, values in scores.items()} for i in range(len(combinations))]
+
+
+def load_universe(pairs, start_date, end_date, costs=None, schedule=schedules.DEFAULT_RULE, roll=None, basis="close",
+                  currency=fx_rates.BASE_CURRENCY, provider=yfinance_provider, workers=8, retries=DEFAULT_RETRIES):
+    """Цены всех тикеров (параллельно) и панели пар. Возвращает ({имя пары: панель}, {имя пары: причина пропуска})."""
+    skipped = {}
+    if basis == "close":
+        # Другие базы цены загружаются adjustments.load_series при построении панели
+        tickers = [ticker for pair in pairs for ticker in pair]
+        with profiling.phase("download"):
+            results, _ = prefetch(tickers, start_date, end_date, provider, workers, retries)
+        failed = {result["ticker"]: result["error"] for result in results if result["status"] == "failed"}
+        for pair in pairs:
+            missing = [ticker for ticker in dict.fromkeys(pair) if ticker in failed]
+            if missing:
+                skipped[pair_name(pair)] = f"no prices for {', '.join(missing)}: {failed[missing[0]]}"
+    panels = {}
+    for pair in pairs:
+        name = pair_name(pair)
+        if name in skipped:
+            continue
+        index, ticker_1, ticker_2, ticker_3 = pair
+        try:
+            panel = build_panel(index, ticker_1, ticker_2, ticker_3, start_date, end_date, costs, schedule, roll, basis, currency)
+        except (ValueError, KeyError, OSError) as error:
+            skipped[name] = f"{type(error).__name__}: {error}"
+            continue
+        if len(panel["index_close"]) == 0:
+            skipped[name] = "no trading weeks in the period"
+            continue
+        panels[name] = panel
+    return panels, skipped
+
+
+def screen(panels, weekly_investment, combinations, workers=1, metrics=False, rank_by="default"):
+    """Все пары x комбинации в пуле процессов. Возвращает (таблица лидеров, все строки, число задач).
+
+    Каждая пара делится на части сетки так, чтобы задач было не меньше, чем процессов.
+    """
+    names = list(panels)
+    n_chunks = max(1, math.ceil(workers / max(len(names), 1)))
+    tasks = [(name, chunk) for name in names for chunk in chunk_combinations(combinations, n_chunks)]
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(panels,)) if workers > 1 else None
+    if executor is None:
+        init_worker(panels)
+    try:
+        # Пул распределяет задачи по мере освобождения процессов; панели переданы один раз через initializer
+        results = pool_map(executor, _evaluate, [name for name, _ in tasks], [chunk for _, chunk in tasks],
+                           [weekly_investment] * len(tasks), [metrics] * len(tasks))
+    finally:
+        if executor:
+            executor.shutdown()
+
+    rows = []
+    for (name, chunk), scores in zip(tasks, results):
+        panel = panels[name]
+        index, ticker_1, ticker_2, ticker_3 = (panel["index"],) + tuple(panel["tickers"])
+        for (dropdown_1, dropdown_2, sell_threshold), row in zip(chunk, scores):
+            rows.append({"pair": name, "index": index, "ticker_1": ticker_1, "ticker_2": ticker_2, "ticker_3": ticker_3,
+                         "start": pd.Timestamp(panel["dates"][0]).strftime('%Y-%m-%d'), "weeks": len(panel["dates"]),
+                         "dropdown_1": dropdown_1, "dropdown_2": dropdown_2, "sell_threshold": sell_threshold, **row})
+    best = {}
+    for row in rows:
+        if row["pair"] not in best or rank_key(row, rank_by) > rank_key(best[row["pair"]], rank_by):
+            best[row["pair"]] = row
+    leaderboard = sorted(best.values(), key=lambda row: rank_key(row, rank_by), reverse=True)
+    return [{"rank": i + 1, **row} for i, row in enumerate(leaderboard)], rows, len(tasks)
+
+
+def write_rows(path, rows):
+    if not rows:
+        return
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_leaderboard(leaderboard, top=20, rank_by="default"):
+    for row in leaderboard[:top]:
+        extra = f", {rank_by}: {row[rank_by]:.2f}" if rank_by not in ("default", "roi", "cagr", "max_drawdown") else ""
+        print(f"{row['rank']:>3}. {row['pair']:<18} ROI: {row['roi']:.2f}%, CAGR: {row['cagr']:.2f}%, Max Drawdown: {row['max_drawdown']:.2f}%{extra} "
+              f"with dropdown_1={row['dropdown_1']}, dropdown_2={row['dropdown_2']}, sell_threshold={row['sell_threshold']} "
+              f"(from {row['start']}, {row['weeks']} weeks)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen the test strategy across a universe of index/leveraged ETF pairs")
+    parser.add_argument("weekly_investment", type=float, help="Weekly investment in dollars")
+    parser.add_argument("--start_date", type=str, required=True, help="Start date (YYYY-MM-DD)")
+    parser.add_argument("--end_date", type=str, default=datetime.now().strftime("%Y-%m-%d"), help="End date (YYYY-MM-DD)")
+    parser.add_argument("--universe", type=str, help="File with one pair per line: INDEX TICKER_2 [TICKER_3] or INDEX TICKER_1 TICKER_2 TICKER_3 (default: built-in list)")
+    parser.add_argument("--low", type=float, default=0.05, help="Lowest dropdown value")
+    parser.add_argument("--high", type=float, default=0.50, help="Highest dropdown value")
+    parser.add_argument("--step", type=float, default=0.05, help="Dropdown grid step")
+    parser.add_argument("--sell_thresholds", type=float, nargs="*", default=[], help="Sell thresholds to screen in addition to no selling")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (also parallel downloads)")
+    parser.add_argument("--metrics", action="store_true", help="Compute Sharpe, Sortino, Calmar, ulcer index and other risk metrics")
+    parser.add_argument("--rank_by", type=str, default="default", choices=RANKINGS, help="Leaderboard order (default: ROI, then CAGR, then lower drawdown)")
+    parser.add_argument("--top", type=int, default=20, help="Pairs to print")
+    parser.add_argument("--output", type=str, default="screen_leaderboard.csv", help="CSV file for the leaderboard (best combination per pair)")
+    parser.add_argument("--all_results", type=str, help="CSV file for every pair and combination")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="Download retries per ticker (see prefetch.py)")
+    parser.add_argument("--local", type=str, help="Read prices from CSV files in this directory instead of yfinance (see prefetch.py)")
+    cost_models.add_arguments(parser)
+    schedules.add_arguments(parser)
+    adjustments.add_arguments(parser)
+    fx_rates.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    pairs = read_pairs(args.universe) if args.universe else [parse_pair(pair) for pair in DEFAULT_UNIVERSE]
+    metrics = args.metrics or args.rank_by in metric_models.METRICS
+    combinations = dropdown_grid(args.low, args.high, args.step, [None] + args.sell_thresholds)
+    provider = LocalProvider(args.local) if args.local else yfinance_provider
+
+    def run():
+        started = time.perf_counter()
+        panels, skipped = load_universe(pairs, args.start_date, args.end_date, cost_models.from_args(args), args.schedule, args.roll,
+                                        args.price_basis, args.currency, provider, max(args.workers, 1), args.retries)
+        loaded = time.perf_counter()
+        leaderboard, rows, n_tasks = screen(panels, args.weekly_investment, combinations, args.workers, metrics, args.rank_by)
+        return panels, skipped, leaderboard, rows, n_tasks, loaded - started, time.perf_counter() - loaded
+
+    panels, skipped, leaderboard, rows, n_tasks, load_time, screen_time = profiling.run_profiled(run, args)
+    write_rows(args.output, leaderboard)
+    if args.all_results:
+        write_rows(args.all_results, rows)
+
+    n_weeks = sum(len(panel["dates"]) for panel in panels.values())
+    print(f"Pairs: {len(pairs)}, screened: {len(panels)}, skipped: {len(skipped)}, combinations per pair: {len(combinations)}, tasks: {n_tasks}")
+    print(f"Load and alignment: {load_time:.2f}s, simulation: {screen_time:.2f}s "
+          f"({len(rows) / screen_time if screen_time > 0 else 0.0:.0f} backtests/s, {n_weeks * len(combinations) / screen_time if screen_time > 0 else 0.0:.0f} lane-weeks/s)")
+    if not fx_rates.is_base(args.currency):
+        print(f"Contributions and values in {args.currency.upper()}")
+    for name, reason in skipped.items():
+        print(f"Skipped {name}: {reason}")
+    print_leaderboard(leaderboard, args.top, args.rank_by)
+
+
+if __name__ == "__main__":
+    main()
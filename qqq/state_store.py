@@ -0,0 +1,112 @@
+# Хранилище состояния стратегий daily_check на SQLite вместо перезаписываемого strategy_state.json.
+# - состояние (max_price, last_action) хранится по strategy_id, чтение одной стратегии - запрос по ключу;
+# - обновление многих стратегий - одна транзакция (BEGIN IMMEDIATE), конкурентные cron-запуски
+#   ждут блокировку (busy_timeout), а не портят файл;
+# - max_price обновляется как max(старое, новое), поэтому параллельные записи не теряют максимум;
+# - каждая запись дополнительно попадает в историю сигналов (signal_history).
+
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS strategy_state (
+    strategy_id TEXT PRIMARY KEY,
+    max_price REAL NOT NULL DEFAULT 0,
+    last_action TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS signal_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    strategy_id TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    price REAL,
+    max_price REAL NOT NULL,
+    action TEXT,
+    recommendations TEXT
+);
+CREATE INDEX IF NOT EXISTS signal_history_strategy_ts ON signal_history (strategy_id, ts);
+"""
+
+DEFAULT_STATE = {"max_price": 0.0, "last_action": None}
+
+
+def open_store(path="strategy_state.db", timeout=30.0):
+    """Подключение к хранилищу (WAL: читатели не блокируют писателя)."""
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def get_state(conn, strategy_id):
+    row = conn.execute("SELECT max_price, last_action FROM strategy_state WHERE strategy_id = ?", (strategy_id,)).fetchone()
+    return {"max_price": row[0], "last_action": row[1]} if row else dict(DEFAULT_STATE)
+
+
+def get_states(conn, strategy_ids):
+    """Состояния нескольких стратегий одним запросом; отсутствующие получают состояние по умолчанию."""
+    strategy_ids = list(strategy_ids)
+    states = {strategy_id: dict(DEFAULT_STATE) for strategy_id in strategy_ids}
+    for begin in range(0, len(strategy_ids), 500):
+        chunk = strategy_ids[begin:begin + 500]
+        query = f"SELECT strategy_id, max_price, last_action FROM strategy_state WHERE strategy_id IN ({','.join('?' * len(chunk))})"
+        for strategy_id, max_price, last_action in conn.execute(query, chunk):
+            states[strategy_id] = {"max_price": max_price, "last_action": last_action}
+    return states
+
+
+def update_states(conn, updates, ts=None):
+    """Атомарное обновление многих стратегий.
+
+    updates: список словарей с ключами strategy_id, max_price, last_action и необязательными
+    price и recommendations (для истории сигналов).
+    """
+    ts = ts or datetime.now().isoformat(timespec='seconds')
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            """INSERT INTO strategy_state (strategy_id, max_price, last_action, updated_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT(strategy_id) DO UPDATE SET
+                   max_price = MAX(strategy_state.max_price, excluded.max_price),
+                   last_action = excluded.last_action,
+                   updated_at = excluded.updated_at""",
+            [(u["strategy_id"], u["max_price"], u["last_action"], ts) for u in updates])
+        conn.executemany(
+            "INSERT INTO signal_history (strategy_id, ts, price, max_price, action, recommendations) VALUES (?, ?, ?, ?, ?, ?)",
+            [(u["strategy_id"], ts, u.get("price"), u["max_price"], u["last_action"],
+              json.dumps(u.get("recommendations", []), ensure_ascii=False)) for u in updates])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def history(conn, strategy_id, since=None, limit=None):
+    """История сигналов стратегии (от старых к новым)."""
+    query = "SELECT ts, price, max_price, action, recommendations FROM signal_history WHERE strategy_id = ?"
+    params = [strategy_id]
+    if since:
+        query += " AND ts >= ?"
+        params.append(since)
+    query += " ORDER BY ts, id"
+    if limit:
+        query = f"SELECT * FROM ({query.replace('ORDER BY ts, id', 'ORDER BY ts DESC, id DESC')} LIMIT ?) ORDER BY ts"
+        params.append(limit)
+    return [{"ts": ts, "price": price, "max_price": max_price, "action": action, "recommendations": json.loads(recs or "[]")}
+            for ts, price, max_price, action, recs in conn.execute(query, params)]
+
+
+def import_json_state(conn, path, strategy_id="default"):
+    """Перенос старого strategy_state.json (одна стратегия) или batch_state.json ({id: state}) в хранилище."""
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r') as f:
+        data = json.load(f)
+    states = {strategy_id: data} if "max_price" in data else data
+    update_states(conn, [{"strategy_id": key, "max_price": state.get("max_price", 0.0), "last_action": state.get("last_action")}
+                         for key, state in states.items()])
+    os.replace(path, path + ".imported")
+    return len(states)
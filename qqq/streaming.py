@@ -0,0 +1,123 @@
+# Потоковый вывод кривых капитала из engine.simulate_tiered (stream=...).
+# Вместо полных массивов (n_steps, n_lanes) движок пишет строку каждого шага в кольцевой буфер фиксированного
+# размера; заполненный буфер отдаётся потребителям куском (k, n_lanes) и переиспользуется. Поэтому память
+# не зависит от длины горизонта: минутные бары за годы или тысячи кривых сетки идут через capacity строк.
+# Потребители:
+#   - metrics.StreamingMetrics - агрегаты (Sharpe, просадки, ...) на лету, всегда включены в CurveStream;
+#   - ColumnarWriter - колоночный файл: каталог с <колонка>.bin (сырые строки подряд) и meta.json,
+#     читается обратно через read_curves (np.memmap, без загрузки в память);
+#   - любой callable(chunk) - например, отправка кусков дальше по сети.
+# Куски - представления буфера, они действительны только во время вызова потребителя.
+
+import json
+import os
+
+import numpy as np
+
+from engine import TIER_VALUE_KEYS
+from metrics import StreamingMetrics
+
+COLUMNS = {"portfolio_value": np.float64, "invested_amounts": np.float64, "contributions": np.float64, "tiers": np.int8,
+           **{key: np.float64 for key in TIER_VALUE_KEYS}}
+DEFAULT_CAPACITY = 4096
+
+
+class RingBuffer:
+    def __init__(self, n_lanes, capacity=DEFAULT_CAPACITY, consumers=(), columns=COLUMNS):
+        self.capacity = capacity
+        self.columns = {name: np.empty((capacity, n_lanes), dtype=dtype) for name, dtype in columns.items()}
+        self.consumers = list(consumers)
+        self.size = 0
+        self.n_flushed = 0
+
+    def push(self, **row):
+        for name, value in row.items():
+            self.columns[name][self.size] = value
+        self.size += 1
+        if self.size == self.capacity:
+            self.flush()
+
+    def flush(self):
+        if not self.size:
+            return
+        chunk = {name: values[:self.size] for name, values in self.columns.items()}
+        for consumer in self.consumers:
+            consumer(chunk)
+        self.n_flushed += self.size
+        self.size = 0
+
+
+class ColumnarWriter:
+    """Дописывает куски в <directory>/<колонка>.bin; meta.json (число строк, дорожек, типы) пишется при close."""
+
+    def __init__(self, directory, meta=None):
+        self.directory = directory
+        self.meta = dict(meta or {})
+        self.files = {}
+        self.dtypes = {}
+        self.n_rows = 0
+        self.n_lanes = None
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, chunk):
+        for name, values in chunk.items():
+            if name not in self.files:
+                self.files[name] = open(os.path.join(self.directory, f"{name}.bin"), 'wb')
+                self.dtypes[name] = values.dtype.str
+            self.files[name].write(np.ascontiguousarray(values).tobytes())
+        first = next(iter(chunk.values()))
+        self.n_lanes = first.shape[1]
+        self.n_rows += len(first)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        meta = {**self.meta, "n_rows": self.n_rows, "n_lanes": self.n_lanes, "columns": self.dtypes}
+        meta_file = os.path.join(self.directory, "meta.json")
+        tmp_file = f"{meta_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(meta, f, default=str)
+        os.replace(tmp_file, meta_file)
+
+
+def read_curves(directory):
+    """Кривые из ColumnarWriter: ({колонка: np.memmap (n_rows, n_lanes)}, meta)."""
+    with open(os.path.join(directory, "meta.json"), 'r') as f:
+        meta = json.load(f)
+    curves = {}
+    for name, dtype in meta["columns"].items():
+        shape = (meta["n_rows"], meta["n_lanes"])
+        if meta["n_rows"]:
+            curves[name] = np.memmap(os.path.join(directory, f"{name}.bin"), dtype=np.dtype(dtype), mode='r', shape=shape)
+        else:
+            curves[name] = np.zeros(shape, dtype=np.dtype(dtype))
+    return curves, meta
+
+
+class CurveStream:
+    """Кольцевой буфер кривых движка с метриками на лету и дополнительными потребителями (sinks).
+
+    close() сбрасывает остаток буфера, закрывает потребителей с методом close и возвращает метрики.
+    """
+
+    def __init__(self, n_lanes, periods_per_year=52, capacity=DEFAULT_CAPACITY, sinks=(), risk_free=0.0):
+        self.metrics = StreamingMetrics(n_lanes, periods_per_year, risk_free)
+        self.sinks = list(sinks)
+        self.buffer = RingBuffer(n_lanes, capacity, [self._aggregate] + self.sinks)
+
+    def _aggregate(self, chunk):
+        self.metrics.update(chunk["portfolio_value"], chunk["contributions"], [chunk[key] for key in TIER_VALUE_KEYS])
+
+    def push(self, **row):
+        self.buffer.push(**row)
+
+    @property
+    def n_steps(self):
+        return self.buffer.n_flushed + self.buffer.size
+
+    def close(self):
+        self.buffer.flush()
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                sink.close()
+        return self.metrics.result()
@@ -0,0 +1,257 @@
+# Перебор параметров тестируемой стратегии одним пакетным прогоном engine.simulate_tiered.
+# Каждая комбинация (dropdown_1, dropdown_2, sell_threshold) - отдельная дорожка движка,
+# поэтому сетка 46x46 считается за один проход по неделям вместо тысячи запусков x.py.
+# Комбинации с одинаковой траекторией (см. equivalence_groups) симулируются один раз.
+#
+# python sweep.py 100 --start_date 2024-01-01 --end_date 2024-12-31 --ticker_1 QQQ --ticker_2 QLD --ticker_3 TQQQ --index QQQ --step 0.01 --sell_thresholds 0.10 0.20
+
+import argparse
+import csv
+from datetime import datetime
+from itertools import product
+
+import numpy as np
+
+import adjustments
+import costs as cost_models
+import fx as fx_rates
+import metrics as metric_models
+import profiling
+import schedules
+from engine import simulate_tiered, initial_state
+from streaming import ColumnarWriter, CurveStream
+
+WEEKS_PER_YEAR = 52
+
+_WORKER_PANEL = None
+
+
+def init_worker(panel):
+    """Initializer пула процессов: панель передаётся каждому процессу один раз, а не с каждой задачей."""
+    global _WORKER_PANEL
+    _WORKER_PANEL = panel
+
+
+def worker_panel():
+    return _WORKER_PANEL
+
+
+def pool_map(executor, fn, *iterables):
+    """map() по пулу процессов (или в текущем процессе, если executor=None).
+
+    При включённом профилировании каждая задача выполняется под своим профилировщиком,
+    а сводки фаз из воркеров добавляются в профилировщик основного процесса.
+    """
+    if not profiling.is_active():
+        return list(executor.map(fn, *iterables)) if executor else list(map(fn, *iterables))
+    iterables = [list(it) for it in iterables]
+    n = len(iterables[0]) if iterables else 0
+    args = [[fn.__name__.lstrip('_')] * n, [fn] * n] + iterables
+    calls = executor.map(profiling.profiled_call, *args) if executor else map(profiling.profiled_call, *args)
+    results = []
+    for result, summary in calls:
+        profiling.merge(summary)
+        results.append(result)
+    return results
+
+
+def is_better_combination(new_roi, new_cagr, new_drawdown, best_roi, best_cagr, best_drawdown):
+    """Порядок сравнения из develop/x_matrix_test.py: ROI, затем CAGR, затем меньшая просадка."""
+    if new_roi > best_roi:
+        return True
+    if new_roi == best_roi:
+        if new_cagr > best_cagr:
+            return True
+        if new_cagr == best_cagr:
+            return new_drawdown < best_drawdown
+    return False
+
+
+def dropdown_grid(low=0.05, high=0.50, step=0.05, sell_thresholds=(None,)):
+    """Комбинации (dropdown_1, dropdown_2, sell_threshold) с dropdown_1 <= dropdown_2, как в x_matrix_test.py."""
+    values = [round(low + i * step, 4) for i in range(int(round((high - low) / step)) + 1)]
+    return [(d1, d2, st) for d1, d2, st in product(values, values, sell_thresholds) if d1 <= d2]
+
+
+def combination_arrays(combinations):
+    """Массивы параметров по дорожкам; sell_threshold=None превращается в 0 (продажа выключена)."""
+    d1 = np.array([c[0] for c in combinations], dtype=np.float64)
+    d2 = np.array([c[1] for c in combinations], dtype=np.float64)
+    st = np.array([c[2] or 0.0 for c in combinations], dtype=np.float64)
+    return d1, d2, st
+
+
+def score(result, n_weeks, periods_per_year=WEEKS_PER_YEAR):
+    """ROI, CAGR и максимальная просадка в процентах для каждой дорожки (n_weeks - число шагов панели)."""
+    final_value = result["final_value"]
+    invested = result["total_invested"]
+    roi = np.divide(final_value - invested, invested, out=np.zeros_like(final_value), where=invested > 0)
+    years = max(n_weeks / periods_per_year, 1e-9)
+    growth = np.divide(final_value, invested, out=np.ones_like(final_value), where=invested > 0)
+    cagr = np.where(growth > 0, growth ** (1 / years), 0.0) - 1
+    return {"roi": roi * 100, "cagr": cagr * 100, "max_drawdown": result["max_drawdown"].copy()}
+
+
+def threshold_signature(panel, dropdown, prior_peak=0.0):
+    """Число недель, где индекс не ниже max_price * (1 - dropdown), для каждого значения порога.
+
+    max_price в engine - бегущий максимум индекса, не зависящий от параметров, а множество недель,
+    удовлетворяющих условию, вложено по dropdown. Поэтому количество таких недель однозначно задаёт
+    само множество, то есть последовательность решений по этому порогу.
+    """
+    close = panel["index_close"]
+    peak = np.maximum(np.maximum.accumulate(close), prior_peak)
+    values, inverse = np.unique(dropdown, return_inverse=True)
+    counts = (close[:, None] >= peak[:, None] * (1 - values[None, :])).sum(axis=0)
+    return counts[inverse.ravel()]
+
+
+def equivalence_groups(panel, dropdown_1, dropdown_2, sell_threshold, prior_peak=0.0):
+    """Группы комбинаций с одинаковой траекторией: (индексы представителей, индекс группы для каждой комбинации).
+
+    Решения по уровням зависят только от двух множеств недель (для dropdown_1 и dropdown_2), а продажи
+    и пополнения от порогов просадки не зависят. Поэтому при равных сигнатурах порогов и одинаковом
+    sell_threshold движок проходит ровно тот же путь.
+    """
+    n_steps = len(panel["index_close"]) + 1
+    _, sell_codes = np.unique(sell_threshold, return_inverse=True)
+    keys = ((threshold_signature(panel, dropdown_1, prior_peak) * n_steps
+             + threshold_signature(panel, dropdown_2, prior_peak)) * (sell_codes.max(initial=0) + 1) + sell_codes.ravel())
+    _, representatives, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return representatives, inverse.ravel()
+
+
+def _fan_out(result, inverse):
+    fanned = {}
+    for name, value in result.items():
+        if isinstance(value, dict):
+            fanned[name] = _fan_out(value, inverse)
+        elif isinstance(value, np.ndarray):
+            fanned[name] = value[..., inverse]
+        else:
+            fanned[name] = value
+    fanned["n_lanes"] = len(inverse)
+    return fanned
+
+
+def run_sweep(panel, weekly_investment, combinations, state=None, seed_peak=False, dedupe=True, metrics=False, curves=None):
+    """Прогон всех комбинаций по панели. Возвращает (scores, result движка).
+
+    seed_peak=True засевает max_price историческим максимумом индекса до начала панели (panel["peak"]),
+    чтобы окно в середине истории видело ту же просадку, что и полный прогон.
+    dedupe=True симулирует по одной комбинации из каждой группы одинаковых траекторий и раздаёт
+    результат остальным; при продолжении из state группировка не применяется.
+    Издержки берутся из panel["costs"] (см. costs.py); группировка от них не зависит - решения те же.
+    Курс валюты взносов - panel["fx"] (см. fx.py): ROI, CAGR, просадка и метрики считаются в этой валюте.
+    metrics=True добавляет в scores метрики риска (metrics.METRICS) для каждой комбинации; кривые при этом
+    не хранятся, а идут потоком (streaming.CurveStream). curves - каталог, куда кривые пишутся колоночным
+    файлом (streaming.read_curves); столбцы - симулированные траектории, в meta.json "lanes" - столбец каждой комбинации.
+    Число симулированных траекторий - result["n_trajectories"].
+    """
+    d1, d2, st = combination_arrays(combinations)
+    prior_peak = panel["prior_peak"] if seed_peak else 0.0
+    periods_per_year = panel.get("periods_per_year", WEEKS_PER_YEAR)
+    fresh = state is None
+    if fresh and seed_peak:
+        state = initial_state(len(combinations), prior_peak)
+
+    if dedupe and fresh:
+        with profiling.phase("grouping"):
+            representatives, inverse = equivalence_groups(panel, d1, d2, st, prior_peak)
+        lane_state = None
+        if state is not None:
+            lane_state = {name: value[..., representatives] for name, value in state.items()}
+        stream = _stream(len(representatives), periods_per_year, metrics, curves, inverse)
+        with profiling.phase("simulate"):
+            result = simulate_tiered(panel["index_close"], panel["closes"], weekly_investment, d1[representatives],
+                                     d2[representatives], st[representatives], record_curves=False, state=lane_state,
+                                     costs=panel.get("costs"), volumes=panel.get("volumes"), stream=stream, fx=panel.get("fx"))
+        extra = {name: value[inverse] for name, value in stream.close().items()} if stream is not None else {}
+        result = _fan_out(result, inverse)
+        result["n_trajectories"] = len(representatives)
+    else:
+        stream = _stream(len(combinations), periods_per_year, metrics, curves, np.arange(len(combinations)))
+        with profiling.phase("simulate"):
+            result = simulate_tiered(panel["index_close"], panel["closes"], weekly_investment, d1, d2, st, record_curves=False,
+                                     state=state, costs=panel.get("costs"), volumes=panel.get("volumes"), stream=stream, fx=panel.get("fx"))
+        extra = stream.close() if stream is not None else {}
+        result["n_trajectories"] = len(combinations)
+    return {**score(result, len(panel["index_close"]), periods_per_year), **extra}, result
+
+
+def _stream(n_lanes, periods_per_year, metrics, curves, lanes):
+    if not metrics and curves is None:
+        return None
+    sinks = [ColumnarWriter(curves, {"lanes": lanes.tolist()})] if curves is not None else []
+    return CurveStream(n_lanes, periods_per_year, sinks=sinks)
+
+
+def best_index(scores):
+    """Индекс лучшей дорожки по порядку is_better_combination."""
+    best = 0
+    for i in range(1, len(scores["roi"])):
+        if is_better_combination(scores["roi"][i], scores["cagr"][i], scores["max_drawdown"][i],
+                                 scores["roi"][best], scores["cagr"][best], scores["max_drawdown"][best]):
+            best = i
+    return best
+
+
+def write_results(path, combinations, scores):
+    """CSV со всеми комбинациями в формате strategy_results.csv из x_matrix_test.py (плюс sell_threshold и метрики, если посчитаны)."""
+    extra = [name for name in metric_models.METRICS if name in scores]
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=['dropdown_1', 'dropdown_2', 'sell_threshold', 'ROI', 'CAGR', 'Max_Drawdown'] + extra)
+        writer.writeheader()
+        for i, (dropdown_1, dropdown_2, sell_threshold) in enumerate(combinations):
+            writer.writerow({'dropdown_1': dropdown_1, 'dropdown_2': dropdown_2, 'sell_threshold': sell_threshold,
+                             'ROI': scores["roi"][i], 'CAGR': scores["cagr"][i], 'Max_Drawdown': scores["max_drawdown"][i],
+                             **{name: scores[name][i] for name in extra}})
+
+
+def main():
+    from panel import build_panel
+
+    parser = argparse.ArgumentParser(description="Batched grid sweep over dropdown/sell thresholds")
+    parser.add_argument("weekly_investment", type=float, help="Weekly investment in dollars")
+    parser.add_argument("--start_date", type=str, required=True, help="Start date (YYYY-MM-DD)")
+    parser.add_argument("--end_date", type=str, default=datetime.now().strftime("%Y-%m-%d"), help="End date (YYYY-MM-DD)")
+    parser.add_argument("--ticker_1", type=str, required=True, help="Main ticker (e.g., QQQ)")
+    parser.add_argument("--ticker_2", type=str, required=True, help="Ticker for 10% dropdown (e.g., QLD)")
+    parser.add_argument("--ticker_3", type=str, help="Ticker for 20% dropdown (e.g., TQQQ)")
+    parser.add_argument("--index", type=str, required=True, help="Base ticker for drawdown (e.g., QQQ)")
+    parser.add_argument("--low", type=float, default=0.05, help="Lowest dropdown value")
+    parser.add_argument("--high", type=float, default=0.50, help="Highest dropdown value")
+    parser.add_argument("--step", type=float, default=0.05, help="Dropdown grid step")
+    parser.add_argument("--sell_thresholds", type=float, nargs="*", default=[], help="Sell thresholds to sweep in addition to no selling")
+    parser.add_argument("--output", type=str, default="strategy_results.csv", help="CSV file for all combinations")
+    parser.add_argument("--metrics", action="store_true", help="Add Sharpe, Sortino, Calmar, ulcer index and other risk metrics to the CSV")
+    parser.add_argument("--curves", type=str, help="Directory to stream equity curves of all trajectories into (columnar .bin files)")
+    cost_models.add_arguments(parser)
+    schedules.add_arguments(parser)
+    adjustments.add_arguments(parser)
+    fx_rates.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.ticker_3 is None:
+        args.ticker_3 = args.ticker_2
+
+    panel = build_panel(args.index, args.ticker_1, args.ticker_2, args.ticker_3, args.start_date, args.end_date, cost_models.from_args(args),
+                        args.schedule, args.roll, args.price_basis, args.currency)
+    combinations = dropdown_grid(args.low, args.high, args.step, [None] + args.sell_thresholds)
+    scores, result = run_sweep(panel, args.weekly_investment, combinations, metrics=args.metrics, curves=args.curves)
+
+    write_results(args.output, combinations, scores)
+
+    best = best_index(scores)
+    dropdown_1, dropdown_2, sell_threshold = combinations[best]
+    print(f"Combinations: {len(combinations)}, simulated trajectories: {result['n_trajectories']}")
+    if not fx_rates.is_base(args.currency):
+        print(f"Contributions and values in {panel['currency']}")
+    print(f"Best ROI: {scores['roi'][best]:.2f}%, Best CAGR: {scores['cagr'][best]:.2f}%, Min Max Drawdown: {scores['max_drawdown'][best]:.2f}% "
+          f"with dropdown_1={dropdown_1}, dropdown_2={dropdown_2}, sell_threshold={sell_threshold}")
+    if args.metrics:
+        metric_models.print_metrics(scores, best)
+
+
+if __name__ == "__main__":
+    main()
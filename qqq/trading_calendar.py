@@ -0,0 +1,147 @@
+# Торговый календарь NYSE без сети: праздники по правилам биржи плюс разовые закрытия.
+# Календарь - отсортированный массив сессий и плотная таблица по календарным дням
+# (для каждого дня - индекс последней сессии не позже него), поэтому дата -> индекс сессии
+# и поиск предыдущей/следующей сессии - O(1) без фильтрации DataFrame по дате.
+# Выравнивание цен идёт по сессиям, а не resample('B'): в праздники цены не придумываются.
+
+from datetime import date, timedelta
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+FIRST_YEAR = 1970
+LAST_YEAR = 2050
+
+# Разовые закрытия биржи (траур, ураганы, 11 сентября, отключение электричества в 1977)
+# и дни президентских выборов, когда биржа закрывалась (до 1980 включительно)
+SPECIAL_CLOSURES = (
+    "1972-11-07", "1972-12-28", "1973-01-25", "1976-11-02", "1977-07-14", "1980-11-04",
+    "1985-09-27", "1994-04-27", "2001-09-11", "2001-09-12", "2001-09-13", "2001-09-14",
+    "2004-06-11", "2007-01-02", "2012-10-29", "2012-10-30", "2018-12-05", "2025-01-09",
+)
+
+
+def _easter(year):
+    """Дата католической Пасхи (алгоритм Meeus/Jones/Butcher)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = (h + l - 7 * m + 114) % 31 + 1
+    return date(year, month, day)
+
+
+def _nth_weekday(year, month, weekday, n):
+    """n-й день недели weekday (0 - понедельник) в месяце; n = -1 - последний."""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(day):
+    """Праздник в субботу переносится на пятницу, в воскресенье - на понедельник."""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def nyse_holidays(year):
+    """Праздники NYSE за год по действующим правилам."""
+    holidays = []
+    new_year = date(year, 1, 1)
+    # Новый год в субботу не переносится на пятницу 31 декабря
+    if new_year.weekday() != 5:
+        holidays.append(_observed(new_year))
+    if year >= 1998:
+        holidays.append(_nth_weekday(year, 1, 0, 3))  # День Мартина Лютера Кинга
+    holidays.append(_nth_weekday(year, 2, 0, 3) if year >= 1971 else _observed(date(year, 2, 22)))  # День президентов
+    holidays.append(_easter(year) - timedelta(days=2))  # Страстная пятница
+    holidays.append(_nth_weekday(year, 5, 0, -1) if year >= 1971 else _observed(date(year, 5, 30)))  # День памяти
+    if year >= 2022:
+        holidays.append(_observed(date(year, 6, 19)))  # Juneteenth
+    holidays.append(_observed(date(year, 7, 4)))
+    holidays.append(_nth_weekday(year, 9, 0, 1))  # День труда
+    holidays.append(_nth_weekday(year, 11, 3, 4))  # День благодарения
+    holidays.append(_observed(date(year, 12, 25)))
+    return holidays
+
+
+class TradingCalendar:
+    def __init__(self, first_year=FIRST_YEAR, last_year=LAST_YEAR):
+        days = np.arange(np.datetime64(f"{first_year}-01-01"), np.datetime64(f"{last_year + 1}-01-01"), dtype="datetime64[D]")
+        holidays = [day for year in range(first_year, last_year + 1) for day in nyse_holidays(year)]
+        holidays = np.array(holidays + list(SPECIAL_CLOSURES), dtype="datetime64[D]")
+        # 1970-01-01 - четверг, поэтому (день + 3) % 7 - номер дня недели с понедельника
+        weekday = (days.astype(np.int64) + 3) % 7
+        self.first_day = days[0]
+        self.last_day = days[-1]
+        self.is_session = (weekday < 5) & ~np.isin(days, holidays)
+        self.sessions = days[self.is_session]
+        # Плотная таблица: индекс последней сессии не позже дня (-1 до первой сессии)
+        self._previous = np.cumsum(self.is_session) - 1
+
+    def _offsets(self, dates):
+        days = np.asarray(pd.DatetimeIndex(np.atleast_1d(dates)).values.astype("datetime64[D]"))
+        offsets = (days - self.first_day).astype(np.int64)
+        if len(offsets) and (offsets.min() < 0 or offsets.max() >= len(self.is_session)):
+            raise ValueError(f"Dates outside of the calendar range {self.first_day}..{self.last_day}")
+        return offsets
+
+    def is_trading_day(self, dates):
+        return self.is_session[self._offsets(dates)]
+
+    def session_index(self, dates):
+        """Индекс сессии для каждой даты (-1, если в этот день биржа закрыта)."""
+        offsets = self._offsets(dates)
+        return np.where(self.is_session[offsets], self._previous[offsets], -1)
+
+    def previous_index(self, dates, inclusive=True):
+        """Индекс последней сессии не позже даты (раньше даты при inclusive=False)."""
+        offsets = self._offsets(dates)
+        if inclusive:
+            return self._previous[offsets]
+        return self._previous[offsets] - self.is_session[offsets]
+
+    def next_index(self, dates, inclusive=True):
+        """Индекс первой сессии не раньше даты (позже даты при inclusive=False)."""
+        offsets = self._offsets(dates)
+        if inclusive:
+            return self._previous[offsets] + ~self.is_session[offsets]
+        return self._previous[offsets] + 1
+
+    def previous_session(self, day, inclusive=True):
+        return pd.Timestamp(self.sessions[self.previous_index(day, inclusive)[0]])
+
+    def next_session(self, day, inclusive=True):
+        return pd.Timestamp(self.sessions[self.next_index(day, inclusive)[0]])
+
+    def sessions_in_range(self, start, end):
+        """Сессии в [start, end] как DatetimeIndex."""
+        begin = self.next_index(start)[0]
+        stop = self.previous_index(end)[0] + 1
+        return pd.DatetimeIndex(self.sessions[begin:max(begin, stop)])
+
+
+@lru_cache(maxsize=None)
+def get_calendar():
+    return TradingCalendar()
+
+
+def align_to_sessions(data):
+    """Дневной DataFrame с колонкой Date на сессиях биржи между первой и последней датой данных.
+
+    Строки в неторговые дни отбрасываются, пропущенные сессии заполняются последней ценой.
+    """
+    data = data.drop_duplicates(subset=['Date']).set_index('Date')
+    sessions = get_calendar().sessions_in_range(data.index.min(), data.index.max())
+    return data.reindex(sessions.union(data.index)).ffill().reindex(sessions).rename_axis('Date').reset_index()
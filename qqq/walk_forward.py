@@ -0,0 +1,153 @@
+# Walk-forward оптимизация порогов dropdown_1/dropdown_2/sell_threshold.
+# Панель цен загружается один раз; на каждом in-sample окне перебирается сетка параметров
+# (один пакетный прогон engine), лучшая комбинация проверяется на следующем out-of-sample окне.
+#
+# Повторное использование между перекрывающимися окнами:
+#   - исторический максимум индекса (panel["peak"]) считается один раз для всей панели, окно в середине
+#     истории засевает им max_price вместо того, чтобы пересчитывать префикс;
+#   - в режиме --anchored все in-sample окна начинаются с начала панели, поэтому состояние симуляции
+#     всех комбинаций продолжается с конца предыдущего окна, а не считается с нуля.
+# Окна (rolling) и out-of-sample проверки выполняются параллельно в пуле процессов, панель передаётся
+# каждому процессу один раз через initializer.
+#
+# python walk_forward.py 100 --start_date 2012-01-01 --end_date 2024-12-31 --ticker_1 QQQ --ticker_2 QLD --ticker_3 TQQQ --index QQQ --in_sample_weeks 156 --out_of_sample_weeks 52 --workers 4
+
+import argparse
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import costs as cost_models
+import profiling
+from panel import build_panel, slice_panel
+from sweep import dropdown_grid, run_sweep, score, best_index, init_worker, worker_panel, pool_map
+
+
+def make_windows(n_steps, in_sample, out_of_sample, step=None, anchored=False):
+    """Список окон (is_begin, is_end, oos_end) в неделях панели."""
+    step = step or out_of_sample
+    windows = []
+    is_end = in_sample
+    while is_end + out_of_sample <= n_steps:
+        windows.append((0 if anchored else is_end - in_sample, is_end, is_end + out_of_sample))
+        is_end += step
+    return windows
+
+
+def _scores_row(scores, i, prefix):
+    return {f"{prefix}_{name}": float(values[i]) for name, values in scores.items()}
+
+
+def _evaluate_out_of_sample(window, weekly_investment, combination):
+    _, is_end, oos_end = window
+    scores, _ = run_sweep(slice_panel(worker_panel(), is_end, oos_end), weekly_investment, [combination], seed_peak=True)
+    return _scores_row(scores, 0, "oos")
+
+
+def _evaluate_window(window, weekly_investment, combinations):
+    is_begin, is_end, _ = window
+    scores, _ = run_sweep(slice_panel(worker_panel(), is_begin, is_end), weekly_investment, combinations, seed_peak=True)
+    best = best_index(scores)
+    return best, {**_scores_row(scores, best, "is"), **_evaluate_out_of_sample(window, weekly_investment, combinations[best])}
+
+
+def anchored_in_sample(panel, windows, weekly_investment, combinations):
+    """Лучшие комбинации для расширяющихся окон; симуляция продолжается с состояния предыдущего окна."""
+    state = None
+    position = 0
+    chosen = []
+    for _, is_end, _ in windows:
+        _, result = run_sweep(slice_panel(panel, position, is_end), weekly_investment, combinations, state=state)
+        state = result["state"]
+        position = is_end
+        scores = score(result, is_end, panel["periods_per_year"])
+        best = best_index(scores)
+        chosen.append((best, _scores_row(scores, best, "is")))
+    return chosen
+
+
+def run_walk_forward(panel, weekly_investment, combinations, in_sample, out_of_sample, step=None, anchored=False, workers=1):
+    """Прогон всех окон. Возвращает список строк с параметрами и метриками in-sample/out-of-sample."""
+    windows = make_windows(len(panel["index_close"]), in_sample, out_of_sample, step, anchored)
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(panel,)) if workers > 1 else None
+    if executor is None:
+        init_worker(panel)
+    n = len(windows)
+    try:
+        if anchored:
+            chosen = anchored_in_sample(panel, windows, weekly_investment, combinations)
+            oos = pool_map(executor, _evaluate_out_of_sample, windows, [weekly_investment] * n, [combinations[best] for best, _ in chosen])
+            evaluated = [(best, {**is_row, **oos_row}) for (best, is_row), oos_row in zip(chosen, oos)]
+        else:
+            evaluated = pool_map(executor, _evaluate_window, windows, [weekly_investment] * n, [combinations] * n)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    rows = []
+    for (is_begin, is_end, oos_end), (best, metrics) in zip(windows, evaluated):
+        dropdown_1, dropdown_2, sell_threshold = combinations[best]
+        rows.append({
+            "is_start": pd.Timestamp(panel["dates"][is_begin]).strftime('%Y-%m-%d'),
+            "oos_start": pd.Timestamp(panel["dates"][is_end]).strftime('%Y-%m-%d'),
+            "oos_end": pd.Timestamp(panel["dates"][oos_end - 1]).strftime('%Y-%m-%d'),
+            "dropdown_1": dropdown_1,
+            "dropdown_2": dropdown_2,
+            "sell_threshold": sell_threshold,
+            **metrics,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward optimization of the test strategy thresholds")
+    parser.add_argument("weekly_investment", type=float, help="Weekly investment in dollars")
+    parser.add_argument("--start_date", type=str, required=True, help="Start date (YYYY-MM-DD)")
+    parser.add_argument("--end_date", type=str, default=datetime.now().strftime("%Y-%m-%d"), help="End date (YYYY-MM-DD)")
+    parser.add_argument("--ticker_1", type=str, required=True, help="Main ticker (e.g., QQQ)")
+    parser.add_argument("--ticker_2", type=str, required=True, help="Ticker for 10% dropdown (e.g., QLD)")
+    parser.add_argument("--ticker_3", type=str, help="Ticker for 20% dropdown (e.g., TQQQ)")
+    parser.add_argument("--index", type=str, required=True, help="Base ticker for drawdown (e.g., QQQ)")
+    parser.add_argument("--sell_thresholds", type=float, nargs="*", default=[], help="Sell thresholds to search in addition to no selling")
+    parser.add_argument("--in_sample_weeks", type=int, default=156, help="In-sample window length in weeks")
+    parser.add_argument("--out_of_sample_weeks", type=int, default=52, help="Out-of-sample window length in weeks")
+    parser.add_argument("--step_weeks", type=int, help="Window step in weeks (default: out-of-sample length)")
+    parser.add_argument("--anchored", action="store_true", help="Expanding in-sample windows that reuse simulation state")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes")
+    parser.add_argument("--output", type=str, default="walk_forward_results.csv", help="CSV file for window results")
+    cost_models.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.ticker_3 is None:
+        args.ticker_3 = args.ticker_2
+
+    def run():
+        panel = build_panel(args.index, args.ticker_1, args.ticker_2, args.ticker_3, args.start_date, args.end_date, cost_models.from_args(args))
+        combinations = dropdown_grid(sell_thresholds=[None] + args.sell_thresholds)
+        return run_walk_forward(panel, args.weekly_investment, combinations, args.in_sample_weeks, args.out_of_sample_weeks,
+                                args.step_weeks, args.anchored, args.workers)
+
+    rows = profiling.run_profiled(run, args)
+    if not rows:
+        print("Not enough data for a single in-sample/out-of-sample window.")
+        return
+
+    with open(args.output, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    for row in rows:
+        print(f"{row['oos_start']} - {row['oos_end']}: dropdown_1={row['dropdown_1']}, dropdown_2={row['dropdown_2']}, "
+              f"sell_threshold={row['sell_threshold']}, IS ROI: {row['is_roi']:.2f}%, OOS ROI: {row['oos_roi']:.2f}%, "
+              f"OOS Max Drawdown: {row['oos_max_drawdown']:.2f}%")
+    print(f"\nMean OOS ROI: {np.mean([row['oos_roi'] for row in rows]):.2f}%, "
+          f"Mean OOS CAGR: {np.mean([row['oos_cagr'] for row in rows]):.2f}%")
+
+
+if __name__ == "__main__":
+    main()